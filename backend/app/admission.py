@@ -0,0 +1,142 @@
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.metrics import ADMISSION_QUEUE_SECONDS, ADMISSION_REJECTED, ADMISSION_IN_FLIGHT, QUEUE_DEPTH
+
+
+# Ограничиваемые маршруты: (метод, путь) -> (имя лимита, группа настроек)
+LIMITED_ROUTES: Dict[Tuple[str, str], Tuple[str, str]] = {
+    ("POST", "/api/rag/search"): ("search", "search"),
+    ("POST", "/api/rag/contacts/search"): ("contacts_search", "search"),
+    ("POST", "/api/messages/download"): ("download", "download"),
+    ("GET", "/api/rag/messages/export"): ("messages_export", "export"),
+    ("GET", "/api/rag/contacts/export"): ("contacts_export", "export"),
+}
+
+# Вес нового замера в скользящем среднем времени обработки
+SERVICE_TIME_ALPHA = 0.2
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionLimit:
+    """Не больше concurrency запросов одновременно и queue ждущих (0 - очередь без предела).
+
+    Ждущие обслуживаются по очереди; освободившийся слот передаётся
+    первому из них, чтобы новые запросы не обгоняли очередь.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue: int, timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Скользящее среднее времени обработки - для Retry-After
+        self._service_time = 1.0
+        self._queue_depth = QUEUE_DEPTH.labels(f"admission_{name}")
+
+    def retry_after(self) -> int:
+        """Через сколько секунд очередь примерно рассосётся"""
+        rounds = (len(self._waiters) + 1) / self.concurrency
+        return max(1, math.ceil(rounds * self._service_time))
+
+    async def acquire(self):
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            return
+        if self.queue and len(self._waiters) >= self.queue:
+            raise Rejected("queue_full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._queue_depth.inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слот успели передать - возвращаем его следующему
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise Rejected("timeout", self.retry_after())
+        finally:
+            self._queue_depth.dec()
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Слот переходит ждущему, _active не меняется
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def observe(self, seconds: float):
+        self._service_time += SERVICE_TIME_ALPHA * (seconds - self._service_time)
+
+
+class AdmissionMiddleware:
+    """Ограничение параллельности тяжёлых маршрутов с отказом 429 при перегрузке.
+
+    ASGI-middleware, а не BaseHTTPMiddleware: слот загрузки держится,
+    пока отдаётся весь потоковый ответ. Лимиты - на процесс.
+    """
+
+    def __init__(self, app: ASGIApp, settings):
+        self.app = app
+        self.limits: Dict[Tuple[str, str], AdmissionLimit] = {}
+        for route, (name, group) in LIMITED_ROUTES.items():
+            concurrency = getattr(settings, f"admission_{group}_concurrency")
+            if concurrency > 0:
+                self.limits[route] = AdmissionLimit(
+                    name,
+                    concurrency,
+                    getattr(settings, f"admission_{group}_queue"),
+                    settings.admission_queue_timeout
+                )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limit: Optional[AdmissionLimit] = None
+        if scope["type"] == "http":
+            limit = self.limits.get((scope["method"], scope["path"].rstrip("/")))
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        queued_at = time.perf_counter()
+        try:
+            await limit.acquire()
+        except Rejected as e:
+            ADMISSION_REJECTED.labels(limit.name, e.reason).inc()
+            response = JSONResponse(
+                {"detail": f"Too many concurrent requests to {limit.name}, retry later"},
+                status_code=429,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        ADMISSION_QUEUE_SECONDS.labels(limit.name).observe(started - queued_at)
+        in_flight = ADMISSION_IN_FLIGHT.labels(limit.name)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight.dec()
+            limit.observe(time.perf_counter() - started)
+            limit.release()
@@ -0,0 +1,340 @@
+import math
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.models import AuthorRank, ContactInfo
+from app.records import MessageRecord
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS authors (
+    author_id INTEGER PRIMARY KEY,
+    username TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    messages INTEGER NOT NULL DEFAULT 0,
+    chats INTEGER NOT NULL DEFAULT 0,
+    replies_sent INTEGER NOT NULL DEFAULT 0,
+    replies_received INTEGER NOT NULL DEFAULT 0,
+    views INTEGER NOT NULL DEFAULT 0,
+    forwards INTEGER NOT NULL DEFAULT 0,
+    first_seen TEXT,
+    last_seen TEXT,
+    has_bio INTEGER NOT NULL DEFAULT 0,
+    has_channel INTEGER NOT NULL DEFAULT 0,
+    score REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_authors_score ON authors (score);
+CREATE INDEX IF NOT EXISTS idx_authors_messages ON authors (messages);
+CREATE INDEX IF NOT EXISTS idx_authors_chats ON authors (chats);
+CREATE INDEX IF NOT EXISTS idx_authors_last_seen ON authors (last_seen);
+CREATE INDEX IF NOT EXISTS idx_authors_replies ON authors (replies_received);
+CREATE INDEX IF NOT EXISTS idx_authors_views ON authors (views);
+CREATE TABLE IF NOT EXISTS author_chats (
+    author_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    PRIMARY KEY (author_id, chat_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+AUTHOR_COLUMNS = (
+    "author_id", "username", "first_name", "last_name", "messages", "chats",
+    "replies_sent", "replies_received", "views", "forwards", "first_seen",
+    "last_seen", "has_bio", "has_channel", "score"
+)
+
+# Поля, по которым можно сортировать рейтинг (у каждого есть индекс)
+SORT_FIELDS = {
+    "score": "score",
+    "messages": "messages",
+    "chats": "chats",
+    "last_seen": "last_seen",
+    "replies": "replies_received",
+    "views": "views"
+}
+
+# Приращения сообщений: счётчики складываются, даты - min/max
+UPSERT_MESSAGES = """
+INSERT INTO authors (
+    author_id, username, first_name, last_name,
+    messages, replies_sent, views, forwards, first_seen, last_seen
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(author_id) DO UPDATE SET
+    username = COALESCE(excluded.username, username),
+    first_name = COALESCE(excluded.first_name, first_name),
+    last_name = COALESCE(excluded.last_name, last_name),
+    messages = messages + excluded.messages,
+    replies_sent = replies_sent + excluded.replies_sent,
+    views = views + excluded.views,
+    forwards = forwards + excluded.forwards,
+    first_seen = MIN(COALESCE(first_seen, excluded.first_seen), excluded.first_seen),
+    last_seen = MAX(COALESCE(last_seen, excluded.last_seen), excluded.last_seen)
+"""
+
+# Авторов на один запрос при пересчёте
+REBUILD_CHUNK = 500
+
+
+def lead_score(
+    messages: int,
+    chats: int,
+    replies_received: int,
+    views: int,
+    forwards: int,
+    has_bio: bool,
+    has_channel: bool
+) -> float:
+    """Оценка автора как лида без учёта давности (давность - отдельной сортировкой)"""
+    return (
+        math.log1p(messages)
+        + 1.5 * math.log1p(max(chats - 1, 0))
+        + math.log1p(replies_received)
+        + 0.5 * math.log1p(views / 100 + forwards)
+        + (1.0 if has_bio else 0.0)
+        + (1.5 if has_channel else 0.0)
+    )
+
+
+class AuthorStats:
+    """Таблица признаков авторов для ранжирования лидов.
+
+    Обновляется приращениями на каждом батче индексации и при обогащении
+    контакта; после удаления источника затронутые авторы пересчитываются
+    из архива.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    @property
+    def is_built(self) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'built'").fetchone()
+        return row is not None
+
+    def _rescore(self, author_ids: Optional[List[int]] = None):
+        """Пересчитать chats и score (под блокировкой, внутри транзакции)"""
+        if author_ids is None:
+            self._conn.execute(
+                "UPDATE authors SET chats = "
+                "(SELECT COUNT(*) FROM author_chats c WHERE c.author_id = authors.author_id)"
+            )
+            cursor = self._conn.execute(
+                "SELECT author_id, messages, chats, replies_received, views, forwards, "
+                "has_bio, has_channel FROM authors"
+            )
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    return
+                self._conn.executemany(
+                    "UPDATE authors SET score = ? WHERE author_id = ?",
+                    [(lead_score(*row[1:]), row[0]) for row in rows]
+                )
+
+        for i in range(0, len(author_ids), REBUILD_CHUNK):
+            chunk = author_ids[i:i+REBUILD_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            self._conn.execute(
+                "UPDATE authors SET chats = "
+                "(SELECT COUNT(*) FROM author_chats c WHERE c.author_id = authors.author_id) "
+                f"WHERE author_id IN ({placeholders})",
+                chunk
+            )
+            rows = self._conn.execute(
+                "SELECT author_id, messages, chats, replies_received, views, forwards, "
+                f"has_bio, has_channel FROM authors WHERE author_id IN ({placeholders})",
+                chunk
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE authors SET score = ? WHERE author_id = ?",
+                [(lead_score(*row[1:]), row[0]) for row in rows]
+            )
+
+    def add_messages(
+        self,
+        records: List[MessageRecord],
+        previous: Dict[str, Tuple[Optional[int], Optional[int]]],
+        reply_authors: Dict[str, int],
+        replies: Dict[str, int]
+    ):
+        """Учесть батч сообщений.
+
+        previous - views/forwards сообщений, уже бывших в архиве (их не считаем
+        повторно, только приращение счётчиков), reply_authors - авторы
+        сообщений, на которые отвечают новые сообщения, replies - сколько
+        ответов других авторов на новые сообщения уже было в архиве.
+        """
+        deltas: Dict[int, list] = {}
+        received: Dict[int, int] = {}
+        chats = set()
+        for record in records:
+            if not record.author_id:
+                continue
+            old = previous.get(record.point_id)
+            is_new = old is None
+            old_views, old_forwards = old or (0, 0)
+            date = record.date.isoformat()
+
+            delta = deltas.get(record.author_id)
+            if delta is None:
+                delta = deltas[record.author_id] = [
+                    record.author_id, record.author_username,
+                    record.author_first_name, record.author_last_name,
+                    0, 0, 0, 0, date, date
+                ]
+            delta[4] += is_new
+            delta[5] += is_new and record.reply_to_msg_id is not None
+            delta[6] += (record.views or 0) - (old_views or 0)
+            delta[7] += (record.forwards or 0) - (old_forwards or 0)
+            delta[8] = min(delta[8], date)
+            delta[9] = max(delta[9], date)
+            chats.add((record.author_id, record.chat_id))
+
+            parent_author = reply_authors.get(record.point_id)
+            if is_new and parent_author is not None and parent_author != record.author_id:
+                received[parent_author] = received.get(parent_author, 0) + 1
+            if is_new and record.point_id in replies:
+                received[record.author_id] = received.get(record.author_id, 0) + replies[record.point_id]
+
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(UPSERT_MESSAGES, list(deltas.values()))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO author_chats (author_id, chat_id) VALUES (?, ?)",
+                    list(chats)
+                )
+                self._conn.executemany(
+                    "UPDATE authors SET replies_received = replies_received + ? WHERE author_id = ?",
+                    [(count, author_id) for author_id, count in received.items()]
+                )
+                self._rescore(list(deltas.keys() | received.keys()))
+
+    def add_contacts(self, contacts: Iterable[ContactInfo]):
+        """Учесть bio и личный канал обогащённых контактов"""
+        rows = [
+            (c.id, c.username, c.first_name, c.last_name,
+             int(bool(c.bio)), int(c.personal_channel_id is not None))
+            for c in contacts
+        ]
+        if not rows:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO authors (author_id, username, first_name, last_name, has_bio, has_channel) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(author_id) DO UPDATE SET "
+                    "username = COALESCE(excluded.username, username), "
+                    "first_name = COALESCE(excluded.first_name, first_name), "
+                    "last_name = COALESCE(excluded.last_name, last_name), "
+                    "has_bio = excluded.has_bio, has_channel = excluded.has_channel",
+                    rows
+                )
+                self._rescore([row[0] for row in rows])
+
+    def _merge_aggregates(self, archive, author_ids: Optional[List[int]]):
+        for chat_id, messages, replies in archive.author_aggregates(author_ids):
+            messages = [row for row in messages if row[0]]
+            self._conn.executemany(UPSERT_MESSAGES, messages)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO author_chats (author_id, chat_id) VALUES (?, ?)",
+                [(row[0], chat_id) for row in messages]
+            )
+            self._conn.executemany(
+                "UPDATE authors SET replies_received = replies_received + ? WHERE author_id = ?",
+                [(count, author_id) for author_id, count in replies]
+            )
+
+    def rebuild(self, archive, author_ids: Optional[List[int]] = None):
+        """Пересчитать признаки из архива: всех авторов или только указанных.
+
+        Авторы без сообщений в архиве удаляются, bio/канал сохраняются.
+        """
+        with self._lock:
+            with self._conn:
+                if author_ids is None:
+                    self._conn.execute(
+                        "UPDATE authors SET messages = 0, chats = 0, replies_sent = 0, "
+                        "replies_received = 0, views = 0, forwards = 0, first_seen = NULL, last_seen = NULL"
+                    )
+                    self._conn.execute("DELETE FROM author_chats")
+                    self._merge_aggregates(archive, None)
+                    self._conn.execute("DELETE FROM authors WHERE messages = 0")
+                    self._rescore()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('built', ?)",
+                        (datetime.utcnow().isoformat(),)
+                    )
+                    return
+
+                for i in range(0, len(author_ids), REBUILD_CHUNK):
+                    chunk = author_ids[i:i+REBUILD_CHUNK]
+                    placeholders = ", ".join("?" for _ in chunk)
+                    self._conn.execute(
+                        "UPDATE authors SET messages = 0, chats = 0, replies_sent = 0, "
+                        "replies_received = 0, views = 0, forwards = 0, first_seen = NULL, last_seen = NULL "
+                        f"WHERE author_id IN ({placeholders})",
+                        chunk
+                    )
+                    self._conn.execute(
+                        f"DELETE FROM author_chats WHERE author_id IN ({placeholders})", chunk
+                    )
+                    self._merge_aggregates(archive, chunk)
+                    self._conn.execute(
+                        f"DELETE FROM authors WHERE messages = 0 AND author_id IN ({placeholders})",
+                        chunk
+                    )
+                self._rescore(author_ids)
+
+    def rank(
+        self,
+        sort: str = "score",
+        descending: bool = True,
+        offset: int = 0,
+        limit: int = 50,
+        min_messages: int = 0,
+        min_chats: int = 0,
+        has_bio: Optional[bool] = None,
+        has_channel: Optional[bool] = None,
+        active_since: Optional[datetime] = None
+    ) -> Tuple[List[AuthorRank], int]:
+        """Страница рейтинга авторов и общее число подходящих под фильтры"""
+        conditions, params = [], []
+        if min_messages:
+            conditions.append("messages >= ?")
+            params.append(min_messages)
+        if min_chats:
+            conditions.append("chats >= ?")
+            params.append(min_chats)
+        if has_bio is not None:
+            conditions.append("has_bio = ?")
+            params.append(int(has_bio))
+        if has_channel is not None:
+            conditions.append("has_channel = ?")
+            params.append(int(has_channel))
+        if active_since is not None:
+            conditions.append("last_seen >= ?")
+            params.append(active_since.isoformat())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = f"{SORT_FIELDS[sort]} {'DESC' if descending else 'ASC'}, author_id"
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM authors {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join(AUTHOR_COLUMNS)} FROM authors {where} "
+                f"ORDER BY {order} LIMIT ? OFFSET ?",
+                [*params, limit, offset]
+            ).fetchall()
+        return [AuthorRank(**dict(zip(AUTHOR_COLUMNS, row))) for row in rows], total
@@ -0,0 +1,329 @@
+"""Пакетные операции без веб-сервера (для cron и ручных запусков).
+
+    python -m app.cli sync [--chats ID ...] [--dialogs] [--concurrency N]
+    python -m app.cli backfill --chats ID ... [--concurrency N]
+    python -m app.cli reindex [--model M] [--dim D] [--concurrency N]
+    python -m app.cli export --output messages.jsonl [--chats ID ...]
+    python -m app.cli stats
+
+sync и backfill сами подключаются к Telegram, поэтому запускаются при
+остановленном воркере (сессия заблокирована - запуск завершается с кодом 2);
+reindex не стартует, пока идёт переиндексация в воркере. Прогресс - в stderr, итог - JSON в stdout; код
+возврата 1, если хоть один чат не скачался. Прерванный запуск
+продолжается повтором той же команды (состояние - data_dir/cli_state.json).
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import signal
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.config import get_settings
+from app.models import DownloadSettings, DownloadMode, JobInfo, ReindexRequest
+from app.rag_service import get_rag_service
+from app.reindex import get_reindexer
+from app.locks import LockBusy
+from app.telegram_pool import get_telegram_pool
+from app.ingest import download_events, wait_enrichment
+
+
+STATE_FILE = "cli_state.json"
+LOCK_FILE = "cli.lock"
+
+# Как часто печатать прогресс переиндексации
+PROGRESS_INTERVAL = 5.0
+
+# Сообщений за один проход sync по чату, которого ещё нет в архиве
+SYNC_INITIAL_LIMIT = 1000
+# Потолок для догрузки новых сообщений (Telegram отдаёт их от новых к старым до min_id)
+SYNC_MAX_MESSAGES = 1_000_000
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def log(message: str):
+    print(f"{datetime.now():%H:%M:%S} {message}", file=sys.stderr, flush=True)
+
+
+class CliState:
+    """Состояние пакетных запусков: точки продолжения sync, backfill и export"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = {"sync": {}, "backfill": {}, "export": None}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data.update(json.load(f))
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def chat(self, section: str, chat_id: int) -> dict:
+        return self.data[section].setdefault(str(chat_id), {})
+
+
+class BatchRunner:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.settings = get_settings()
+        self.rag = get_rag_service()
+        self.state = CliState(os.path.join(self.settings.data_dir, STATE_FILE))
+
+    # --- sync / backfill ---
+
+    async def _chat_ids(self) -> List[int]:
+        if self.args.chats:
+            return self.args.chats
+        chat_ids = set(await asyncio.to_thread(self.rag.archive.chat_ids))
+        if getattr(self.args, "dialogs", False):
+            service = get_telegram_pool().get()
+            dialogs, _, _ = await service.get_dialogs()
+            chat_ids.update(chat.id for chat in dialogs)
+        return sorted(chat_ids)
+
+    def _sync_settings(self, chat_id: int) -> DownloadSettings:
+        """Только сообщения новее последнего успешного sync (или архива)"""
+        state = self.state.chat("sync", chat_id)
+        min_id = state.get("min_id")
+        if min_id is None:
+            _, min_id = self.rag.archive.message_id_range(chat_id)
+        if not min_id:
+            return DownloadSettings(chat_id=chat_id, limit=self.args.limit)
+        return DownloadSettings(chat_id=chat_id, limit=SYNC_MAX_MESSAGES, min_id=min_id)
+
+    def _backfill_settings(self, chat_id: int) -> Optional[DownloadSettings]:
+        state = self.state.chat("backfill", chat_id)
+        if state.get("status") == "done" and not self.args.force:
+            return None
+        offset_id = 0
+        if state.get("status") == "running":
+            # История идёт от новых к старым - продолжаем от самого старого сохранённого
+            offset_id, _ = self.rag.archive.message_id_range(chat_id)
+        state["status"] = "running"
+        self.state.save()
+        return DownloadSettings(chat_id=chat_id, mode=DownloadMode.BACKFILL, offset_id=offset_id or 0)
+
+    async def _download(self, chat_id: int, settings: DownloadSettings) -> dict:
+        downloaded = indexed = 0
+        started = time.monotonic()
+        async for event in download_events(settings):
+            if event["type"] == "progress":
+                downloaded = event["downloaded"]
+            elif event["type"] == "indexed":
+                indexed += event["count"]
+                log(f"chat {chat_id}: downloaded {downloaded}, indexed {indexed}")
+            elif event["type"] == "backfill_fallback":
+                log(f"chat {chat_id}: takeout unavailable, regular history: {event['reason']}")
+            elif event["type"] == "error":
+                raise RuntimeError(event["error"])
+            elif event["type"] == "complete":
+                downloaded = event["total_downloaded"]
+        log(f"chat {chat_id}: done, {downloaded} messages in {time.monotonic() - started:.1f}s")
+        return {"downloaded": downloaded, "indexed": indexed}
+
+    async def _download_chat(self, chat_id: int, backfill: bool) -> Optional[dict]:
+        settings = self._backfill_settings(chat_id) if backfill else self._sync_settings(chat_id)
+        if settings is None:
+            log(f"chat {chat_id}: backfill already done, skipped")
+            return None
+        result = await self._download(chat_id, settings)
+
+        # Следующий sync начнёт с самого нового сообщения в архиве
+        _, max_id = self.rag.archive.message_id_range(chat_id)
+        sync = self.state.chat("sync", chat_id)
+        if max_id:
+            sync["min_id"] = max(max_id, sync.get("min_id") or 0)
+        sync["synced_at"] = datetime.utcnow().isoformat()
+        if backfill:
+            self.state.chat("backfill", chat_id)["status"] = "done"
+        self.state.save()
+        return result
+
+    async def download(self, backfill: bool) -> dict:
+        pool = get_telegram_pool()
+        await pool.connect()
+        try:
+            chat_ids = await self._chat_ids()
+            log(f"{'backfill' if backfill else 'sync'}: {len(chat_ids)} chats, concurrency {self.args.concurrency}")
+            semaphore = asyncio.Semaphore(self.args.concurrency)
+            results: Dict[str, dict] = {}
+
+            async def run(chat_id: int):
+                async with semaphore:
+                    try:
+                        result = await self._download_chat(chat_id, backfill)
+                        results[str(chat_id)] = result or {"skipped": True}
+                    except Exception as e:
+                        log(f"chat {chat_id}: failed: {e}")
+                        results[str(chat_id)] = {"error": str(e)}
+
+            await asyncio.gather(*(run(chat_id) for chat_id in chat_ids))
+            # Обогащение контактов запущено загрузками в фоне
+            await wait_enrichment()
+        finally:
+            await pool.disconnect()
+
+        failed = [chat_id for chat_id, result in results.items() if "error" in result]
+        return {"success": not failed, "chats": results, "failed": failed}
+
+    # --- reindex ---
+
+    async def reindex(self) -> dict:
+        if self.args.concurrency:
+            self.settings.reindex_concurrency = self.args.concurrency
+        if self.args.batch_size:
+            self.settings.reindex_batch_size = self.args.batch_size
+
+        job = JobInfo(id="cli", kind="reindex", status="running", created_at=datetime.utcnow())
+        request = ReindexRequest(
+            embedding_model=self.args.model,
+            embedding_dim=self.args.dim,
+            hnsw_m=self.args.hnsw_m,
+            hnsw_ef_construct=self.args.hnsw_ef_construct
+        )
+
+        async def report():
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                log(f"reindex {job.stage}: {job.done}/{job.total}")
+
+        reporter = asyncio.create_task(report())
+        try:
+            return await get_reindexer().run(request, job)
+        finally:
+            reporter.cancel()
+
+    # --- export ---
+
+    async def export(self) -> dict:
+        """Архив в JSONL; прерванная выгрузка в тот же файл продолжается"""
+        output = os.path.abspath(self.args.output)
+        part_path = output + ".part"
+        export = self.state.data.get("export")
+        if not export or export["output"] != output or not os.path.exists(part_path):
+            export = {"output": output, "positions": {}, "size": 0, "written": 0}
+            open(part_path, "w").close()
+        chat_ids = self.args.chats or await asyncio.to_thread(self.rag.archive.chat_ids)
+
+        with open(part_path, "r+", encoding="utf-8") as f:
+            # Строки после последнего сохранённого состояния пишутся заново
+            f.truncate(export["size"])
+            f.seek(export["size"])
+            for chat_id in chat_ids:
+                after = export["positions"].get(str(chat_id), 0)
+                for seq, batch in self.rag.archive.iter_batches(chat_id, after, EXPORT_BATCH_SIZE):
+                    f.writelines(json.dumps(message, ensure_ascii=False) + "\n" for message in batch)
+                    f.flush()
+                    export["positions"][str(chat_id)] = seq
+                    export["size"] = f.tell()
+                    export["written"] += len(batch)
+                    self.state.data["export"] = export
+                    self.state.save()
+                log(f"export: chat {chat_id} done, {export['written']} messages")
+
+        os.replace(part_path, output)
+        self.state.data["export"] = None
+        self.state.save()
+        return {"success": True, "output": output, "messages": export["written"]}
+
+    # --- stats ---
+
+    async def stats(self) -> dict:
+        stats = await self.rag.get_stats()
+        stats["sources"] = [source.model_dump() for source in await asyncio.to_thread(self.rag.get_available_sources)]
+        stats["sync"] = self.state.data["sync"]
+        stats["backfill"] = self.state.data["backfill"]
+        return stats
+
+
+def acquire_lock(data_dir: str):
+    """Не даём двум запускам из cron работать одновременно"""
+    lock = open(os.path.join(data_dir, LOCK_FILE), "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print("Another app.cli run is in progress", file=sys.stderr)
+        sys.exit(2)
+    return lock
+
+
+async def _main(args: argparse.Namespace) -> dict:
+    # SIGTERM (например, таймаут cron) прерывает запуск как Ctrl+C
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    runner = BatchRunner(args)
+    try:
+        if args.command == "export":
+            return await runner.export()
+        await runner.rag.init(load_contacts=args.command != "stats")
+        if args.command == "stats":
+            return await runner.stats()
+        # Разовый перенос сообщений из Qdrant в локальный архив
+        await runner.rag.import_legacy_messages()
+        if args.command == "reindex":
+            return await runner.reindex()
+        return await runner.download(backfill=args.command == "backfill")
+    finally:
+        await runner.rag.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная загрузка, переиндексация и экспорт")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sync = commands.add_parser("sync", help="Догрузить новые сообщения")
+    sync.add_argument("--chats", type=int, nargs="+", help="Чаты (по умолчанию - все из архива)")
+    sync.add_argument("--dialogs", action="store_true", help="Добавить все диалоги аккаунта")
+    sync.add_argument("--limit", type=int, default=SYNC_INITIAL_LIMIT,
+                      help="Сообщений для чата, которого ещё нет в архиве")
+
+    backfill = commands.add_parser("backfill", help="Скачать всю историю через takeout")
+    backfill.add_argument("--chats", type=int, nargs="+", required=True)
+    backfill.add_argument("--force", action="store_true", help="Повторить для уже выгруженных чатов")
+
+    for command in (sync, backfill):
+        command.add_argument("--concurrency", type=int, default=get_settings().telegram_account_downloads,
+                             help="Чатов одновременно")
+
+    reindex = commands.add_parser("reindex", help="Переиндексировать архив")
+    reindex.add_argument("--model")
+    reindex.add_argument("--dim", type=int)
+    reindex.add_argument("--hnsw-m", type=int)
+    reindex.add_argument("--hnsw-ef-construct", type=int)
+    reindex.add_argument("--concurrency", type=int, help="Батчей эмбеддинга одновременно")
+    reindex.add_argument("--batch-size", type=int)
+
+    export = commands.add_parser("export", help="Выгрузить архив сообщений в JSONL")
+    export.add_argument("--output", required=True)
+    export.add_argument("--chats", type=int, nargs="+")
+
+    commands.add_parser("stats", help="Статистика индекса и состояние синхронизации")
+
+    args = parser.parse_args()
+    settings = get_settings()
+    os.makedirs(settings.data_dir, exist_ok=True)
+    lock = acquire_lock(settings.data_dir) if args.command != "stats" else None
+    try:
+        result = asyncio.run(_main(args))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("Interrupted, rerun the same command to continue", file=sys.stderr)
+        sys.exit(130)
+    except LockBusy as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+    finally:
+        if lock:
+            lock.close()
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    if not result.get("success", True):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
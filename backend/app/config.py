@@ -1,16 +1,63 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 
 class Settings(BaseSettings):
     telegram_api_id: int
     telegram_api_hash: str
     telegram_phone: str
+    telegram_account_rps: float = 1.0
+    telegram_account_downloads: int = 2
     qdrant_host: str = "localhost"
     qdrant_port: int = 6333
+    qdrant_grpc_port: int = 6334
+    qdrant_prefer_grpc: bool = False
+    qdrant_location: Optional[str] = None
     openai_api_key: str
+    openai_base_url: str = "https://api.openai.com/v1"
     embedding_model: str = "text-embedding-3-small"
+    embedding_dim: int = 1536
+    # Лимиты API эмбеддингов: токенов на один текст и на запрос, текстов на запрос
+    embedding_max_input_tokens: int = 8191
+    embedding_request_tokens: int = 300000
+    embedding_request_inputs: int = 512
+    # Общий батч одиночных запросов эмбеддингов: ожидание (сек) и размер
+    embedding_batch_wait: float = 0.005
+    embedding_batch_inputs: int = 64
+    # Повторы и предохранитель для OpenAI
+    openai_max_retries: int = 5
+    openai_backoff_base: float = 0.5
+    openai_backoff_max: float = 30.0
+    openai_embeddings_concurrency: int = 8
+    openai_chat_concurrency: int = 4
+    openai_breaker_failures: int = 5
+    openai_breaker_reset_seconds: float = 30.0
+    # none - все векторы сообщений в одной коллекции; collections - коллекция на источник
+    embeddings_partitioning: str = "none"
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    reindex_batch_size: int = 500
+    reindex_concurrency: int = 4
+    # Параллельных запросов на маршрут и ждущих в очереди (0 - без ограничения), на процесс API
+    admission_search_concurrency: int = 8
+    admission_search_queue: int = 32
+    admission_download_concurrency: int = 4
+    admission_download_queue: int = 8
+    admission_export_concurrency: int = 1
+    admission_export_queue: int = 2
+    admission_queue_timeout: float = 10.0
+    dialogs_cache_ttl: int = 300
+    topics_cache_ttl: int = 600
+    # all - один процесс; api - поиск без сессии Telegram; worker - ингест
+    role: str = "all"
+    live_batch_size: int = 50
+    live_flush_seconds: float = 2.0
+    worker_concurrency: int = 4
+    worker_metrics_port: int = 9100
     data_dir: str = "/app/data"
+    # Каталог снимков; по умолчанию data_dir/snapshots (лучше вынести на другой том)
+    snapshot_dir: Optional[str] = None
     session_dir: str = "/app/session"
 
     class Config:
@@ -0,0 +1,131 @@
+import time
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from app.models import ChatInfo
+
+
+# Загрузчик диалогов: отдаёт (ChatInfo, время последнего сообщения) в порядке Telegram
+DialogLoader = Callable[[], AsyncIterator[Tuple[ChatInfo, float]]]
+
+
+class DialogCache:
+    """Кэш списка диалогов с TTL.
+
+    Между полными перезагрузками обновляется событиями Telegram. Пока идёт
+    первая загрузка, уже полученные диалоги сразу доступны для выдачи.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._chats: Dict[int, ChatInfo] = {}
+        self._order: Dict[int, float] = {}
+        self._sorted: Optional[List[ChatInfo]] = None
+        self._loaded_at: Optional[float] = None
+        self._loading: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def is_complete(self) -> bool:
+        return self._loaded_at is not None
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.is_complete and time.monotonic() - self._loaded_at < self.ttl
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._chats
+
+    def get(self, chat_id: int) -> Optional[ChatInfo]:
+        return self._chats.get(chat_id)
+
+    async def _notify(self):
+        self._sorted = None
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _load(self, loader: DialogLoader):
+        # Первая загрузка пишет прямо в кэш, повторные - в копию с подменой в конце
+        first_load = not self.is_complete
+        chats: Dict[int, ChatInfo] = self._chats if first_load else {}
+        order: Dict[int, float] = self._order if first_load else {}
+        try:
+            async for chat, last_date in loader():
+                chats[chat.id] = chat
+                order[chat.id] = last_date
+                if first_load:
+                    await self._notify()
+            self._chats, self._order = chats, order
+            self._loaded_at = time.monotonic()
+        except Exception as e:
+            print(f"Error loading dialogs: {e}")
+        finally:
+            self._loading = None
+            await self._notify()
+
+    async def ensure(self, loader: DialogLoader, min_count: Optional[int] = None):
+        """Запустить обновление при необходимости и дождаться min_count диалогов.
+
+        min_count=None - ждать полной загрузки. Устаревший, но загруженный
+        кэш отдаётся сразу, а обновляется в фоне.
+        """
+        if not self.is_fresh and self._loading is None:
+            self._loading = asyncio.create_task(self._load(loader))
+
+        if self.is_complete:
+            return
+
+        async with self._changed:
+            await self._changed.wait_for(
+                lambda: self.is_complete
+                or self._loading is None
+                or (min_count is not None and len(self._chats) >= min_count)
+            )
+
+    def invalidate(self):
+        if self._loaded_at is not None:
+            self._loaded_at = time.monotonic() - self.ttl
+
+    def page(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        query: Optional[str] = None
+    ) -> Tuple[List[ChatInfo], int]:
+        """Страница диалогов (свежие сверху) и общее число подходящих"""
+        if self._sorted is None:
+            self._sorted = sorted(
+                self._chats.values(),
+                key=lambda c: self._order.get(c.id, 0.0),
+                reverse=True
+            )
+        chats = self._sorted
+        if query:
+            needle = query.lower()
+            chats = [
+                c for c in chats
+                if needle in c.title.lower() or (c.username and needle in c.username.lower())
+            ]
+        end = offset + limit if limit is not None else None
+        return chats[offset:end], len(chats)
+
+    async def upsert(self, chat: ChatInfo, last_date: Optional[float] = None):
+        self._chats[chat.id] = chat
+        if last_date is not None:
+            self._order[chat.id] = last_date
+        await self._notify()
+
+    async def touch(self, chat_id: int, last_date: float, incoming: bool) -> bool:
+        """Новое сообщение в известном чате; False - чат в кэше не найден"""
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return False
+        self._order[chat_id] = last_date
+        if incoming:
+            chat.unread_count += 1
+        await self._notify()
+        return True
+
+    async def remove(self, chat_id: int):
+        self._chats.pop(chat_id, None)
+        self._order.pop(chat_id, None)
+        await self._notify()
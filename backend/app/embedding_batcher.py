@@ -0,0 +1,232 @@
+import re
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import httpx
+
+
+# Ответы API, означающие что отвергнут сам вход, а не запрос целиком
+INPUT_ERROR_STATUSES = (400, 413, 422)
+
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+# Оценка токенов cl100k (модели text-embedding-3) в полутокенах: латиница и
+# кириллица - не больше токена на два символа, прочие символы BMP (CJK, значки) -
+# до двух токенов, символы вне BMP (эмодзи) - до трёх. Недооценку на редких
+# текстах страхует деление запроса пополам по ошибке API
+HALF_TOKENS_WIDE = 4
+HALF_TOKENS_ASTRAL = 6
+
+
+def _char_units(char: str) -> int:
+    code = ord(char)
+    if code < 0x800:
+        return 1
+    return HALF_TOKENS_WIDE if code < 0x10000 else HALF_TOKENS_ASTRAL
+
+
+def _units(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    return sum(_char_units(char) for char in text)
+
+
+def count_tokens(text: str) -> int:
+    """Оценка числа токенов текста сверху для обычных текстов чатов"""
+    return (_units(text) + 1) // 2
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """Разрезать текст на куски не длиннее max_tokens, по пробелам где возможно"""
+    max_units = max_tokens * 2
+    if _units(text) <= max_units:
+        return [text]
+
+    chunks = []
+    current = ""
+    current_units = 0
+    for piece in re.split(r"(\s+)", text):
+        units = _units(piece)
+        if current_units + units <= max_units:
+            current += piece
+            current_units += units
+            continue
+        if current.strip():
+            chunks.append(current)
+        current, current_units = "", 0
+        # Слово длиннее лимита режем посимвольно
+        for char in piece:
+            units = _char_units(char)
+            if current_units + units > max_units:
+                chunks.append(current)
+                current, current_units = "", 0
+            current += char
+            current_units += units
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def pack(texts: List[str], max_tokens: int, max_inputs: int) -> List[List[int]]:
+    """Разложить тексты по запросам в пределах бюджета токенов и числа входов"""
+    requests = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_inputs):
+            requests.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        requests.append(current)
+    return requests
+
+
+def _is_input_error(e: Exception) -> bool:
+    return (
+        isinstance(e, httpx.HTTPStatusError)
+        and e.response.status_code in INPUT_ERROR_STATUSES
+    )
+
+
+async def _embed_request(embed: EmbedFn, texts: List[str]) -> List[Optional[List[float]]]:
+    try:
+        return await embed(texts)
+    except Exception as e:
+        if len(texts) > 1 and _is_input_error(e):
+            # Делим пополам и повторяем только половину с плохим текстом
+            middle = len(texts) // 2
+            left, right = await asyncio.gather(
+                _embed_request(embed, texts[:middle]),
+                _embed_request(embed, texts[middle:])
+            )
+            return left + right
+        print(f"Error embedding {len(texts)} texts: {e}")
+        return [None] * len(texts)
+
+
+async def embed_all(
+    embed: EmbedFn,
+    texts: List[str],
+    max_tokens: int,
+    max_inputs: int
+) -> List[Optional[List[float]]]:
+    """Эмбеддинги текстов упакованными запросами; None - для текстов с ошибкой"""
+    requests = pack(texts, max_tokens, max_inputs)
+    results = await asyncio.gather(*(
+        _embed_request(embed, [texts[i] for i in request])
+        for request in requests
+    ))
+    embeddings: List[Optional[List[float]]] = [None] * len(texts)
+    for request, result in zip(requests, results):
+        for i, embedding in zip(request, result):
+            embeddings[i] = embedding
+    return embeddings
+
+
+class MicroBatcher:
+    """Общий батч эмбеддингов для одновременных вызывающих.
+
+    Пока предыдущий запрос в полёте, тексты поиска, обогащения контактов
+    и мелких батчей ингеста копятся до max_wait секунд (или до max_inputs
+    текстов / max_tokens токенов) и уходят в API одним запросом;
+    результаты раздаются обратно.
+    """
+
+    def __init__(self, embed: EmbedFn, max_wait: float, max_inputs: int, max_tokens: int):
+        self.embed_fn = embed
+        self.max_wait = max_wait
+        self.max_inputs = max_inputs
+        self.max_tokens = max_tokens
+        # Одинаковые тексты в одном батче (один запрос от разных пользователей) - один вход
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> List[float]:
+        # Одиночный текст: ошибка API, в том числе на плохой вход, пробрасывается как есть
+        return await self._submit([text])[0]
+
+    async def embed_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Эмбеддинги текстов; None - для текстов, которые API отверг как плохой вход.
+
+        Остальные ошибки пробрасываются. Так embed_all не делит и не
+        переотправляет батч, где уже посчитано всё, кроме плохих текстов.
+        """
+        if len(texts) >= self.max_inputs:
+            # Крупный батч и так заполняет запрос
+            return await self.embed_fn(texts)
+
+        results = await asyncio.gather(*self._submit(texts), return_exceptions=True)
+        embeddings: List[Optional[List[float]]] = []
+        for result in results:
+            if not isinstance(result, BaseException):
+                embeddings.append(result)
+            elif _is_input_error(result):
+                print(f"Error embedding text: {result}")
+                embeddings.append(None)
+            else:
+                raise result
+        return embeddings
+
+    def _submit(self, texts: List[str]) -> List[asyncio.Future]:
+        tokens = sum(count_tokens(text) for text in texts)
+        if self._pending and (
+            len(self._pending) + len(texts) > self.max_inputs
+            or self._pending_tokens + tokens > self.max_tokens
+        ):
+            # Не переполняем лимиты запроса: накопленное уходит отдельно
+            self._flush()
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            if text not in self._pending:
+                self._pending_tokens += count_tokens(text)
+            self._pending.setdefault(text, []).append(future)
+            futures.append(future)
+
+        if (
+            not self._tasks
+            or len(self._pending) >= self.max_inputs
+            or self._pending_tokens >= self.max_tokens
+        ):
+            # Без нагрузки ждать некого: одиночный запрос уходит сразу
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return futures
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_tokens = self._pending, {}, 0
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: Dict[str, List[asyncio.Future]]):
+        texts = list(batch)
+        try:
+            results = await self.embed_fn(texts)
+        except Exception as e:
+            if len(texts) > 1 and _is_input_error(e):
+                # Плохой текст не должен ронять чужие запросы: повторяем поштучно
+                await asyncio.gather(*(self._send({text: batch[text]}) for text in texts))
+                return
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for text, embedding in zip(texts, results):
+            for future in batch[text]:
+                if not future.done():
+                    future.set_result(embedding)
@@ -0,0 +1,142 @@
+import asyncio
+from typing import AsyncGenerator, List, Set
+from app.telegram_pool import get_telegram_pool, NoAccountAvailable
+from app.rag_service import get_rag_service
+from app.models import DownloadSettings, DownloadMode
+from app.metrics import QUEUE_DEPTH
+
+
+# Ссылки на фоновые задачи обогащения, чтобы их не собрал GC
+_background: Set[asyncio.Task] = set()
+
+# Сообщений на батч индексации: обычная загрузка / выгрузка всей истории
+INDEX_BATCH_SIZE = 50
+BACKFILL_BATCH_SIZE = 500
+
+# В backfill событие прогресса - раз в столько сообщений
+BACKFILL_PROGRESS_EVERY = 100
+
+
+async def enrich_contacts(author_ids: List[int]):
+    """Фоновое обогащение контактов, распределённое по аккаунтам пула.
+
+    Частоту запросов ограничивает бюджет каждого аккаунта.
+    """
+    rag_service = get_rag_service()
+    telegram_pool = get_telegram_pool()
+    new_ids = rag_service.get_new_contact_ids(author_ids)[:50]  # Лимит за один раз
+    enrichment_queue = QUEUE_DEPTH.labels("contacts_enrichment")
+    enrichment_queue.inc(len(new_ids))
+    pending = list(reversed(new_ids))
+
+    async def worker():
+        while pending:
+            user_id = pending.pop()
+            enrichment_queue.dec()
+            try:
+                contact = await telegram_pool.get_user_full_info(user_id)
+                if contact:
+                    await rag_service.add_contact(contact)
+            except Exception as e:
+                print(f"Error enriching contact {user_id}: {e}")
+                if "flood" in str(e).lower() or isinstance(e, NoAccountAvailable):
+                    # Все аккаунты в flood wait - останавливаемся
+                    enrichment_queue.dec(len(pending))
+                    pending.clear()
+
+    await asyncio.gather(*(worker() for _ in range(max(1, telegram_pool.healthy_count()))))
+
+
+def schedule_enrichment(author_ids: List[int]):
+    task = asyncio.create_task(enrich_contacts(author_ids))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def wait_enrichment():
+    """Дождаться фонового обогащения (перед завершением разового процесса)"""
+    await asyncio.gather(*_background, return_exceptions=True)
+
+
+async def download_events(settings: DownloadSettings) -> AsyncGenerator[dict, None]:
+    """Скачать сообщения из чата и проиндексировать; события прогресса"""
+    rag_service = get_rag_service()
+    backfill = settings.mode == DownloadMode.BACKFILL
+    batch_size = BACKFILL_BATCH_SIZE if backfill else INDEX_BATCH_SIZE
+    messages_batch = []
+    author_ids = []
+    total_downloaded = 0
+    fallbacks = []
+    # Скачанные, но ещё не проиндексированные сообщения
+    index_queue = QUEUE_DEPTH.labels("index_pending")
+
+    try:
+        # Чат качается аккаунтом, который его видит и меньше всего занят
+        async with get_telegram_pool().lease(settings.chat_id) as account:
+            async for message in account.get_messages(settings, on_fallback=fallbacks.append):
+                if fallbacks:
+                    yield {
+                        "type": "backfill_fallback",
+                        "reason": fallbacks.pop()
+                    }
+                messages_batch.append(message)
+                index_queue.inc()
+                author_ids.append(message.author_id)
+                total_downloaded += 1
+
+                if not backfill or total_downloaded % BACKFILL_PROGRESS_EVERY == 0:
+                    yield {
+                        "type": "progress",
+                        "downloaded": total_downloaded,
+                        "message_preview": message.text[:100] + "..." if len(message.text) > 100 else message.text
+                    }
+
+                if len(messages_batch) >= batch_size:
+                    indexed = await rag_service.index_messages_batch(messages_batch)
+                    index_queue.dec(len(messages_batch))
+                    messages_batch = []
+                    yield {
+                        "type": "indexed",
+                        "count": indexed
+                    }
+
+                if not backfill:
+                    await asyncio.sleep(0.05)
+
+        for reason in fallbacks:
+            yield {
+                "type": "backfill_fallback",
+                "reason": reason
+            }
+
+        if messages_batch:
+            indexed = await rag_service.index_messages_batch(messages_batch)
+            index_queue.dec(len(messages_batch))
+            messages_batch = []
+            yield {
+                "type": "indexed",
+                "count": indexed
+            }
+
+        # Запускаем обогащение контактов в фоне
+        new_contacts = len(rag_service.get_new_contact_ids(author_ids))
+        if new_contacts > 0:
+            schedule_enrichment(author_ids)
+            yield {
+                "type": "contacts_queued",
+                "count": min(new_contacts, 50)
+            }
+
+        yield {
+            "type": "complete",
+            "total_downloaded": total_downloaded,
+            "status": "success"
+        }
+
+    except Exception as e:
+        yield {
+            "type": "error",
+            "error": str(e)
+        }
+    finally:
+        index_queue.dec(len(messages_batch))
@@ -0,0 +1,147 @@
+import os
+import re
+import string
+import threading
+from typing import Dict, List, Optional, Pattern, Tuple
+from app.models import IngestFilterConfig, IngestFilterRules
+from app.records import MessageRecord
+from app.metrics import INGEST_FILTERED
+
+
+FILTERS_FILE = "ingest_filters.json"
+
+# Меньше букв - язык не определяем и правило языка не применяем
+LANGUAGE_MIN_LETTERS = 10
+
+# Буквы, по которым кириллические языки отличаются от русского
+LANGUAGE_MARKERS = (("be", "ў"), ("kk", "әғқңөұүһ"), ("uk", "іїєґ"))
+
+NORMALIZE_STRIP = string.punctuation + string.whitespace + "«»…—–"
+
+
+def normalize(text: str) -> str:
+    return text.strip(NORMALIZE_STRIP).lower()
+
+
+def detect_language(text: str) -> Optional[str]:
+    """Грубое определение языка по алфавиту: кириллица - ru/uk/be/kk, латиница - en.
+
+    Для коротких текстов и текстов без букв возвращает None.
+    """
+    text = text.lower()
+    cyrillic = latin = 0
+    for char in text:
+        if "а" <= char <= "я" or char in "ёіїєґўәғқңөұүһ":
+            cyrillic += 1
+        elif "a" <= char <= "z":
+            latin += 1
+    if cyrillic + latin < LANGUAGE_MIN_LETTERS:
+        return None
+    if latin > cyrillic:
+        return "en"
+    for language, letters in LANGUAGE_MARKERS:
+        if any(letter in text for letter in letters):
+            return language
+    return "ru"
+
+
+def is_bot(record: MessageRecord) -> bool:
+    # Только по флагу Telegram: по username ("...bot") отсеялись бы и люди,
+    # а ингест и переиндексация решали бы по-разному
+    return bool(record.author_is_bot)
+
+
+class CompiledRules:
+    def __init__(self, rules: IngestFilterRules):
+        self.min_length = rules.min_length or 0
+        self.stop_list = {normalize(text) for text in rules.stop_list or []}
+        self.patterns: List[Pattern] = [re.compile(p, re.IGNORECASE) for p in rules.patterns or []]
+        self.languages = set(rules.languages or [])
+        self.exclude_bots = bool(rules.exclude_bots)
+
+    def reason(self, record: MessageRecord) -> Optional[str]:
+        """Почему сообщение не эмбеддится; None - эмбеддится"""
+        text = record.text.strip()
+        if len(text) < self.min_length:
+            return "length"
+        if self.stop_list and normalize(text) in self.stop_list:
+            return "stop_list"
+        if any(pattern.search(text) for pattern in self.patterns):
+            return "pattern"
+        if self.exclude_bots and is_bot(record):
+            return "bot"
+        if self.languages:
+            language = detect_language(text)
+            if language is not None and language not in self.languages:
+                return "language"
+        return None
+
+
+class IngestFilters:
+    """Правила отбора сообщений для эмбеддинга в data_dir/ingest_filters.json.
+
+    Непрошедшие сообщения попадают в архив, но не в векторный индекс.
+    Файл меняет API-процесс, воркер перечитывает его по mtime.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._config = IngestFilterConfig()
+        self._mtime = 0.0
+        self._compiled: Dict[int, CompiledRules] = {}
+
+    def _reload(self):
+        mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else 0.0
+        if mtime == self._mtime:
+            return
+        if mtime:
+            with open(self.path) as f:
+                self._config = IngestFilterConfig.model_validate_json(f.read())
+        else:
+            self._config = IngestFilterConfig()
+        self._mtime = mtime
+        self._compiled = {}
+
+    def config(self) -> IngestFilterConfig:
+        with self._lock:
+            self._reload()
+            return self._config
+
+    def save(self, config: IngestFilterConfig):
+        """Сохранить правила; некорректное регулярное выражение - re.error"""
+        for rules in [config.default, *config.chats.values()]:
+            CompiledRules(rules)
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(config.model_dump_json(indent=2))
+            os.replace(tmp_path, self.path)
+            self._config = config
+            self._mtime = os.path.getmtime(self.path)
+            self._compiled = {}
+
+    def _rules(self, chat_id: int) -> CompiledRules:
+        if chat_id not in self._compiled:
+            rules = self._config.default
+            override = self._config.chats.get(chat_id)
+            if override:
+                rules = rules.model_copy(update=override.model_dump(exclude_none=True))
+            self._compiled[chat_id] = CompiledRules(rules)
+        return self._compiled[chat_id]
+
+    def select(self, records: List[MessageRecord]) -> Tuple[List[MessageRecord], Dict[str, int]]:
+        """Сообщения для эмбеддинга и число отброшенных по причинам"""
+        with self._lock:
+            self._reload()
+            accepted = []
+            rejected: Dict[str, int] = {}
+            for record in records:
+                reason = self._rules(record.chat_id).reason(record)
+                if reason is None:
+                    accepted.append(record)
+                else:
+                    rejected[reason] = rejected.get(reason, 0) + 1
+        for reason, count in rejected.items():
+            INGEST_FILTERED.labels(reason).inc(count)
+        return accepted, rejected
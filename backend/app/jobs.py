@@ -0,0 +1,267 @@
+import os
+import json
+import uuid
+import time
+import asyncio
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from datetime import datetime
+from app.config import get_settings
+from app.models import JobInfo
+
+
+JOBS_FILE = "jobs.sqlite"
+
+# Сколько завершённых задач хранить
+MAX_FINISHED_JOBS = 200
+
+# Как часто опрашивать очередь, пока задача не завершилась
+POLL_INTERVAL = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    stage TEXT,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+JOB_COLUMNS = "id, kind, status, stage, done, total, result, error, created_at, finished_at"
+
+FINISHED = ("completed", "failed")
+
+
+class JobManager:
+    """Очередь фоновых задач с прогрессом в локальном SQLite.
+
+    Через неё API-процессы отдают работу процессу-воркеру: задачу ставит
+    любой процесс, выполняет воркер (см. app.worker), статус и события
+    читаются из любого процесса.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # Последнее событие progress задач этого процесса: job_id -> seq
+        self._progress_seq: Dict[str, int] = {}
+
+    @staticmethod
+    def _row_to_job(row: tuple) -> JobInfo:
+        job_id, kind, status, stage, done, total, result, error, created_at, finished_at = row
+        return JobInfo(
+            id=job_id,
+            kind=kind,
+            status=status,
+            stage=stage,
+            done=done,
+            total=total,
+            result=json.loads(result) if result else None,
+            error=error,
+            created_at=datetime.fromisoformat(created_at),
+            finished_at=datetime.fromisoformat(finished_at) if finished_at else None
+        )
+
+    def submit(self, kind: str, payload: Optional[dict] = None) -> JobInfo:
+        """Поставить задачу в очередь; выполнит её воркер"""
+        job = JobInfo(id=uuid.uuid4().hex, kind=kind, created_at=datetime.utcnow())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job.id, kind, job.status, json.dumps(payload or {}), job.created_at.isoformat())
+            )
+        self._evict_finished()
+        return job
+
+    def claim(self, kind: Optional[str] = None) -> Optional[Tuple[JobInfo, dict]]:
+        """Забрать самую старую задачу из очереди (атомарно между процессами)"""
+        kind_filter = "AND kind = ? " if kind else ""
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE jobs SET status = 'running' WHERE id = ("
+                f"SELECT id FROM jobs WHERE status = 'pending' {kind_filter}"
+                "ORDER BY created_at LIMIT 1"
+                f") RETURNING {JOB_COLUMNS}, payload",
+                (kind,) if kind else ()
+            ).fetchone()
+        if row is None:
+            return None
+        return self._row_to_job(row[:-1]), json.loads(row[-1])
+
+    def requeue_running(self) -> int:
+        """Вернуть в очередь задачи, прерванные остановкой воркера.
+
+        Вызовы Telegram не повторяются: их уже никто не ждёт.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted', finished_at = ? "
+                "WHERE status = 'running' AND kind = 'telegram'",
+                (datetime.utcnow().isoformat(),)
+            )
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'pending', finished_at = NULL WHERE status = 'running'"
+            )
+        return cursor.rowcount
+
+    def update(self, job: JobInfo):
+        """Сохранить прогресс (stage/done/total)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET stage = ?, done = ?, total = ? WHERE id = ?",
+                (job.stage, job.done, job.total, job.id)
+            )
+
+    def finish(self, job: JobInfo):
+        """Сохранить итог задачи"""
+        with self._lock:
+            self._progress_seq.pop(job.id, None)
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, done = ?, total = ?, "
+                "result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (
+                    job.status, job.stage, job.done, job.total,
+                    json.dumps(job.result) if job.result is not None else None,
+                    job.error,
+                    job.finished_at.isoformat() if job.finished_at else None,
+                    job.id
+                )
+            )
+
+    def emit(self, job_id: str, event: dict):
+        """Добавить событие задачи (для потоковой отдачи прогресса).
+
+        Из событий progress хранится только последнее: читателю нужен
+        текущий прогресс, а не строка на каждое скачанное сообщение.
+        """
+        progress = event.get("type") == "progress"
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                # Номер берётся до удаления: он не должен повториться для читателя
+                seq = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+                ).fetchone()[0]
+                previous = self._progress_seq.pop(job_id, None)
+                if progress and previous is not None:
+                    self._conn.execute(
+                        "DELETE FROM job_events WHERE job_id = ? AND seq = ?", (job_id, previous)
+                    )
+                self._conn.execute(
+                    "INSERT INTO job_events (job_id, seq, data) VALUES (?, ?, ?)",
+                    (job_id, seq, json.dumps(event, ensure_ascii=False))
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if progress:
+                self._progress_seq[job_id] = seq
+
+    def events(self, job_id: str, after: int = 0) -> List[Tuple[int, dict]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after)
+            ).fetchall()
+        return [(seq, json.loads(data)) for seq, data in rows]
+
+    def _evict_finished(self):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM job_events WHERE job_id IN ("
+                "SELECT id FROM jobs WHERE finished_at IS NOT NULL "
+                "ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+                (MAX_FINISHED_JOBS,)
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE id IN ("
+                "SELECT id FROM jobs WHERE finished_at IS NOT NULL "
+                "ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+                (MAX_FINISHED_JOBS,)
+            )
+
+    def delete(self, job_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def get(self, job_id: str) -> Optional[JobInfo]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, kind: Optional[str] = None) -> List[JobInfo]:
+        with self._lock:
+            if kind is None:
+                rows = self._conn.execute(
+                    f"SELECT {JOB_COLUMNS} FROM jobs ORDER BY created_at DESC"
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    f"SELECT {JOB_COLUMNS} FROM jobs WHERE kind = ? ORDER BY created_at DESC",
+                    (kind,)
+                ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def has_active(self, kind: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE kind = ? AND status IN ('pending', 'running') LIMIT 1",
+                (kind,)
+            ).fetchone()
+        return row is not None
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[JobInfo]:
+        """Дождаться завершения задачи; None - если не успела за timeout"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = self.get(job_id)
+            if job is None or job.status in FINISHED:
+                return job
+            await asyncio.sleep(POLL_INTERVAL)
+        return None
+
+    async def stream(self, job_id: str) -> AsyncIterator[dict]:
+        """События задачи по мере появления, до её завершения"""
+        seq = 0
+        while True:
+            job = self.get(job_id)
+            for seq, event in self.events(job_id, seq):
+                yield event
+            if job is None or job.status in FINISHED:
+                # События, записанные между чтением статуса и событий
+                for seq, event in self.events(job_id, seq):
+                    yield event
+                return
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+@lru_cache()
+def get_job_manager() -> JobManager:
+    settings = get_settings()
+    os.makedirs(settings.data_dir, exist_ok=True)
+    return JobManager(os.path.join(settings.data_dir, JOBS_FILE))
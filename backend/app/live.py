@@ -0,0 +1,170 @@
+import os
+import json
+import asyncio
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+from telethon import events, utils
+from telethon.tl.types import Channel
+from app.config import get_settings
+from app.models import LiveSubscription
+from app.records import MessageRecord
+from app.metrics import QUEUE_DEPTH
+from app.rag_service import get_rag_service
+from app.telegram_client import TelegramService, HistorySource
+from app.telegram_pool import TelegramPool
+from app.ingest import schedule_enrichment
+
+
+SUBSCRIPTIONS_FILE = "live_subscriptions.json"
+
+
+class LiveIngestor:
+    """Индексация новых и отредактированных сообщений "живых" чатов.
+
+    Сообщения из событий Telegram копятся в буфере и уходят в индекс
+    пачкой: по размеру (live_batch_size) или через live_flush_seconds
+    после первого сообщения в буфере.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.path = os.path.join(self.settings.data_dir, SUBSCRIPTIONS_FILE)
+        self._subscriptions: Dict[Tuple[int, Optional[int]], LiveSubscription] = {}
+        self._load()
+        # point_id -> сообщение: повтор (правка, второй аккаунт) заменяет прежнее
+        self._buffer: Dict[str, MessageRecord] = {}
+        self._flush_timer: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()
+        self._pending = QUEUE_DEPTH.labels("live_pending")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for data in json.load(f):
+                subscription = LiveSubscription(**data)
+                self._subscriptions[(subscription.chat_id, subscription.topic_id)] = subscription
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump([s.model_dump(mode="json") for s in self._subscriptions.values()], f)
+        os.replace(tmp_path, self.path)
+
+    def subscriptions(self) -> List[LiveSubscription]:
+        return list(self._subscriptions.values())
+
+    def subscribe(self, chat_id: int, topic_id: Optional[int] = None) -> LiveSubscription:
+        key = (chat_id, topic_id)
+        if key not in self._subscriptions:
+            self._subscriptions[key] = LiveSubscription(
+                chat_id=chat_id,
+                topic_id=topic_id,
+                created_at=datetime.utcnow()
+            )
+            self._save()
+        return self._subscriptions[key]
+
+    def unsubscribe(self, chat_id: int, topic_id: Optional[int] = None) -> bool:
+        if self._subscriptions.pop((chat_id, topic_id), None) is None:
+            return False
+        self._save()
+        return True
+
+    def attach(self, service: TelegramService):
+        """Слушать новые и изменённые сообщения аккаунта"""
+        async def on_message(event):
+            await self._on_message(service, event)
+
+        service.client.add_event_handler(on_message, events.NewMessage())
+        service.client.add_event_handler(on_message, events.MessageEdited())
+
+    def attach_pool(self, pool: TelegramPool):
+        pool.on_account(self.attach)
+
+    @staticmethod
+    def _message_topic(message) -> Optional[int]:
+        reply_to = message.reply_to
+        if not reply_to or not getattr(reply_to, 'forum_topic', False):
+            return None
+        return reply_to.reply_to_top_id or reply_to.reply_to_msg_id
+
+    async def _on_message(self, service: TelegramService, event):
+        if not self._subscriptions or not event.message.text:
+            return
+        chat_id, _ = utils.resolve_id(event.chat_id)
+
+        # Подписка на топик точнее подписки на весь чат
+        topic_id = self._message_topic(event.message)
+        if topic_id is not None and (chat_id, topic_id) in self._subscriptions:
+            subscribed_topic = topic_id
+        elif (chat_id, None) in self._subscriptions:
+            subscribed_topic = None
+        else:
+            return
+
+        try:
+            entity = await event.get_chat()
+            topic_title = None
+            if subscribed_topic is not None and isinstance(entity, Channel):
+                topic = (await service._get_topics_map(chat_id, entity)).get(subscribed_topic)
+                topic_title = topic.title if topic else None
+
+            chat = HistorySource(
+                getattr(entity, 'title', None) or str(chat_id),
+                getattr(entity, 'username', None),
+                topic_title
+            )
+            message = await service.to_record(event.message, chat_id, subscribed_topic, chat)
+        except Exception as e:
+            print(f"Error reading live message in {chat_id}: {e}")
+            return
+
+        self._add(message)
+
+    def _add(self, message: MessageRecord):
+        if message.point_id not in self._buffer:
+            self._pending.inc()
+        self._buffer[message.point_id] = message
+
+        if len(self._buffer) >= self.settings.live_batch_size:
+            self._start_flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.settings.live_flush_seconds)
+        self._flush_timer = None
+        self._start_flush()
+
+    def _start_flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._buffer:
+            return
+        batch = list(self._buffer.values())
+        self._buffer = {}
+        task = asyncio.create_task(self._index(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _index(self, batch: List[MessageRecord]):
+        try:
+            await get_rag_service().index_messages_batch(batch)
+            schedule_enrichment([m.author_id for m in batch])
+        except Exception as e:
+            print(f"Error indexing live messages: {e}")
+        finally:
+            self._pending.dec(len(batch))
+
+    async def close(self):
+        """Дописать буфер перед остановкой"""
+        self._start_flush()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+
+@lru_cache()
+def get_live_ingestor() -> LiveIngestor:
+    return LiveIngestor()
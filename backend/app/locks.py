@@ -0,0 +1,52 @@
+import fcntl
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+# Пауза между попытками взять занятую блокировку
+LOCK_POLL_INTERVAL = 0.05
+
+
+class LockBusy(Exception):
+    pass
+
+
+async def _flock(f, mode: int, wait: bool):
+    # Без блокирующего вызова: ожидание не занимает ни цикл событий, ни пул потоков
+    while True:
+        try:
+            fcntl.flock(f, mode | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            if not wait:
+                raise LockBusy(f.name)
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+
+class FileLock:
+    """Блокировка на flock: действует между процессами и между задачами одного процесса.
+
+    Эксклюзивная блокировка сначала занимает шлюз, после чего новые
+    разделяемые не выдаются - поток ингеста не может отодвигать её бесконечно.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.gate_path = path + ".gate"
+
+    @asynccontextmanager
+    async def shared(self) -> AsyncIterator[None]:
+        with open(self.path, "a") as f:
+            with open(self.gate_path, "a") as gate:
+                await _flock(gate, fcntl.LOCK_SH, True)
+                await _flock(f, fcntl.LOCK_SH, True)
+            yield
+
+    @asynccontextmanager
+    async def exclusive(self, wait: bool = True) -> AsyncIterator[None]:
+        """Эксклюзивно; wait=False - сразу LockBusy, если занято"""
+        with open(self.gate_path, "a") as gate, open(self.path, "a") as f:
+            await _flock(gate, fcntl.LOCK_EX, wait)
+            await _flock(f, fcntl.LOCK_EX, wait)
+            yield
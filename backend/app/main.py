@@ -1,17 +1,47 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.routes import chats, messages, rag
-from app.telegram_client import telegram_service
+from prometheus_client import CONTENT_TYPE_LATEST
+from app.config import get_settings
+from app.metrics import render_metrics, mark_process_dead
+from app.routes import chats, messages, rag, snapshots
+from app.rag_service import get_rag_service
+from app.telegram_pool import get_telegram_pool
+from app.worker import Worker
+from app.live import get_live_ingestor
+from app.admission import AdmissionMiddleware
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    await telegram_service.connect()
+    settings = get_settings()
+    rag_service = get_rag_service()
+    if settings.role == "api":
+        # Без сессии Telegram: ингест и вызовы Telegram выполняет воркер
+        await rag_service.init(load_contacts=False)
+        yield
+        await rag_service.close()
+        mark_process_dead()
+        return
+
+    telegram_pool = get_telegram_pool()
+    await rag_service.init()
+    await telegram_pool.connect()
+    live = get_live_ingestor()
+    live.attach_pool(telegram_pool)
+    # Разовый перенос сообщений из Qdrant в локальный архив
+    legacy_import = asyncio.create_task(rag_service.import_legacy_messages())
+    worker = asyncio.create_task(Worker(settings.worker_concurrency).run())
     yield
     # Shutdown
-    await telegram_service.disconnect()
+    worker.cancel()
+    await asyncio.gather(worker, return_exceptions=True)
+    await legacy_import
+    await live.close()
+    await telegram_pool.disconnect()
+    await rag_service.close()
 
 
 app = FastAPI(
@@ -21,6 +51,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Ограничение параллельности тяжёлых маршрутов; добавляется до CORS,
+# чтобы ответы 429 тоже получали CORS-заголовки
+app.add_middleware(AdmissionMiddleware, settings=get_settings())
+
 # CORS для фронтенда
 app.add_middleware(
     CORSMiddleware,
@@ -34,6 +68,7 @@ app.add_middleware(
 app.include_router(chats.router)
 app.include_router(messages.router)
 app.include_router(rag.router)
+app.include_router(snapshots.router)
 
 
 @app.get("/")
@@ -48,3 +83,9 @@ async def root():
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в формате Prometheus"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,719 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from app.records import MessageRecord
+
+
+# Колонки архива в порядке хранения
+COLUMNS = (
+    "point_id", "message_id", "chat_id", "chat_title", "chat_username",
+    "topic_id", "topic_title", "author_id", "author_username",
+    "author_first_name", "author_last_name", "text", "date",
+    "reply_to_msg_id", "views", "forwards", "author_is_bot"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    point_id TEXT PRIMARY KEY,
+    message_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    chat_title TEXT,
+    chat_username TEXT,
+    topic_id INTEGER,
+    topic_title TEXT,
+    author_id INTEGER NOT NULL,
+    author_username TEXT,
+    author_first_name TEXT,
+    author_last_name TEXT,
+    text TEXT NOT NULL,
+    date TEXT NOT NULL,
+    reply_to_msg_id INTEGER,
+    views INTEGER,
+    forwards INTEGER,
+    author_is_bot INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages (message_id);
+CREATE INDEX IF NOT EXISTS idx_messages_topic_id ON messages (topic_id);
+CREATE INDEX IF NOT EXISTS idx_messages_author_id ON messages (author_id);
+CREATE INDEX IF NOT EXISTS idx_messages_reply_to ON messages (reply_to_msg_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS unindexed (
+    point_id TEXT PRIMARY KEY
+);
+"""
+
+# Номер изменения строки: растёт при каждой вставке и правке, по нему
+# читают с чекпоинта (rowid не меняется при правке и переиспользуется после удаления)
+SEQ_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_messages_updated_seq ON messages (updated_seq);
+"""
+
+# Сколько байт каждого файла отображать в память
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Размер порции при удалении топика, чтобы не держать блокировку надолго
+DELETE_CHUNK = 10000
+
+# Сколько сообщений-якорей берёт один запрос контекста (лимит составного SELECT)
+CONTEXT_CHUNK = 100
+
+
+def point_id_chat(point_id: str) -> int:
+    """Достать chat_id из point_id вида chat_topic_message / chat_message"""
+    return int(point_id.split("_", 1)[0])
+
+
+class MessageArchive:
+    """Локальный архив сообщений: отдельный SQLite-файл на каждый чат"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self._connections: Dict[int, sqlite3.Connection] = {}
+        # inode файла, который открыт соединением: партицию может удалить и
+        # создать заново другой процесс
+        self._inodes: Dict[int, int] = {}
+        self._lock = threading.RLock()
+
+    def _partition_path(self, chat_id: int) -> str:
+        return os.path.join(self.root, f"{chat_id}.sqlite")
+
+    def _connect(self, chat_id: int, create: bool = True) -> Optional[sqlite3.Connection]:
+        path = self._partition_path(chat_id)
+        conn = self._connections.get(chat_id)
+        if conn is not None:
+            try:
+                inode = os.stat(path).st_ino
+            except FileNotFoundError:
+                inode = None
+            if inode == self._inodes[chat_id]:
+                return conn
+            # Файл удалён (и, возможно, создан заново) другим процессом:
+            # старое соединение читает уже отвязанный файл
+            conn.close()
+            del self._connections[chat_id]
+
+        if not create and not os.path.exists(path):
+            return None
+
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        conn.executescript(SEQ_SCHEMA)
+        self._connections[chat_id] = conn
+        self._inodes[chat_id] = os.stat(path).st_ino
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+        if "author_is_bot" not in columns:
+            # У скачанных раньше сообщений флаг неизвестен (NULL - не бот)
+            with conn:
+                conn.execute("ALTER TABLE messages ADD COLUMN author_is_bot INTEGER")
+        if "updated_seq" not in columns:
+            # Партиция старого формата: номера изменений продолжают rowid,
+            # так сохранённые позиции чекпоинтов остаются верными
+            with conn:
+                conn.execute("ALTER TABLE messages ADD COLUMN updated_seq INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE messages SET updated_seq = rowid")
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) "
+                    "SELECT 'updated_seq', COALESCE(MAX(rowid), 0) FROM messages"
+                )
+
+    @staticmethod
+    def _next_seq(conn: sqlite3.Connection, count: int) -> int:
+        """Зарезервировать count номеров изменений; возвращает первый.
+
+        Номера не меньше текущего времени в микросекундах, поэтому и у
+        пересозданной после удаления партиции они больше прежних.
+        """
+        row = conn.execute("SELECT value FROM meta WHERE key = 'updated_seq'").fetchone()
+        first = max((row[0] if row else 0) + 1, time.time_ns() // 1000)
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('updated_seq', ?)",
+            (first + count - 1,)
+        )
+        return first
+
+    def chat_ids(self) -> List[int]:
+        """ID чатов, для которых есть партиция"""
+        ids = []
+        for name in os.listdir(self.root):
+            if name.endswith(".sqlite"):
+                try:
+                    ids.append(int(name[:-len(".sqlite")]))
+                except ValueError:
+                    continue
+        return sorted(ids)
+
+    def is_empty(self) -> bool:
+        return not self.chat_ids()
+
+    @staticmethod
+    def _to_row(record: MessageRecord) -> tuple:
+        return (
+            record.point_id, record.id, record.chat_id, record.chat_title,
+            record.chat_username, record.topic_id, record.topic_title,
+            record.author_id, record.author_username,
+            record.author_first_name, record.author_last_name,
+            record.text, record.date.isoformat(), record.reply_to_msg_id,
+            record.views, record.forwards, record.author_is_bot
+        )
+
+    @staticmethod
+    def _row_to_record(row: tuple) -> MessageRecord:
+        (_, message_id, chat_id, chat_title, chat_username, topic_id, topic_title,
+         author_id, author_username, author_first_name, author_last_name,
+         text, date, reply_to_msg_id, views, forwards, author_is_bot) = row
+        return MessageRecord(
+            id=message_id,
+            chat_id=chat_id,
+            chat_title=chat_title,
+            author_id=author_id,
+            text=text,
+            date=datetime.fromisoformat(date),
+            chat_username=chat_username,
+            topic_id=topic_id,
+            topic_title=topic_title,
+            author_username=author_username,
+            author_first_name=author_first_name,
+            author_last_name=author_last_name,
+            reply_to_msg_id=reply_to_msg_id,
+            views=views,
+            forwards=forwards,
+            author_is_bot=None if author_is_bot is None else bool(author_is_bot)
+        )
+
+    @staticmethod
+    def _row_to_dict(row: tuple) -> dict:
+        """Строка архива -> dict в формате TelegramMessage.model_dump()"""
+        data = dict(zip(COLUMNS, row))
+        return {
+            "id": data["message_id"],
+            "chat_id": data["chat_id"],
+            "chat_title": data["chat_title"],
+            "chat_username": data["chat_username"],
+            "topic_id": data["topic_id"],
+            "topic_title": data["topic_title"],
+            "author": {
+                "id": data["author_id"],
+                "username": data["author_username"],
+                "first_name": data["author_first_name"],
+                "last_name": data["author_last_name"]
+            },
+            "text": data["text"],
+            "date": data["date"],
+            "reply_to_msg_id": data["reply_to_msg_id"],
+            "views": data["views"],
+            "forwards": data["forwards"]
+        }
+
+    def _write_rows(self, conn: sqlite3.Connection, rows: List[tuple]):
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        # Повторная загрузка обновляет изменяемые поля, остальное неизменно;
+        # номер изменения сдвигается, только если что-то действительно поменялось
+        sql = (
+            f"INSERT INTO messages ({', '.join(COLUMNS)}, updated_seq) VALUES ({placeholders}, ?) "
+            "ON CONFLICT(point_id) DO UPDATE SET "
+            "text=excluded.text, views=excluded.views, forwards=excluded.forwards, "
+            "chat_title=excluded.chat_title, topic_title=excluded.topic_title, "
+            "author_is_bot=COALESCE(excluded.author_is_bot, author_is_bot), "
+            "updated_seq=excluded.updated_seq "
+            "WHERE text IS NOT excluded.text OR views IS NOT excluded.views "
+            "OR forwards IS NOT excluded.forwards OR chat_title IS NOT excluded.chat_title "
+            "OR topic_title IS NOT excluded.topic_title "
+            "OR (excluded.author_is_bot IS NOT NULL AND author_is_bot IS NOT excluded.author_is_bot)"
+        )
+        first = self._next_seq(conn, len(rows))
+        conn.executemany(sql, [row + (first + i,) for i, row in enumerate(rows)])
+
+    def append(self, records: List[MessageRecord]) -> int:
+        """Записать сообщения"""
+        by_chat: Dict[int, List[tuple]] = {}
+        for record in records:
+            by_chat.setdefault(record.chat_id, []).append(self._to_row(record))
+
+        written = 0
+        with self._lock:
+            for chat_id, rows in by_chat.items():
+                conn = self._connect(chat_id)
+                with conn:
+                    self._write_rows(conn, rows)
+                written += len(rows)
+        return written
+
+    def append_tracked(
+        self,
+        records: List[MessageRecord]
+    ) -> Tuple[Dict[str, Tuple[Optional[int], Optional[int]]], Dict[str, int], Dict[str, int]]:
+        """Записать сообщения и вернуть данные для приращений статистики авторов.
+
+        Чтение и запись - одна транзакция на партицию, поэтому параллельные
+        батчи с одними и теми же сообщениями не учитываются дважды.
+        Возвращает (previous, reply_authors, replies): views/forwards уже
+        бывших в архиве сообщений, авторов сообщений, на которые отвечают
+        записи, и число ранее сохранённых ответов других авторов на новые
+        сообщения (история качается от новых к старым - ответы приходят
+        раньше родителя).
+        """
+        by_chat: Dict[int, List[MessageRecord]] = {}
+        for record in records:
+            by_chat.setdefault(record.chat_id, []).append(record)
+
+        previous: Dict[str, Tuple[Optional[int], Optional[int]]] = {}
+        reply_authors: Dict[str, int] = {}
+        replies: Dict[str, int] = {}
+        with self._lock:
+            for chat_id, chat_records in by_chat.items():
+                conn = self._connect(chat_id)
+                with conn:
+                    # Сразу блокировка записи: другой процесс не вклинится между чтением и записью
+                    conn.execute("BEGIN IMMEDIATE")
+                    point_ids = [r.point_id for r in chat_records]
+                    placeholders = ", ".join("?" for _ in point_ids)
+                    for point_id, views, forwards in conn.execute(
+                        f"SELECT point_id, views, forwards FROM messages WHERE point_id IN ({placeholders})",
+                        point_ids
+                    ):
+                        previous[point_id] = (views, forwards)
+
+                    new = [r for r in chat_records if r.point_id not in previous]
+                    if new:
+                        message_ids = list({r.id for r in new})
+                        placeholders = ", ".join("?" for _ in message_ids)
+                        children: Dict[int, Dict[int, int]] = {}
+                        for parent_id, author_id, count in conn.execute(
+                            "SELECT reply_to_msg_id, author_id, COUNT(*) FROM messages "
+                            f"WHERE reply_to_msg_id IN ({placeholders}) GROUP BY reply_to_msg_id, author_id",
+                            message_ids
+                        ):
+                            children.setdefault(parent_id, {})[author_id] = count
+                        for record in new:
+                            count = sum(
+                                n for author_id, n in children.get(record.id, {}).items()
+                                if author_id != record.author_id
+                            )
+                            if count:
+                                replies[record.point_id] = count
+
+                    self._write_rows(conn, [self._to_row(r) for r in chat_records])
+
+                    # После записи - чтобы найти и родителей из этого же батча
+                    answering = [r for r in chat_records if r.reply_to_msg_id]
+                    if answering:
+                        parent_ids = list({r.reply_to_msg_id for r in answering})
+                        placeholders = ", ".join("?" for _ in parent_ids)
+                        authors = dict(conn.execute(
+                            f"SELECT message_id, author_id FROM messages WHERE message_id IN ({placeholders})",
+                            parent_ids
+                        ).fetchall())
+                        for record in answering:
+                            if record.reply_to_msg_id in authors:
+                                reply_authors[record.point_id] = authors[record.reply_to_msg_id]
+        return previous, reply_authors, replies
+
+    def mark_unindexed(self, point_ids: List[str]):
+        """Запомнить сообщения, которые сохранены в архиве, но не попали в индекс"""
+        by_chat: Dict[int, List[str]] = {}
+        for point_id in point_ids:
+            by_chat.setdefault(point_id_chat(point_id), []).append(point_id)
+
+        with self._lock:
+            for chat_id, ids in by_chat.items():
+                conn = self._connect(chat_id, create=False)
+                if conn is None:
+                    continue
+                with conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO unindexed (point_id) VALUES (?)",
+                        [(point_id,) for point_id in ids]
+                    )
+
+    def unindexed(self, limit: int) -> List[MessageRecord]:
+        """Не больше limit сообщений, ждущих повторной индексации"""
+        records: List[MessageRecord] = []
+        with self._lock:
+            for chat_id in self.chat_ids():
+                if len(records) >= limit:
+                    break
+                conn = self._connect(chat_id, create=False)
+                if conn is None:
+                    continue
+                with conn:
+                    # Отметки удалённых с тех пор сообщений (удаление топика) не нужны
+                    conn.execute(
+                        "DELETE FROM unindexed WHERE point_id NOT IN (SELECT point_id FROM messages)"
+                    )
+                rows = conn.execute(
+                    f"SELECT {', '.join('m.' + c for c in COLUMNS)} FROM unindexed u "
+                    "JOIN messages m ON m.point_id = u.point_id LIMIT ?",
+                    (limit - len(records),)
+                ).fetchall()
+                records.extend(self._row_to_record(row) for row in rows)
+        return records
+
+    def clear_unindexed(self, point_ids: Optional[List[str]] = None):
+        """Снять отметки с проиндексированных сообщений (None - со всех)"""
+        with self._lock:
+            if point_ids is None:
+                for chat_id in self.chat_ids():
+                    conn = self._connect(chat_id, create=False)
+                    if conn is not None:
+                        with conn:
+                            conn.execute("DELETE FROM unindexed")
+                return
+
+            by_chat: Dict[int, List[str]] = {}
+            for point_id in point_ids:
+                by_chat.setdefault(point_id_chat(point_id), []).append(point_id)
+            for chat_id, ids in by_chat.items():
+                conn = self._connect(chat_id, create=False)
+                if conn is None:
+                    continue
+                with conn:
+                    conn.executemany(
+                        "DELETE FROM unindexed WHERE point_id = ?",
+                        [(point_id,) for point_id in ids]
+                    )
+
+    def get_many(self, point_ids: List[str]) -> Dict[str, dict]:
+        """Получить сообщения по point_id одним запросом на партицию"""
+        by_chat: Dict[int, List[str]] = {}
+        for point_id in point_ids:
+            by_chat.setdefault(point_id_chat(point_id), []).append(point_id)
+
+        found = {}
+        with self._lock:
+            for chat_id, ids in by_chat.items():
+                conn = self._connect(chat_id, create=False)
+                if conn is None:
+                    continue
+                placeholders = ", ".join("?" for _ in ids)
+                rows = conn.execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM messages WHERE point_id IN ({placeholders})",
+                    ids
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = self._row_to_dict(row)
+        return found
+
+    @staticmethod
+    def _context_query(point_ids: List[str], depth: int, neighbours: int) -> Tuple[str, list]:
+        columns = ", ".join(f"m.{c}" for c in COLUMNS)
+        placeholders = ", ".join("?" for _ in point_ids)
+        # Граф ответов: reply_to_msg_id -> message_id внутри партиции чата
+        parts = [
+            f"SELECT chain.anchor, 'parents', -chain.depth, {columns} "
+            "FROM chain JOIN messages m ON m.message_id = chain.message_id "
+            "WHERE chain.depth > 0"
+        ]
+        params: list = [*point_ids, depth]
+        if neighbours:
+            for op, order in (("<", "DESC"), (">", "ASC")):
+                for point_id in point_ids:
+                    parts.append(
+                        f"SELECT * FROM (SELECT ?, 'context', m.message_id, {columns} "
+                        "FROM messages m, messages a WHERE a.point_id = ? "
+                        f"AND m.topic_id IS a.topic_id AND m.message_id {op} a.message_id "
+                        f"ORDER BY m.message_id {order} LIMIT ?)"
+                    )
+                    params.extend((point_id, point_id, neighbours))
+        sql = (
+            "WITH RECURSIVE chain(anchor, message_id, reply_to, depth) AS ("
+            f"SELECT point_id, message_id, reply_to_msg_id, 0 FROM messages WHERE point_id IN ({placeholders}) "
+            "UNION "
+            "SELECT chain.anchor, m.message_id, m.reply_to_msg_id, chain.depth + 1 "
+            "FROM chain JOIN messages m ON m.message_id = chain.reply_to "
+            "WHERE chain.depth < ?) "
+            + " UNION ALL ".join(parts)
+        )
+        return sql, params
+
+    def contexts(self, point_ids: List[str], depth: int, neighbours: int) -> Dict[str, dict]:
+        """Цепочка родителей по ответам и соседние сообщения для каждого point_id.
+
+        Один запрос на партицию. parents - от корня ветки к прямому родителю,
+        context - соседи из того же топика в порядке сообщений.
+        """
+        by_chat: Dict[int, List[str]] = {}
+        for point_id in point_ids:
+            by_chat.setdefault(point_id_chat(point_id), []).append(point_id)
+
+        ordered: Dict[str, Dict[str, dict]] = {
+            point_id: {"parents": {}, "context": {}} for point_id in point_ids
+        }
+        with self._lock:
+            for chat_id, ids in by_chat.items():
+                conn = self._connect(chat_id, create=False)
+                if conn is None:
+                    continue
+                for i in range(0, len(ids), CONTEXT_CHUNK):
+                    sql, params = self._context_query(ids[i:i+CONTEXT_CHUNK], depth, neighbours)
+                    for anchor, kind, order, *row in conn.execute(sql, params).fetchall():
+                        # Одно сообщение может лежать в нескольких топиках - берём один раз
+                        ordered[anchor][kind].setdefault(order, self._row_to_dict(tuple(row)))
+
+        return {
+            point_id: {
+                kind: [messages[order] for order in sorted(messages)]
+                for kind, messages in kinds.items()
+            }
+            for point_id, kinds in ordered.items()
+        }
+
+    def counters(self, point_ids: List[str]) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+        """views и forwards уже записанных сообщений (для приращений статистики)"""
+        by_chat: Dict[int, List[str]] = {}
+        for point_id in point_ids:
+            by_chat.setdefault(point_id_chat(point_id), []).append(point_id)
+
+        found = {}
+        with self._lock:
+            for chat_id, ids in by_chat.items():
+                conn = self._connect(chat_id, create=False)
+                if conn is None:
+                    continue
+                placeholders = ", ".join("?" for _ in ids)
+                rows = conn.execute(
+                    f"SELECT point_id, views, forwards FROM messages WHERE point_id IN ({placeholders})",
+                    ids
+                ).fetchall()
+                for point_id, views, forwards in rows:
+                    found[point_id] = (views, forwards)
+        return found
+
+    def author_aggregates(
+        self,
+        author_ids: Optional[List[int]] = None
+    ) -> Iterator[Tuple[int, List[tuple], List[tuple]]]:
+        """Признаки авторов по каждой партиции: (chat_id, messages, replies).
+
+        messages - (author_id, username, first_name, last_name, count,
+        replies_sent, views, forwards, first, last),
+        replies - (author_id, replies_received) без ответов самому себе.
+        """
+        where, params = "", []
+        if author_ids is not None:
+            where = f"WHERE author_id IN ({', '.join('?' for _ in author_ids)})"
+            params = list(author_ids)
+        for chat_id in self.chat_ids():
+            with self._lock:
+                conn = self._connect(chat_id, create=False)
+                if conn is None:
+                    continue
+                messages = conn.execute(
+                    "SELECT author_id, MAX(author_username), MAX(author_first_name), "
+                    "MAX(author_last_name), COUNT(*), COUNT(reply_to_msg_id), "
+                    "COALESCE(SUM(views), 0), COALESCE(SUM(forwards), 0), MIN(date), MAX(date) "
+                    f"FROM messages {where} GROUP BY author_id",
+                    params
+                ).fetchall()
+                replies = conn.execute(
+                    "SELECT p.author_id, COUNT(*) FROM messages c "
+                    "JOIN messages p ON p.message_id = c.reply_to_msg_id "
+                    "WHERE p.author_id != c.author_id "
+                    + (f"AND p.author_id IN ({', '.join('?' for _ in author_ids)}) " if author_ids is not None else "")
+                    + "GROUP BY p.author_id",
+                    params
+                ).fetchall()
+            yield chat_id, messages, replies
+
+    def iter_messages(
+        self,
+        chat_id: Optional[int] = None,
+        batch_size: int = 1000
+    ) -> Iterator[List[dict]]:
+        """Читать архив батчами (по всем чатам или по одному)"""
+        chat_ids = [chat_id] if chat_id is not None else self.chat_ids()
+        for cid in chat_ids:
+            for _, batch in self.iter_batches(cid, batch_size=batch_size):
+                yield batch
+
+    def iter_batches(
+        self,
+        chat_id: int,
+        after_seq: int = 0,
+        batch_size: int = 1000
+    ) -> Iterator[Tuple[int, List[dict]]]:
+        """Читать партицию в порядке изменений начиная после after_seq.
+
+        Вместе с батчем отдаётся номер изменения последней строки - по нему
+        можно продолжить чтение (чекпоинт); правки попадают после него.
+        """
+        for last_seq, rows in self._iter_rows(chat_id, after_seq, batch_size):
+            yield last_seq, [self._row_to_dict(row) for row in rows]
+
+    def iter_records(
+        self,
+        chat_id: int,
+        after_seq: int = 0,
+        batch_size: int = 1000
+    ) -> Iterator[Tuple[int, List[MessageRecord]]]:
+        """Как iter_batches, но записями для переиндексации"""
+        for last_seq, rows in self._iter_rows(chat_id, after_seq, batch_size):
+            yield last_seq, [self._row_to_record(row) for row in rows]
+
+    def _iter_rows(
+        self,
+        chat_id: int,
+        after_seq: int,
+        batch_size: int
+    ) -> Iterator[Tuple[int, List[tuple]]]:
+        last_seq = after_seq
+        while True:
+            with self._lock:
+                conn = self._connect(chat_id, create=False)
+                if conn is None:
+                    return
+                rows = conn.execute(
+                    f"SELECT updated_seq, {', '.join(COLUMNS)} FROM messages "
+                    "WHERE updated_seq > ? ORDER BY updated_seq LIMIT ?",
+                    (last_seq, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_seq = rows[-1][0]
+            yield last_seq, [row[1:] for row in rows]
+
+    def sources(self) -> List[dict]:
+        """Источники: чат/топик с количеством сообщений"""
+        result = []
+        with self._lock:
+            for chat_id in self.chat_ids():
+                conn = self._connect(chat_id, create=False)
+                rows = conn.execute(
+                    "SELECT topic_id, MAX(chat_title), MAX(topic_title), COUNT(*) "
+                    "FROM messages GROUP BY topic_id"
+                ).fetchall()
+                for topic_id, chat_title, topic_title, count in rows:
+                    result.append({
+                        "chat_id": chat_id,
+                        "chat_title": chat_title or str(chat_id),
+                        "topic_id": topic_id,
+                        "topic_title": topic_title,
+                        "messages_count": count
+                    })
+        return result
+
+    def count(self, chat_id: Optional[int] = None, topic_id: Optional[int] = None) -> int:
+        chat_ids = [chat_id] if chat_id is not None else self.chat_ids()
+        total = 0
+        with self._lock:
+            for cid in chat_ids:
+                conn = self._connect(cid, create=False)
+                if conn is None:
+                    continue
+                if topic_id is not None:
+                    row = conn.execute(
+                        "SELECT COUNT(*) FROM messages WHERE topic_id = ?", (topic_id,)
+                    ).fetchone()
+                else:
+                    row = conn.execute("SELECT COUNT(*) FROM messages").fetchone()
+                total += row[0]
+        return total
+
+    def message_id_range(self, chat_id: int, topic_id: Optional[int] = None) -> Tuple[Optional[int], Optional[int]]:
+        """Наименьший и наибольший id сообщений чата/топика в архиве"""
+        with self._lock:
+            conn = self._connect(chat_id, create=False)
+            if conn is None:
+                return None, None
+            if topic_id is not None:
+                row = conn.execute(
+                    "SELECT MIN(message_id), MAX(message_id) FROM messages WHERE topic_id = ?", (topic_id,)
+                ).fetchone()
+            else:
+                row = conn.execute("SELECT MIN(message_id), MAX(message_id) FROM messages").fetchone()
+        return row[0], row[1]
+
+    def author_ids(self, chat_id: int, topic_id: Optional[int] = None) -> Set[int]:
+        """Авторы сообщений в чате/топике"""
+        with self._lock:
+            conn = self._connect(chat_id, create=False)
+            if conn is None:
+                return set()
+            if topic_id is not None:
+                rows = conn.execute(
+                    "SELECT DISTINCT author_id FROM messages WHERE topic_id = ?", (topic_id,)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT DISTINCT author_id FROM messages").fetchall()
+        return {row[0] for row in rows}
+
+    def authors_with_messages(self, author_ids: Set[int]) -> Set[int]:
+        """Какие из авторов ещё имеют сообщения хоть в одном чате"""
+        remaining = set(author_ids)
+        found: Set[int] = set()
+        for chat_id in self.chat_ids():
+            if not remaining:
+                break
+            ids = list(remaining)
+            with self._lock:
+                conn = self._connect(chat_id, create=False)
+                if conn is None:
+                    continue
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i+500]
+                    placeholders = ", ".join("?" for _ in chunk)
+                    rows = conn.execute(
+                        f"SELECT DISTINCT author_id FROM messages WHERE author_id IN ({placeholders})",
+                        chunk
+                    ).fetchall()
+                    found.update(row[0] for row in rows)
+            remaining -= found
+        return found
+
+    def delete(
+        self,
+        chat_id: int,
+        topic_id: Optional[int] = None,
+        on_progress: Optional[Callable[[int], None]] = None
+    ) -> int:
+        """Удалить топик или всю партицию чата; возвращает число удалённых сообщений"""
+        if topic_id is not None:
+            deleted = 0
+            while True:
+                with self._lock:
+                    conn = self._connect(chat_id, create=False)
+                    if conn is None:
+                        return deleted
+                    with conn:
+                        cursor = conn.execute(
+                            "DELETE FROM messages WHERE rowid IN ("
+                            "SELECT rowid FROM messages WHERE topic_id = ? LIMIT ?)",
+                            (topic_id, DELETE_CHUNK)
+                        )
+                if cursor.rowcount <= 0:
+                    return deleted
+                deleted += cursor.rowcount
+                if on_progress:
+                    on_progress(cursor.rowcount)
+
+        with self._lock:
+            conn = self._connect(chat_id, create=False)
+            if conn is None:
+                return 0
+
+            deleted = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            conn.close()
+            del self._connections[chat_id]
+            del self._inodes[chat_id]
+            # Другие процессы заметят смену inode в _connect и откроют файл заново
+            path = self._partition_path(chat_id)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        if on_progress:
+            on_progress(deleted)
+        return deleted
@@ -0,0 +1,178 @@
+import os
+import time
+import inspect
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, generate_latest, multiprocess
+)
+
+
+# Несколько процессов API (uvicorn --workers) пишут метрики в общий каталог
+# PROMETHEUS_MULTIPROC_DIR; режим gauge задаёт, как складывать значения процессов
+
+# Границы для сетевых вызовов: от миллисекунд до минуты
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+TELEGRAM_REQUEST_SECONDS = Histogram(
+    "tg_telegram_request_seconds",
+    "Latency of Telegram calls",
+    ["method"],
+    buckets=LATENCY_BUCKETS
+)
+TELEGRAM_MESSAGES = Counter(
+    "tg_telegram_messages_total",
+    "Messages read from Telegram history"
+)
+TELEGRAM_FLOOD_WAIT_SECONDS = Counter(
+    "tg_telegram_flood_wait_seconds_total",
+    "Flood wait imposed by Telegram",
+    ["account"]
+)
+
+OPENAI_REQUEST_SECONDS = Histogram(
+    "tg_openai_request_seconds",
+    "Latency of OpenAI API calls",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS
+)
+OPENAI_RETRIES = Counter(
+    "tg_openai_retries_total",
+    "Retried OpenAI API calls",
+    ["endpoint", "reason"]
+)
+OPENAI_CIRCUIT_OPEN = Gauge(
+    "tg_openai_circuit_open",
+    "Whether the OpenAI endpoint circuit breaker is open",
+    ["endpoint"],
+    multiprocess_mode="livemax"
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "tg_embedding_batch_size",
+    "Texts per embeddings request",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2048)
+)
+INGEST_FILTERED = Counter(
+    "tg_ingest_filtered_total",
+    "Messages archived but not embedded by ingest filters",
+    ["reason"]
+)
+EMBEDDING_TOKENS = Counter(
+    "tg_embedding_tokens_total",
+    "Tokens sent to the embeddings API"
+)
+
+QDRANT_REQUEST_SECONDS = Histogram(
+    "tg_qdrant_request_seconds",
+    "Latency of Qdrant calls",
+    ["operation"],
+    buckets=LATENCY_BUCKETS
+)
+
+SEARCH_SECONDS = Histogram(
+    "tg_search_seconds",
+    "End-to-end search latency",
+    ["kind"],
+    buckets=LATENCY_BUCKETS
+)
+
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "tg_admission_queue_seconds",
+    "Time requests waited for an admission slot",
+    ["route"],
+    buckets=LATENCY_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    "tg_admission_rejected_total",
+    "Requests rejected with 429 by admission control",
+    ["route", "reason"]
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "tg_admission_in_flight",
+    "Requests holding an admission slot",
+    ["route"],
+    multiprocess_mode="livesum"
+)
+
+QUEUE_DEPTH = Gauge(
+    "tg_queue_depth",
+    "Items waiting in internal queues",
+    ["queue"],
+    multiprocess_mode="livesum"
+)
+
+CACHE_REQUESTS = Counter(
+    "tg_cache_requests_total",
+    "Cache lookups",
+    ["cache", "result"]
+)
+CACHE_HIT_RATIO = Gauge(
+    "tg_cache_hit_ratio",
+    "Share of cache lookups served from cache since start",
+    ["cache"],
+    multiprocess_mode="liveall"
+)
+
+_cache_counts = {}
+
+
+def record_cache(cache: str, hit: bool):
+    """Учесть обращение к кэшу и обновить долю попаданий"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+    hits, total = _cache_counts.get(cache, (0, 0))
+    hits, total = hits + int(hit), total + 1
+    _cache_counts[cache] = (hits, total)
+    CACHE_HIT_RATIO.labels(cache).set(hits / total)
+
+
+class InstrumentedClient:
+    """Прокси клиента: время каждого вызова метода пишется в histogram.
+
+    Имя метода становится значением первого label; поддерживает и
+    синхронные, и асинхронные клиенты.
+    """
+
+    def __init__(self, client, histogram: Histogram):
+        self._client = client
+        self._histogram = histogram
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        histogram = self._histogram.labels(name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception:
+                histogram.observe(time.perf_counter() - start)
+                raise
+            if inspect.isawaitable(result):
+                return _observe_awaitable(result, histogram, start)
+            histogram.observe(time.perf_counter() - start)
+            return result
+
+        return timed
+
+
+async def _observe_awaitable(awaitable, histogram, start: float):
+    try:
+        return await awaitable
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def render_metrics() -> bytes:
+    """Метрики процесса, а в многопроцессном режиме - сумма по всем процессам API"""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead():
+    """Убрать live-gauge завершившегося процесса из многопроцессных метрик"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 from enum import Enum
 
@@ -99,6 +99,11 @@ class ContactInfo(BaseModel):
         return " ".join(p for p in parts if p).strip() or f"User {self.id}"
 
 
+class DownloadMode(str, Enum):
+    NORMAL = "normal"
+    BACKFILL = "backfill"  # вся история через takeout-сессию
+
+
 class DownloadSettings(BaseModel):
     chat_id: int
     topic_id: Optional[int] = None
@@ -107,6 +112,32 @@ class DownloadSettings(BaseModel):
     page: int = 1
     min_id: int = 0
     max_id: int = 0
+    mode: DownloadMode = DownloadMode.NORMAL
+
+
+class LiveSubscription(BaseModel):
+    """Чат (или топик), новые сообщения которого индексируются сразу"""
+    chat_id: int
+    topic_id: Optional[int] = None
+    created_at: datetime
+
+
+class IngestFilterRules(BaseModel):
+    """Правила отбора сообщений для эмбеддинга; None - правило не задано"""
+    min_length: Optional[int] = None
+    # Тексты целиком ("+", "спасибо"), сравниваются без регистра и знаков по краям
+    stop_list: Optional[List[str]] = None
+    # Регулярные выражения; совпадение где угодно в тексте отбрасывает сообщение
+    patterns: Optional[List[str]] = None
+    # Допустимые языки (ru, uk, be, kk, en); пусто - любые
+    languages: Optional[List[str]] = None
+    exclude_bots: Optional[bool] = None
+
+
+class IngestFilterConfig(BaseModel):
+    """Общие правила и переопределения по чатам (заданные поля заменяют общие)"""
+    default: IngestFilterRules = IngestFilterRules()
+    chats: Dict[int, IngestFilterRules] = {}
 
 
 class DownloadStatus(BaseModel):
@@ -117,6 +148,38 @@ class DownloadStatus(BaseModel):
     error: Optional[str] = None
 
 
+class JobInfo(BaseModel):
+    """Фоновая задача (удаление, переиндексация и т.п.)"""
+    id: str
+    kind: str
+    status: str = "pending"  # pending / running / completed / failed
+    stage: Optional[str] = None
+    done: int = 0
+    total: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+class SnapshotInfo(BaseModel):
+    """Снимок индекса; parent - предыдущий снимок, если снимок инкрементальный"""
+    name: str
+    created_at: datetime
+    parent: Optional[str] = None
+    size: int
+    points: int
+    files: int
+
+
+class ReindexRequest(BaseModel):
+    """Параметры переиндексации; пустые поля берутся из настроек"""
+    embedding_model: Optional[str] = None
+    embedding_dim: Optional[int] = None
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+
+
 class RAGSource(BaseModel):
     chat_id: int
     chat_title: str
@@ -129,12 +192,48 @@ class RAGQuery(BaseModel):
     query: str
     sources: List[int]  # chat_ids
     top_k: int = 10
+    # Фильтры применяются внутри Qdrant, до отбора top_k
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    authors: List[int] = []  # author_ids
+    min_views: Optional[int] = None
 
 
 class RAGResult(BaseModel):
     message: TelegramMessage
     score: float
     highlight: Optional[str] = None
+    # Заполняются при with_context: ветка ответов от корня и соседние сообщения
+    parents: List[TelegramMessage] = []
+    context: List[TelegramMessage] = []
+
+
+class SavedSearchCreate(BaseModel):
+    name: str
+    query: str
+    sources: List[int] = []  # chat_ids; пусто - все чаты
+    min_score: float = 0.5
+    min_text_length: int = 50
+    expand_query: bool = True
+
+
+class SavedSearch(BaseModel):
+    """Сохранённый поиск: запрос расширяется и эмбеддится один раз"""
+    id: int
+    name: str
+    query: str
+    expanded_query: str
+    sources: List[int]
+    min_score: float
+    min_text_length: int
+    model: str
+    created_at: datetime
+    unread: int = 0
+
+
+class SavedSearchMatch(RAGResult):
+    matched_at: datetime
+    is_read: bool = False
 
 
 class RAGResponse(BaseModel):
@@ -143,6 +242,25 @@ class RAGResponse(BaseModel):
     total_found: int
 
 
+class AuthorRank(BaseModel):
+    """Признаки автора для ранжирования лидов"""
+    author_id: int
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    messages: int = 0
+    chats: int = 0
+    replies_sent: int = 0
+    replies_received: int = 0
+    views: int = 0
+    forwards: int = 0
+    first_seen: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
+    has_bio: bool = False
+    has_channel: bool = False
+    score: float = 0.0
+
+
 class AuthStatus(BaseModel):
     is_authorized: bool
     phone: Optional[str] = None
@@ -150,6 +268,22 @@ class AuthStatus(BaseModel):
     username: Optional[str] = None
 
 
+class AccountCreate(BaseModel):
+    name: str
+    phone: str
+
+
+class AccountInfo(BaseModel):
+    name: str
+    phone: str
+    is_authorized: bool = False
+    healthy: bool = False
+    flood_until: Optional[datetime] = None
+    active_downloads: int = 0
+    requests: int = 0
+    errors: int = 0
+
+
 class AuthCodeRequest(BaseModel):
     code: str
 
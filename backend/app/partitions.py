@@ -0,0 +1,130 @@
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from qdrant_client.http.models import (
+    PointStruct, HnswConfigDiff,
+    CreateAliasOperation, CreateAlias, DeleteAliasOperation, DeleteAlias
+)
+
+
+# Партиция источника: <коллекция>_chat<chat_id>
+PARTITION_MARK = "_chat"
+
+# Как часто перечитывать список партиций (их создаёт и удаляет другой процесс)
+PARTITIONS_REFRESH_SECONDS = 30.0
+# Не чаще этого перечитываем список при промахе
+PARTITIONS_MISS_REFRESH_SECONDS = 1.0
+
+
+def partition_name(collection: str, chat_id: int) -> str:
+    return f"{collection}{PARTITION_MARK}{chat_id}"
+
+
+def group_by_chat(points: Iterable[PointStruct]) -> Dict[int, List[PointStruct]]:
+    groups: Dict[int, List[PointStruct]] = {}
+    for point in points:
+        groups.setdefault(point.payload["chat_id"], []).append(point)
+    return groups
+
+
+class VectorPartitions:
+    """Векторы сообщений в отдельной коллекции на каждый источник.
+
+    Партиции живой коллекции - alias'ы на партиции её версии, поэтому
+    переиндексация переключает их вместе с основным alias. Сама коллекция
+    версии остаётся пустой и задаёт параметры векторов для новых партиций.
+    """
+
+    def __init__(self, qdrant, prepare: Callable[[str], Awaitable[None]], enabled: bool):
+        self.qdrant = qdrant
+        self.enabled = enabled
+        # Создание индексов payload в новой партиции
+        self._prepare = prepare
+        self._names: Set[str] = set()
+        self._aliases: Dict[str, str] = {}
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _load(self):
+        collections = {c.name for c in (await self.qdrant.get_collections()).collections}
+        self._aliases = {
+            a.alias_name: a.collection_name
+            for a in (await self.qdrant.get_aliases()).aliases
+        }
+        self._names = {n for n in collections | set(self._aliases) if PARTITION_MARK in n}
+        self._loaded_at = time.monotonic()
+
+    async def _refresh(self, force: bool = False):
+        age = time.monotonic() - self._loaded_at
+        if age > PARTITIONS_REFRESH_SECONDS or (force and age > PARTITIONS_MISS_REFRESH_SECONDS):
+            await self._load()
+
+    async def partitions(
+        self,
+        collection: str,
+        chat_ids: Optional[List[int]] = None,
+        refresh: bool = False
+    ) -> Dict[int, str]:
+        """Существующие партиции коллекции: chat_id -> имя"""
+        await self._refresh()
+        if refresh or (chat_ids and any(partition_name(collection, c) not in self._names for c in chat_ids)):
+            # Источник мог появиться недавно
+            await self._refresh(force=True)
+
+        prefix = collection + PARTITION_MARK
+        found = {}
+        for name in self._names:
+            if not name.startswith(prefix):
+                continue
+            try:
+                chat_id = int(name[len(prefix):])
+            except ValueError:
+                continue
+            if chat_ids is None or chat_id in chat_ids:
+                found[chat_id] = name
+        return found
+
+    async def ensure(self, collection: str, chat_id: int) -> str:
+        """Партиция источника; создаётся с параметрами векторов коллекции"""
+        name = partition_name(collection, chat_id)
+        if name in self._names:
+            return name
+        async with self._lock:
+            await self._load()
+            if name in self._names:
+                return name
+
+            target = self._aliases.get(collection)
+            base = target or collection
+            config = (await self.qdrant.get_collection(base)).config
+            physical = partition_name(base, chat_id)
+            await self.qdrant.create_collection(
+                collection_name=physical,
+                vectors_config=config.params.vectors,
+                hnsw_config=HnswConfigDiff(
+                    m=config.hnsw_config.m,
+                    ef_construct=config.hnsw_config.ef_construct
+                )
+            )
+            await self._prepare(physical)
+            if target:
+                await self.qdrant.update_collection_aliases(change_aliases_operations=[
+                    CreateAliasOperation(create_alias=CreateAlias(collection_name=physical, alias_name=name))
+                ])
+                self._aliases[name] = physical
+            self._names.update((name, physical))
+        return name
+
+    async def drop(self, name: str):
+        """Удалить партицию (alias вместе с коллекцией, на которую он указывает)"""
+        await self._load()
+        target = self._aliases.get(name)
+        if target:
+            await self.qdrant.update_collection_aliases(change_aliases_operations=[
+                DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=name))
+            ])
+            await self.qdrant.delete_collection(target)
+        elif name in self._names:
+            await self.qdrant.delete_collection(name)
+        self._names.difference_update((name, target))
+        self._aliases.pop(name, None)
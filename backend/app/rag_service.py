@@ -1,139 +1,527 @@
 import os
 import json
+import asyncio
+import time
+import hashlib
 import httpx
-from typing import List, Optional, Set
-from datetime import datetime
-from qdrant_client import QdrantClient
+from functools import lru_cache, partial
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from datetime import datetime, timezone
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http.models import (
     VectorParams, Distance, PointStruct,
-    Filter, FieldCondition, MatchValue, MatchAny
+    Filter, FieldCondition, MatchValue, MatchAny, Range,
+    IsEmptyCondition, PayloadField, SetPayload, SetPayloadOperation,
+    PointIdsList, FilterSelector, PayloadSchemaType, HnswConfigDiff,
+    CreateAliasOperation, CreateAlias, DeleteAliasOperation, DeleteAlias
 )
 from app.config import get_settings
-from app.models import TelegramMessage, RAGResult, RAGSource, ContactInfo
+from app.models import (
+    TelegramMessage, RAGResult, RAGSource, ContactInfo, JobInfo,
+    SavedSearch, SavedSearchCreate, SavedSearchMatch
+)
+from app.message_archive import MessageArchive
+from app.author_stats import AuthorStats
+from app.saved_searches import SavedSearchStore
+from app.ingest_filters import IngestFilters, FILTERS_FILE
+from app.records import MessageRecord
+from app.embedding_batcher import split_text, embed_all, MicroBatcher
+from app.resilience import ResilientEndpoint, CircuitBreaker
+from app.partitions import VectorPartitions, group_by_chat
+from app.locks import FileLock
+from app.metrics import (
+    InstrumentedClient, QDRANT_REQUEST_SECONDS, OPENAI_REQUEST_SECONDS,
+    EMBEDDING_BATCH_SIZE, EMBEDDING_TOKENS, SEARCH_SECONDS
+)
 
 
 COLLECTION_EMBEDDINGS = "telegram_embeddings"
+# Устаревшая коллекция с полными сообщениями, читается только для импорта в архив
 COLLECTION_MESSAGES = "telegram_messages"
 COLLECTION_CONTACTS = "telegram_contacts"
 COLLECTION_CONTACTS_EMBEDDINGS = "telegram_contacts_embeddings"
 
+# Поля payload эмбеддингов, по которым фильтруем и считаем
+EMBEDDINGS_INDEXED_FIELDS = ("chat_id", "topic_id", "author_id", "timestamp", "views", "forwards")
+
+# Сколько точек дополнять новыми полями payload за один проход
+PAYLOAD_BACKFILL_BATCH_SIZE = 1000
+
+# Сколько точек переносить за раз при смене раскладки по источникам
+PARTITION_MIGRATE_BATCH_SIZE = 1000
+
+# Сколько точек удалять за один запрос
+DELETE_BATCH_SIZE = 5000
+
+# Сколько контактов читать за один запрос при загрузке известных ID
+CONTACTS_SCROLL_BATCH_SIZE = 10000
+
+# Сколько точек отправлять в Qdrant за один upsert
+UPSERT_BATCH_SIZE = 256
+
+# Сколько непроиндексированных сообщений доиндексировать за один проход
+UNINDEXED_RETRY_BATCH_SIZE = 500
+
+# Сколько уже проиндексированных совпадений кладётся во входящие при сохранении поиска
+SAVED_SEARCH_SEED_LIMIT = 100
+
+# Глубина цепочки родителей в контексте результата поиска
+CONTEXT_MAX_DEPTH = 10
+
+# Расширение запроса необязательно: поиск не ждёт долгих повторов
+EXPANSION_MAX_RETRIES = 1
+
+# Активная модель эмбеддингов; меняется только переиндексацией
+EMBEDDINGS_STATE_FILE = "embeddings_state.json"
+
+# Запись в векторный индекс (разделяемо) против последнего прохода и
+# переключения alias переиндексации (эксклюзивно)
+INDEX_LOCK_FILE = "index.lock"
+
+# Журнал удалённых источников: переиндексация повторяет удаления в новой коллекции
+DELETED_SOURCES_FILE = "deleted_sources.jsonl"
+
+
+def point_numeric_id(point_id: str) -> int:
+    """Стабильный между запусками числовой ID точки (в отличие от hash())"""
+    digest = hashlib.blake2b(point_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % (2**63)
+
+
+def versioned_collection(alias: str, version: int) -> str:
+    return f"{alias}_v{version}"
+
+
+def chunk_point_id(point_id: str, chunk: int) -> str:
+    """ID точки куска длинного сообщения; первый кусок - ID самого сообщения"""
+    return point_id if chunk == 0 else f"{point_id}#{chunk}"
+
+
+def unix_timestamp(date: datetime) -> int:
+    """Секунды UTC; наивные даты считаются UTC (так их отдаёт Telethon)"""
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp())
+
+
+def embedding_payload(record: MessageRecord, chunk: int = 0, text: Optional[str] = None) -> dict:
+    """Payload для фильтрации; полное сообщение хранится в архиве.
+
+    text - текст куска, из которого построен вектор (по умолчанию всё сообщение).
+    """
+    text = record.text if text is None else text
+    return {
+        "point_id": record.point_id,
+        "chunk": chunk,
+        "chat_id": record.chat_id,
+        "topic_id": record.topic_id,
+        "message_id": record.id,
+        "author_id": record.author_id,
+        "text_length": len(record.text),
+        # Правка той же длины меняет вектор - по хэшу её видят инкрементальные снимки
+        "text_hash": hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest(),
+        "date": record.date.isoformat(),
+        # Числовые поля для фильтров по диапазону внутри Qdrant
+        "timestamp": unix_timestamp(record.date),
+        "views": record.views or 0,
+        "forwards": record.forwards or 0
+    }
+
+
+def create_qdrant_client(settings) -> InstrumentedClient:
+    if settings.qdrant_location:
+        # Локальный режим без сервера (":memory:" или путь), для бенчмарков
+        client = AsyncQdrantClient(location=settings.qdrant_location)
+    else:
+        client = AsyncQdrantClient(
+            host=settings.qdrant_host,
+            port=settings.qdrant_port,
+            grpc_port=settings.qdrant_grpc_port,
+            prefer_grpc=settings.qdrant_prefer_grpc
+        )
+    return InstrumentedClient(client, QDRANT_REQUEST_SECONDS)
+
+
+def messages_filter(
+    chat_ids: List[int],
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    author_ids: Optional[List[int]] = None,
+    min_views: Optional[int] = None
+) -> Filter:
+    """Фильтр поиска по источникам, периоду, авторам и просмотрам"""
+    conditions = [FieldCondition(key="chat_id", match=MatchAny(any=chat_ids))]
+    if date_from or date_to:
+        conditions.append(FieldCondition(
+            key="timestamp",
+            range=Range(
+                gte=unix_timestamp(date_from) if date_from else None,
+                lte=unix_timestamp(date_to) if date_to else None
+            )
+        ))
+    if author_ids:
+        conditions.append(FieldCondition(key="author_id", match=MatchAny(any=author_ids)))
+    if min_views:
+        conditions.append(FieldCondition(key="views", range=Range(gte=min_views)))
+    return Filter(must=conditions)
+
 
 class RAGService:
     def __init__(self):
         self.settings = get_settings()
-        self.qdrant = QdrantClient(
-            host=self.settings.qdrant_host,
-            port=self.settings.qdrant_port
+        self.qdrant = create_qdrant_client(self.settings)
+        self._load_embedding_state()
+        self._http = httpx.AsyncClient(timeout=60.0)
+        self._embeddings_api = self._openai_endpoint(
+            "embeddings",
+            self.settings.openai_embeddings_concurrency,
+            self.settings.openai_max_retries
+        )
+        self._chat_api = self._openai_endpoint(
+            "chat_completions",
+            self.settings.openai_chat_concurrency,
+            EXPANSION_MAX_RETRIES
         )
-        self.embedding_dim = 1536  # text-embedding-3-small
-        self._ensure_collections()
+        # Одиночные и мелкие запросы активной модели от всех вызывающих - общими батчами
+        self._embedding_batcher = MicroBatcher(
+            self.get_embeddings_batch,
+            self.settings.embedding_batch_wait,
+            self.settings.embedding_batch_inputs,
+            self.settings.embedding_request_tokens
+        )
+        self.partitions = VectorPartitions(
+            self.qdrant,
+            self.ensure_embeddings_indexes,
+            self.settings.embeddings_partitioning == "collections"
+        )
+        self.archive = MessageArchive(os.path.join(self.settings.data_dir, "archive"))
+        self.authors = AuthorStats(os.path.join(self.settings.data_dir, "authors.sqlite"))
+        self.saved_searches = SavedSearchStore(os.path.join(self.settings.data_dir, "saved_searches.sqlite"))
+        self.ingest_filters = IngestFilters(os.path.join(self.settings.data_dir, FILTERS_FILE))
+        self.index_lock = FileLock(os.path.join(self.settings.data_dir, INDEX_LOCK_FILE))
         self._known_contacts: Set[int] = set()
-        self._load_known_contacts()
+        # Есть ли в архиве сообщения, не попавшие в индекс; после старта
+        # проверяем - их мог оставить прошлый запуск или другой процесс
+        self._unindexed_pending = True
+
+    async def init(self, load_contacts: bool = True):
+        """Подготовить коллекции и кэш контактов (вызывается при старте).
+
+        Коллекции создаёт и кэш известных контактов держит только процесс,
+        который индексирует: процессы API, стартуя одновременно с воркером
+        на пустом Qdrant, не должны создавать схему наперегонки.
+        """
+        if load_contacts:
+            await self._ensure_collections()
+            await self._load_known_contacts()
+            if not self.authors.is_built:
+                await self._build_author_stats()
+            await self.migrate_partitions()
+            for collection in await self.embedding_collections():
+                await self.backfill_embedding_payload(collection)
+
+    def _openai_endpoint(self, name: str, concurrency: int, max_retries: int) -> ResilientEndpoint:
+        return ResilientEndpoint(
+            name,
+            concurrency,
+            max_retries,
+            self.settings.openai_backoff_base,
+            self.settings.openai_backoff_max,
+            CircuitBreaker(
+                name,
+                self.settings.openai_breaker_failures,
+                self.settings.openai_breaker_reset_seconds
+            )
+        )
+
+    async def _build_author_stats(self):
+        """Первичное заполнение рейтинга авторов из архива и контактов"""
+        await asyncio.to_thread(self.authors.rebuild, self.archive)
+        await asyncio.to_thread(self.authors.add_contacts, await self.get_all_contacts())
 
-    def _ensure_collections(self):
-        collections = [c.name for c in self.qdrant.get_collections().collections]
+    async def close(self):
+        await self._http.aclose()
+        await self.qdrant.close()
+
+    def _load_embedding_state(self):
+        """Модель и размерность, которыми построены текущие коллекции"""
+        self.embedding_model = self.settings.embedding_model
+        self.embedding_dim = self.settings.embedding_dim
+        # Параметр dimensions для API, если модель обрезана до embedding_dim
+        self.embedding_dimensions: Optional[int] = None
+        self._embedding_state_mtime = 0.0
         
-        if COLLECTION_EMBEDDINGS not in collections:
-            self.qdrant.create_collection(
-                collection_name=COLLECTION_EMBEDDINGS,
-                vectors_config=VectorParams(
-                    size=self.embedding_dim,
-                    distance=Distance.COSINE
-                )
+        path = os.path.join(self.settings.data_dir, EMBEDDINGS_STATE_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.embedding_model = state["model"]
+            self.embedding_dim = state["dim"]
+            self.embedding_dimensions = state.get("dimensions")
+            self._embedding_state_mtime = os.path.getmtime(path)
+
+    def _refresh_embedding_state(self):
+        """Подхватить модель после переиндексации в другом процессе"""
+        path = os.path.join(self.settings.data_dir, EMBEDDINGS_STATE_FILE)
+        if os.path.exists(path) and os.path.getmtime(path) != self._embedding_state_mtime:
+            self._load_embedding_state()
+
+    def save_embedding_state(self, model: str, dim: int, dimensions: Optional[int]):
+        self.embedding_model = model
+        self.embedding_dim = dim
+        self.embedding_dimensions = dimensions
+        
+        path = os.path.join(self.settings.data_dir, EMBEDDINGS_STATE_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model": model, "dim": dim, "dimensions": dimensions}, f)
+        os.replace(tmp_path, path)
+        self._embedding_state_mtime = os.path.getmtime(path)
+
+    async def create_vector_collection(
+        self,
+        name: str,
+        dim: int,
+        hnsw_m: Optional[int] = None,
+        hnsw_ef_construct: Optional[int] = None
+    ):
+        """Создать коллекцию векторов с настройками HNSW"""
+        await self.qdrant.create_collection(
+            collection_name=name,
+            vectors_config=VectorParams(
+                size=dim,
+                distance=Distance.COSINE
+            ),
+            hnsw_config=HnswConfigDiff(
+                m=hnsw_m or self.settings.hnsw_m,
+                ef_construct=hnsw_ef_construct or self.settings.hnsw_ef_construct
             )
+        )
+
+    async def get_alias_target(self, alias: str) -> Optional[str]:
+        for description in (await self.qdrant.get_aliases()).aliases:
+            if description.alias_name == alias:
+                return description.collection_name
+        return None
+
+    async def switch_aliases(self, targets: Dict[str, str]) -> Dict[str, Optional[str]]:
+        """Атомарно перевести alias'ы на коллекции; возвращает прежние коллекции"""
+        aliases = {d.alias_name: d.collection_name for d in (await self.qdrant.get_aliases()).aliases}
+        previous = {alias: aliases.get(alias) for alias in targets}
+        collections = [c.name for c in (await self.qdrant.get_collections()).collections]
         
-        if COLLECTION_MESSAGES not in collections:
-            self.qdrant.create_collection(
-                collection_name=COLLECTION_MESSAGES,
-                vectors_config=VectorParams(
-                    size=1,  # dummy vector
-                    distance=Distance.COSINE
+        operations = []
+        for alias, collection in targets.items():
+            if previous[alias]:
+                operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+            elif alias in collections:
+                # Старая схема: коллекция без версии занимает имя alias
+                await self.qdrant.delete_collection(alias)
+            operations.append(CreateAliasOperation(
+                create_alias=CreateAlias(collection_name=collection, alias_name=alias)
+            ))
+        await self.qdrant.update_collection_aliases(change_aliases_operations=operations)
+        return previous
+
+    async def ensure_embeddings_indexes(self, collection: str):
+        # Индексы payload нужны для быстрых фильтров и count; повторное создание безопасно
+        for field in EMBEDDINGS_INDEXED_FIELDS:
+            await self.qdrant.create_payload_index(
+                collection_name=collection,
+                field_name=field,
+                field_schema=PayloadSchemaType.INTEGER
+            )
+
+    async def embedding_collections(self, chat_ids: Optional[List[int]] = None) -> List[str]:
+        """Коллекции с векторами сообщений источников (все, если chat_ids не заданы)"""
+        if not self.partitions.enabled:
+            return [COLLECTION_EMBEDDINGS]
+        partitions = await self.partitions.partitions(COLLECTION_EMBEDDINGS, chat_ids)
+        return list(partitions.values())
+
+    async def migrate_partitions(self) -> int:
+        """Перенести векторы между общей коллекцией и коллекциями источников,
+        если раскладка поменялась в настройках. Прерванный перенос продолжается.
+        """
+        if self.partitions.enabled:
+            sources = [COLLECTION_EMBEDDINGS]
+        else:
+            sources = list((await self.partitions.partitions(COLLECTION_EMBEDDINGS, refresh=True)).values())
+
+        moved = 0
+        for source in sources:
+            while True:
+                points, _ = await self.qdrant.scroll(
+                    collection_name=source,
+                    limit=PARTITION_MIGRATE_BATCH_SIZE,
+                    with_payload=True,
+                    with_vectors=True
+                )
+                if not points:
+                    break
+                # Сначала запись в новое место, потом удаление: повтор безопасен
+                await self.upsert_embeddings(COLLECTION_EMBEDDINGS, [
+                    PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points
+                ], wait=True)
+                await self.qdrant.delete(
+                    collection_name=source,
+                    points_selector=PointIdsList(points=[p.id for p in points]),
+                    wait=True
                 )
+                moved += len(points)
+            if source != COLLECTION_EMBEDDINGS:
+                await self.partitions.drop(source)
+        if moved:
+            layout = "per-source collections" if self.partitions.enabled else "single collection"
+            print(f"Moved {moved} embedding points to {layout}")
+        return moved
+
+    async def backfill_embedding_payload(self, collection: str) -> int:
+        """Дописать timestamp, views и forwards точкам, проиндексированным до их появления"""
+        missing = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key="timestamp"))])
+        updated = 0
+        while True:
+            points, _ = await self.qdrant.scroll(
+                collection_name=collection,
+                scroll_filter=missing,
+                limit=PAYLOAD_BACKFILL_BATCH_SIZE,
+                with_payload=["point_id", "date"],
+                with_vectors=False
+            )
+            if not points:
+                break
+            counters = await asyncio.to_thread(
+                self.archive.counters, list({p.payload["point_id"] for p in points})
+            )
+            operations = []
+            for point in points:
+                views, forwards = counters.get(point.payload["point_id"], (None, None))
+                operations.append(SetPayloadOperation(set_payload=SetPayload(
+                    payload={
+                        "timestamp": unix_timestamp(datetime.fromisoformat(point.payload["date"])),
+                        "views": views or 0,
+                        "forwards": forwards or 0
+                    },
+                    points=[point.id]
+                )))
+            # Ждём применения: следующий scroll не должен вернуть те же точки
+            await self.qdrant.batch_update_points(
+                collection_name=collection,
+                update_operations=operations,
+                wait=True
             )
+            updated += len(points)
+        if updated:
+            print(f"Backfilled payload fields for {updated} points in {collection}")
+        return updated
+
+    async def _ensure_collections(self):
+        collections = [c.name for c in (await self.qdrant.get_collections()).collections]
+        
+        # Векторные коллекции доступны через alias, чтобы переиндексация
+        # могла переключать их без простоя
+        for alias in (COLLECTION_EMBEDDINGS, COLLECTION_CONTACTS_EMBEDDINGS):
+            if alias in collections or await self.get_alias_target(alias):
+                continue
+            collection = versioned_collection(alias, 1)
+            if collection not in collections:
+                await self.create_vector_collection(collection, self.embedding_dim)
+            await self.switch_aliases({alias: collection})
+        
+        await self.ensure_embeddings_indexes(COLLECTION_EMBEDDINGS)
         
         if COLLECTION_CONTACTS not in collections:
-            self.qdrant.create_collection(
+            await self.qdrant.create_collection(
                 collection_name=COLLECTION_CONTACTS,
                 vectors_config=VectorParams(
                     size=1,  # dummy vector
                     distance=Distance.COSINE
                 )
             )
-        
-        if COLLECTION_CONTACTS_EMBEDDINGS not in collections:
-            self.qdrant.create_collection(
-                collection_name=COLLECTION_CONTACTS_EMBEDDINGS,
-                vectors_config=VectorParams(
-                    size=self.embedding_dim,
-                    distance=Distance.COSINE
-                )
-            )
 
-    def _load_known_contacts(self):
+    async def _load_known_contacts(self):
         """Загрузить ID известных контактов"""
         try:
-            scroll_result = self.qdrant.scroll(
-                collection_name=COLLECTION_CONTACTS,
-                limit=10000,
-                with_payload=True,
-                with_vectors=False
-            )
-            for point in scroll_result[0]:
-                user_id = point.payload.get("user_id")
-                if user_id:
-                    self._known_contacts.add(user_id)
+            offset = None
+            while True:
+                points, offset = await self.qdrant.scroll(
+                    collection_name=COLLECTION_CONTACTS,
+                    limit=CONTACTS_SCROLL_BATCH_SIZE,
+                    offset=offset,
+                    with_payload=["user_id"],
+                    with_vectors=False
+                )
+                for point in points:
+                    user_id = point.payload.get("user_id")
+                    if user_id:
+                        self._known_contacts.add(user_id)
+                if offset is None:
+                    break
         except:
             pass
 
     def is_contact_known(self, user_id: int) -> bool:
         return user_id in self._known_contacts
 
-    def add_contact(self, contact: ContactInfo) -> bool:
+    @staticmethod
+    def contact_index_text(contact: ContactInfo) -> str:
+        """Текст для индексации: имя + username + bio"""
+        index_text = f"{contact.full_name}"
+        if contact.username:
+            index_text += f" @{contact.username}"
+        index_text += f" {contact.bio}"
+        return index_text
+
+    @staticmethod
+    def contact_embedding_point(contact: ContactInfo, embedding: List[float]) -> PointStruct:
+        return PointStruct(
+            id=contact.id % (2**63),
+            vector=embedding,
+            payload={
+                "user_id": contact.id,
+                "username": contact.username,
+                "full_name": contact.full_name,
+                "bio": contact.bio,
+                "has_channel": contact.personal_channel_id is not None
+            }
+        )
+
+    async def add_contact(self, contact: ContactInfo) -> bool:
         """Добавить контакт в базу с индексацией bio"""
         try:
             contact_data = contact.model_dump()
             if contact.updated_at:
                 contact_data['updated_at'] = contact.updated_at.isoformat()
             
-            # Сохраняем контакт
-            self.qdrant.upsert(
-                collection_name=COLLECTION_CONTACTS,
-                points=[PointStruct(
-                    id=contact.id % (2**63),
-                    vector=[0.0],
-                    payload={
-                        "user_id": contact.id,
-                        "username": contact.username,
-                        "full_name": contact.full_name,
-                        "contact_json": json.dumps(contact_data, ensure_ascii=False)
-                    }
-                )]
+            card = PointStruct(
+                id=contact.id % (2**63),
+                vector=[0.0],
+                payload={
+                    "user_id": contact.id,
+                    "username": contact.username,
+                    "full_name": contact.full_name,
+                    "contact_json": json.dumps(contact_data, ensure_ascii=False)
+                }
             )
             
-            # Индексируем bio для поиска
-            if contact.bio:
-                # Создаём текст для индексации: имя + username + bio
-                index_text = f"{contact.full_name}"
-                if contact.username:
-                    index_text += f" @{contact.username}"
-                index_text += f" {contact.bio}"
+            # Индексируем bio для поиска; модель и коллекция не должны смениться
+            # переиндексацией между эмбеддингом и записью
+            async with self.index_lock.shared():
+                embedding = None
+                if contact.bio:
+                    embedding = await self._get_embedding(self.contact_index_text(contact))
                 
-                embedding = self._get_embedding(index_text)
-                
-                self.qdrant.upsert(
-                    collection_name=COLLECTION_CONTACTS_EMBEDDINGS,
-                    points=[PointStruct(
-                        id=contact.id % (2**63),
-                        vector=embedding,
-                        payload={
-                            "user_id": contact.id,
-                            "username": contact.username,
-                            "full_name": contact.full_name,
-                            "bio": contact.bio,
-                            "has_channel": contact.personal_channel_id is not None
-                        }
-                    )]
-                )
+                # Карточка контакта и эмбеддинг bio пишутся параллельно,
+                # корутины создаются только после успешного эмбеддинга
+                writes = [self.qdrant.upsert(collection_name=COLLECTION_CONTACTS, points=[card])]
+                if embedding is not None:
+                    writes.append(self.qdrant.upsert(
+                        collection_name=COLLECTION_CONTACTS_EMBEDDINGS,
+                        points=[self.contact_embedding_point(contact, embedding)],
+                        wait=False
+                    ))
+                await asyncio.gather(*writes)
+            await asyncio.to_thread(self.authors.add_contacts, [contact])
             
             self._known_contacts.add(contact.id)
             return True
@@ -141,10 +529,10 @@ class RAGService:
             print(f"Error adding contact: {e}")
             return False
 
-    def get_contact(self, user_id: int) -> Optional[ContactInfo]:
+    async def get_contact(self, user_id: int) -> Optional[ContactInfo]:
         """Получить контакт из базы"""
         try:
-            points = self.qdrant.retrieve(
+            points = await self.qdrant.retrieve(
                 collection_name=COLLECTION_CONTACTS,
                 ids=[user_id % (2**63)],
                 with_payload=True
@@ -158,11 +546,11 @@ class RAGService:
             pass
         return None
 
-    def get_all_contacts(self) -> List[ContactInfo]:
+    async def get_all_contacts(self) -> List[ContactInfo]:
         """Получить все контакты"""
         contacts = []
         try:
-            scroll_result = self.qdrant.scroll(
+            scroll_result = await self.qdrant.scroll(
                 collection_name=COLLECTION_CONTACTS,
                 limit=10000,
                 with_payload=True,
@@ -184,16 +572,17 @@ class RAGService:
         expand_query: bool = True
     ) -> List[dict]:
         """Поиск контактов по bio"""
+        started = time.perf_counter()
         search_query = query
         if expand_query:
             try:
-                search_query = self._expand_query(query)
+                search_query = await self._expand_query(query)
             except:
                 pass
         
-        query_embedding = self._get_embedding(search_query)
+        query_embedding = await self._get_embedding(search_query)
         
-        results = self.qdrant.search(
+        results = await self.qdrant.search(
             collection_name=COLLECTION_CONTACTS_EMBEDDINGS,
             query_vector=query_embedding,
             limit=top_k,
@@ -203,34 +592,23 @@ class RAGService:
         contact_results = []
         for result in results:
             user_id = result.payload.get("user_id")
-            contact = self.get_contact(user_id)
+            contact = await self.get_contact(user_id)
             if contact:
                 contact_results.append({
                     "contact": contact,
                     "score": result.score
                 })
         
+        SEARCH_SECONDS.labels("contacts").observe(time.perf_counter() - started)
         return contact_results
 
-    def get_contact_messages_count(self, user_id: int) -> int:
+    async def get_contact_messages_count(self, user_id: int) -> int:
         """Получить количество сообщений от контакта"""
         try:
             # Считаем сообщения этого автора
-            scroll_result = self.qdrant.scroll(
-                collection_name=COLLECTION_EMBEDDINGS,
-                scroll_filter=Filter(
-                    must=[
-                        FieldCondition(
-                            key="author_id",
-                            match=MatchValue(value=user_id)
-                        )
-                    ]
-                ),
-                limit=10000,
-                with_payload=False,
-                with_vectors=False
-            )
-            return len(scroll_result[0])
+            return await self._count_embeddings(Filter(
+                must=[FieldCondition(key="author_id", match=MatchValue(value=user_id))]
+            ))
         except:
             return 0
 
@@ -238,46 +616,51 @@ class RAGService:
         """Вернуть ID контактов которых нет в базе"""
         return [uid for uid in author_ids if uid and uid not in self._known_contacts]
 
-    def _get_embedding(self, text: str) -> List[float]:
-        """Получить эмбеддинг через OpenAI API"""
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(
-                "https://api.openai.com/v1/embeddings",
-                headers={
-                    "Authorization": f"Bearer {self.settings.openai_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.settings.embedding_model,
-                    "input": text
-                }
-            )
-            response.raise_for_status()
-            return response.json()["data"][0]["embedding"]
-
-    def _get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """Получить эмбеддинги для батча текстов"""
-        with httpx.Client(timeout=60.0) as client:
-            response = client.post(
-                "https://api.openai.com/v1/embeddings",
+    def _embeddings_request_body(self, texts, model: Optional[str], dimensions: Optional[int]) -> dict:
+        if model is None:
+            self._refresh_embedding_state()
+        body = {
+            "model": model or self.embedding_model,
+            "input": texts
+        }
+        if model is None:
+            dimensions = self.embedding_dimensions
+        if dimensions:
+            body["dimensions"] = dimensions
+        return body
+
+    async def _get_embedding(self, text: str) -> List[float]:
+        """Получить эмбеддинг активной модели через общий батч"""
+        return await self._embedding_batcher.embed(text)
+
+    async def get_embeddings_batch(
+        self,
+        texts: List[str],
+        model: Optional[str] = None,
+        dimensions: Optional[int] = None
+    ) -> List[List[float]]:
+        """Получить эмбеддинги для батча текстов (по умолчанию - активной моделью)"""
+        EMBEDDING_BATCH_SIZE.observe(len(texts))
+        with OPENAI_REQUEST_SECONDS.labels("embeddings").time():
+            response = await self._embeddings_api.post(
+                self._http,
+                f"{self.settings.openai_base_url}/embeddings",
                 headers={
                     "Authorization": f"Bearer {self.settings.openai_api_key}",
                     "Content-Type": "application/json"
                 },
-                json={
-                    "model": self.settings.embedding_model,
-                    "input": texts
-                }
+                json=self._embeddings_request_body(texts, model, dimensions)
             )
-            response.raise_for_status()
-            data = response.json()["data"]
-            return [item["embedding"] for item in data]
+        result = response.json()
+        EMBEDDING_TOKENS.inc(result.get("usage", {}).get("total_tokens", 0))
+        return [item["embedding"] for item in result["data"]]
 
-    def _expand_query(self, query: str) -> str:
+    async def _expand_query(self, query: str) -> str:
         """Расширить запрос ключевыми словами для лучшего поиска"""
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(
-                "https://api.openai.com/v1/chat/completions",
+        with OPENAI_REQUEST_SECONDS.labels("chat_completions").time():
+            response = await self._chat_api.post(
+                self._http,
+                f"{self.settings.openai_base_url}/chat/completions",
                 headers={
                     "Authorization": f"Bearer {self.settings.openai_api_key}",
                     "Content-Type": "application/json"
@@ -305,152 +688,176 @@ class RAGService:
                     ],
                     "temperature": 0.3,
                     "max_tokens": 200
-                }
+                },
+                timeout=30.0
             )
-            response.raise_for_status()
             expanded = response.json()["choices"][0]["message"]["content"]
             return f"{query} {expanded}"
 
-    def _message_to_point_id(self, chat_id: int, message_id: int, topic_id: Optional[int] = None) -> str:
-        if topic_id:
-            return f"{chat_id}_{topic_id}_{message_id}"
-        return f"{chat_id}_{message_id}"
+    def _archive_messages(self, records: List[MessageRecord]):
+        """Записать сообщения в архив и учесть их в признаках авторов"""
+        previous, reply_authors, replies = self.archive.append_tracked(records)
+        self.authors.add_messages(records, previous, reply_authors, replies)
 
-    async def index_message(self, message: TelegramMessage) -> bool:
-        try:
-            point_id = self._message_to_point_id(
-                message.chat_id, 
-                message.id, 
-                message.topic_id
-            )
-            
-            message_data = message.model_dump()
-            message_data['date'] = message.date.isoformat()
-            
+    async def embed_messages(
+        self,
+        records: List[MessageRecord],
+        model: Optional[str] = None,
+        dimensions: Optional[int] = None
+    ) -> Tuple[List[PointStruct], Set[str]]:
+        """Точки эмбеддингов сообщений и point_id тех, что не удалось заэмбеддить.
+
+        Длинные сообщения режутся на куски, каждый кусок - отдельная точка
+        с point_id сообщения. Тексты упаковываются в запросы по бюджету токенов.
+        """
+        chunks = []
+        for record in records:
+            for chunk, text in enumerate(split_text(record.text, self.settings.embedding_max_input_tokens)):
+                chunks.append((record, chunk, text))
+
+        if model is None and dimensions is None:
+            embed = self._embedding_batcher.embed_many
+        else:
+            embed = partial(self.get_embeddings_batch, model=model, dimensions=dimensions)
+        embeddings = await embed_all(
+            embed,
+            [text for *_, text in chunks],
+            self.settings.embedding_request_tokens,
+            self.settings.embedding_request_inputs
+        )
+
+        points = []
+        failed = set()
+        for (record, chunk, text), embedding in zip(chunks, embeddings):
+            if embedding is None:
+                failed.add(record.point_id)
+                continue
+            points.append(PointStruct(
+                id=point_numeric_id(chunk_point_id(record.point_id, chunk)),
+                vector=embedding,
+                payload=embedding_payload(record, chunk, text)
+            ))
+        return points, failed
+
+    async def upsert_embeddings(self, collection: str, points: List[PointStruct], wait: bool = False):
+        """Записать точки в коллекцию или, при раскладке по источникам, в её партиции"""
+        if self.partitions.enabled:
+            groups = [
+                (await self.partitions.ensure(collection, chat_id), chat_points)
+                for chat_id, chat_points in group_by_chat(points).items()
+            ]
+        else:
+            groups = [(collection, points)]
+        await asyncio.gather(*(
             self.qdrant.upsert(
-                collection_name=COLLECTION_MESSAGES,
-                points=[PointStruct(
-                    id=hash(point_id) % (2**63),
-                    vector=[0.0],
-                    payload={
-                        "point_id": point_id,
-                        "chat_id": message.chat_id,
-                        "chat_title": message.chat_title,
-                        "chat_username": message.chat_username,
-                        "topic_id": message.topic_id,
-                        "topic_title": message.topic_title,
-                        "message_id": message.id,
-                        "message_json": json.dumps(message_data, ensure_ascii=False)
-                    }
-                )]
+                collection_name=target,
+                points=target_points[i:i+UPSERT_BATCH_SIZE],
+                wait=wait
             )
-            
-            embedding = self._get_embedding(message.text)
-            
-            self.qdrant.upsert(
-                collection_name=COLLECTION_EMBEDDINGS,
-                points=[PointStruct(
-                    id=hash(point_id) % (2**63),
-                    vector=embedding,
-                    payload={
-                        "point_id": point_id,
-                        "chat_id": message.chat_id,
-                        "chat_title": message.chat_title,
-                        "chat_username": message.chat_username,
-                        "topic_id": message.topic_id,
-                        "topic_title": message.topic_title,
-                        "message_id": message.id,
-                        "author_id": message.author.id,
-                        "author_username": message.author.username,
-                        "text": message.text[:500],
-                        "text_length": len(message.text),
-                        "date": message.date.isoformat()
-                    }
-                )]
+            for target, target_points in groups
+            for i in range(0, len(target_points), UPSERT_BATCH_SIZE)
+        ))
+
+    async def search_embeddings(
+        self,
+        query_vector: List[float],
+        chat_ids: Optional[List[int]],
+        query_filter: Optional[Filter],
+        limit: int,
+        score_threshold: Optional[float] = None
+    ) -> list:
+        """Поиск по векторам сообщений: только по партициям нужных источников"""
+        collections = await self.embedding_collections(chat_ids or None)
+        results = await asyncio.gather(*(
+            self.qdrant.search(
+                collection_name=collection,
+                query_vector=query_vector,
+                query_filter=query_filter,
+                limit=limit,
+                score_threshold=score_threshold,
+                with_payload=True
             )
-            
-            return True
-        except Exception as e:
-            print(f"Error indexing message: {e}")
-            return False
+            for collection in collections
+        ))
+        if len(results) == 1:
+            return results[0]
+        merged = [r for partition in results for r in partition]
+        merged.sort(key=lambda r: r.score, reverse=True)
+        return merged[:limit]
 
-    async def index_messages_batch(self, messages: List[TelegramMessage]) -> int:
-        indexed = 0
-        
-        batch_size = 100
-        for i in range(0, len(messages), batch_size):
-            batch = messages[i:i+batch_size]
-            
+    async def index_messages_batch(self, messages: List[MessageRecord]) -> int:
+        if not messages:
+            return 0
+        # Переиндексация дочитывает архив и переключает alias, только когда
+        # нет батчей в работе: батч целиком попадает либо в её последний
+        # проход, либо в новую коллекцию новой моделью
+        async with self.index_lock.shared():
+            # Архив - основное хранилище, пишем в него до эмбеддингов
+            await asyncio.to_thread(self._archive_messages, messages)
+
+            # Короткие и шумовые сообщения остаются только в архиве
+            records, _ = self.ingest_filters.select(messages)
+            points, failed = await self.embed_messages(records)
+            model = self.embedding_model
             try:
-                texts = [m.text for m in batch]
-                embeddings = self._get_embeddings_batch(texts)
-                
-                embedding_points = []
-                message_points = []
-                
-                for j, (message, embedding) in enumerate(zip(batch, embeddings)):
-                    point_id = self._message_to_point_id(
-                        message.chat_id,
-                        message.id,
-                        message.topic_id
-                    )
-                    numeric_id = hash(point_id) % (2**63)
-                    
-                    message_data = message.model_dump()
-                    message_data['date'] = message.date.isoformat()
-                    
-                    message_points.append(PointStruct(
-                        id=numeric_id,
-                        vector=[0.0],
-                        payload={
-                            "point_id": point_id,
-                            "chat_id": message.chat_id,
-                            "chat_title": message.chat_title,
-                            "chat_username": message.chat_username,
-                            "topic_id": message.topic_id,
-                            "topic_title": message.topic_title,
-                            "message_id": message.id,
-                            "message_json": json.dumps(message_data, ensure_ascii=False)
-                        }
-                    ))
-                    
-                    embedding_points.append(PointStruct(
-                        id=numeric_id,
-                        vector=embedding,
-                        payload={
-                            "point_id": point_id,
-                            "chat_id": message.chat_id,
-                            "chat_title": message.chat_title,
-                            "chat_username": message.chat_username,
-                            "topic_id": message.topic_id,
-                            "topic_title": message.topic_title,
-                            "message_id": message.id,
-                            "author_id": message.author.id,
-                            "author_username": message.author.username,
-                            "text": message.text[:500],
-                            "text_length": len(message.text),
-                            "date": message.date.isoformat()
-                        }
-                    ))
-                
-                self.qdrant.upsert(
-                    collection_name=COLLECTION_MESSAGES,
-                    points=message_points
-                )
-                self.qdrant.upsert(
-                    collection_name=COLLECTION_EMBEDDINGS,
-                    points=embedding_points
-                )
-                
-                indexed += len(batch)
-                
+                # Точки идемпотентны (стабильный id), ждать применения не нужно
+                await self.upsert_embeddings(COLLECTION_EMBEDDINGS, points)
             except Exception as e:
                 print(f"Error in batch indexing: {e}")
-                for message in batch:
-                    if await self.index_message(message):
-                        indexed += 1
-        
-        return indexed
+                # Сообщения уже в архиве, и повторная загрузка (sync идёт от
+                # последнего сохранённого) их не переиндексирует - доиндексируем сами
+                await self._mark_unindexed([r.point_id for r in records])
+                return 0
+            if failed:
+                await self._mark_unindexed(list(failed))
+
+        try:
+            await asyncio.to_thread(self.saved_searches.match, points, model)
+        except Exception as e:
+            print(f"Error matching saved searches: {e}")
+
+        if failed:
+            print(f"Failed to embed {len(failed)} messages")
+        await self.retry_unindexed()
+        # Отфильтрованные сообщения лежат только в архиве и в счёт не идут
+        return len(records) - len(failed)
+
+    async def _mark_unindexed(self, point_ids: List[str]):
+        await asyncio.to_thread(self.archive.mark_unindexed, point_ids)
+        self._unindexed_pending = True
+
+    async def retry_unindexed(self) -> int:
+        """Доиндексировать сообщения, которые сохранились в архиве, но не попали в индекс.
+
+        Проходит не больше UNINDEXED_RETRY_BATCH_SIZE сообщений за вызов,
+        остальные - в следующих вызовах. Возвращает число проиндексированных.
+        """
+        if not self._unindexed_pending:
+            return 0
+        try:
+            async with self.index_lock.shared():
+                records = await asyncio.to_thread(self.archive.unindexed, UNINDEXED_RETRY_BATCH_SIZE)
+                if not records:
+                    self._unindexed_pending = False
+                    return 0
+                # Фильтры могли поменяться: отсеянные теперь просто снимаются с повтора
+                selected, _ = self.ingest_filters.select(records)
+                points, failed = await self.embed_messages(selected)
+                model = self.embedding_model
+                await self.upsert_embeddings(COLLECTION_EMBEDDINGS, points)
+                await asyncio.to_thread(
+                    self.archive.clear_unindexed,
+                    [r.point_id for r in records if r.point_id not in failed]
+                )
+        except Exception as e:
+            print(f"Error retrying unindexed messages: {e}")
+            return 0
+
+        try:
+            await asyncio.to_thread(self.saved_searches.match, points, model)
+        except Exception as e:
+            print(f"Error matching saved searches: {e}")
+        return len(selected) - len(failed)
 
     async def search(
         self, 
@@ -458,197 +865,357 @@ class RAGService:
         chat_ids: List[int], 
         top_k: int = 10,
         min_text_length: int = 50,
-        expand_query: bool = True
+        expand_query: bool = True,
+        with_context: bool = False,
+        context_size: int = 2,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        author_ids: Optional[List[int]] = None,
+        min_views: Optional[int] = None
     ) -> List[RAGResult]:
+        started = time.perf_counter()
         # Расширяем запрос для лучшего поиска
         search_query = query
         if expand_query:
             try:
-                search_query = self._expand_query(query)
+                search_query = await self._expand_query(query)
                 print(f"Expanded query: {search_query[:200]}...")
             except Exception as e:
                 print(f"Query expansion failed: {e}")
         
-        query_embedding = self._get_embedding(search_query)
+        query_embedding = await self._get_embedding(search_query)
         
-        search_filter = Filter(
-            must=[
-                FieldCondition(
-                    key="chat_id",
-                    match=MatchAny(any=chat_ids)
-                )
-            ]
-        )
+        search_filter = messages_filter(chat_ids, date_from, date_to, author_ids, min_views)
         
         # Запрашиваем больше результатов для фильтрации
-        results = self.qdrant.search(
-            collection_name=COLLECTION_EMBEDDINGS,
-            query_vector=query_embedding,
-            query_filter=search_filter,
-            limit=top_k * 3,
-            with_payload=True
-        )
+        results = await self.search_embeddings(query_embedding, chat_ids, search_filter, top_k * 3)
         
-        rag_results = []
-        for result in results:
-            # Фильтруем короткие сообщения
-            text_length = result.payload.get("text_length", 0)
-            if text_length < min_text_length:
+        # Фильтруем короткие сообщения и повторные куски одного сообщения
+        hits = []
+        seen = set()
+        for r in results:
+            point_id = r.payload.get("point_id")
+            if r.payload.get("text_length", 0) < min_text_length or point_id in seen:
                 continue
-            
-            point_id = result.payload.get("point_id")
-            numeric_id = hash(point_id) % (2**63)
-            
-            message_points = self.qdrant.retrieve(
-                collection_name=COLLECTION_MESSAGES,
-                ids=[numeric_id],
-                with_payload=True
+            seen.add(point_id)
+            hits.append(r)
+        hits = hits[:top_k]
+        
+        # Полные сообщения - одним запросом к архиву
+        point_ids = [r.payload.get("point_id") for r in hits]
+        stored = await asyncio.to_thread(self.archive.get_many, point_ids)
+        contexts = {}
+        if with_context:
+            # Родители и соседи всех результатов - одним запросом на чат
+            contexts = await asyncio.to_thread(
+                self.archive.contexts, point_ids, CONTEXT_MAX_DEPTH, context_size
             )
+        
+        rag_results = []
+        for result in hits:
+            point_id = result.payload.get("point_id")
+            message_data = stored.get(point_id)
+            if not message_data:
+                continue
+            context = contexts.get(point_id, {})
             
-            if message_points:
-                message_json = message_points[0].payload.get("message_json")
-                message_data = json.loads(message_json)
-                message_data['date'] = datetime.fromisoformat(message_data['date'])
-                
-                rag_results.append(RAGResult(
-                    message=TelegramMessage(**message_data),
-                    score=result.score,
-                    highlight=result.payload.get("text")
-                ))
-            
-            if len(rag_results) >= top_k:
-                break
+            rag_results.append(RAGResult(
+                message=TelegramMessage(**message_data),
+                score=result.score,
+                highlight=message_data["text"][:500],
+                parents=[TelegramMessage(**m) for m in context.get("parents", [])],
+                context=[TelegramMessage(**m) for m in context.get("context", [])]
+            ))
         
+        SEARCH_SECONDS.labels("messages").observe(time.perf_counter() - started)
         return rag_results
 
-    def get_available_sources(self) -> List[RAGSource]:
-        sources = {}
-        
-        scroll_result = self.qdrant.scroll(
-            collection_name=COLLECTION_EMBEDDINGS,
-            limit=10000,
-            with_payload=True,
-            with_vectors=False
+    async def _saved_search_text(self, query: str, expand_query: bool) -> str:
+        if not expand_query:
+            return query
+        try:
+            return await self._expand_query(query)
+        except Exception as e:
+            print(f"Query expansion failed: {e}")
+            return query
+
+    async def create_saved_search(self, request: SavedSearchCreate) -> SavedSearch:
+        """Сохранить поиск; входящие сразу получают уже проиндексированные совпадения"""
+        expanded_query = await self._saved_search_text(request.query, request.expand_query)
+        vector = await self._get_embedding(expanded_query)
+        saved = await asyncio.to_thread(
+            self.saved_searches.create, request, expanded_query, self.embedding_model, vector
         )
-        
-        for point in scroll_result[0]:
-            chat_id = point.payload.get("chat_id")
-            chat_title = point.payload.get("chat_title")
-            topic_id = point.payload.get("topic_id")
-            topic_title = point.payload.get("topic_title")
-            
-            key = f"{chat_id}_{topic_id}" if topic_id else str(chat_id)
-            
-            if key not in sources:
-                sources[key] = RAGSource(
-                    chat_id=chat_id,
-                    chat_title=chat_title,
-                    topic_id=topic_id,
-                    topic_title=topic_title,
-                    messages_count=0
-                )
-            sources[key].messages_count += 1
-        
-        return list(sources.values())
 
-    def get_all_messages(self) -> List[dict]:
-        """Получить все сообщения из базы"""
-        messages = []
-        offset = None
+        search_filter = None
+        if request.sources:
+            search_filter = Filter(must=[
+                FieldCondition(key="chat_id", match=MatchAny(any=request.sources))
+            ])
+        results = await self.search_embeddings(
+            vector, request.sources, search_filter, SAVED_SEARCH_SEED_LIMIT, request.min_score
+        )
+        matches = {}
+        for r in results:
+            if r.payload.get("text_length", 0) >= request.min_text_length:
+                matches.setdefault(r.payload["point_id"], r.score)
+        await asyncio.to_thread(self.saved_searches.add_matches, saved.id, list(matches.items()))
+        return await asyncio.to_thread(self.saved_searches.get, saved.id)
 
-        while True:
-            scroll_result = self.qdrant.scroll(
-                collection_name=COLLECTION_MESSAGES,
-                limit=1000,
-                offset=offset,
-                with_payload=True,
-                with_vectors=False
+    async def refresh_saved_searches(self) -> int:
+        """Переэмбеддить поиски, сохранённые с прежней моделью (после переиндексации)"""
+        self._refresh_embedding_state()
+        stale = await asyncio.to_thread(self.saved_searches.stale, self.embedding_model)
+        for saved in stale:
+            vector = await self._get_embedding(saved.expanded_query)
+            await asyncio.to_thread(
+                self.saved_searches.update_vector, saved.id, self.embedding_model, vector
             )
+        return len(stale)
 
-            points, next_offset = scroll_result
-
-            for point in points:
-                message_json = point.payload.get("message_json")
-                if message_json:
-                    message_data = json.loads(message_json)
-                    messages.append(message_data)
+    async def saved_search_inbox(
+        self,
+        search_id: int,
+        unread_only: bool = False,
+        offset: int = 0,
+        limit: int = 50
+    ) -> List[SavedSearchMatch]:
+        """Совпадения сохранённого поиска с сообщениями из архива"""
+        items = await asyncio.to_thread(
+            self.saved_searches.inbox, search_id, unread_only, offset, limit
+        )
+        stored = await asyncio.to_thread(self.archive.get_many, [item[0] for item in items])
+        matches = []
+        for point_id, score, matched_at, is_read in items:
+            message_data = stored.get(point_id)
+            if not message_data:
+                continue
+            matches.append(SavedSearchMatch(
+                message=TelegramMessage(**message_data),
+                score=score,
+                highlight=message_data["text"][:500],
+                matched_at=matched_at,
+                is_read=is_read
+            ))
+        return matches
 
-            if next_offset is None:
-                break
-            offset = next_offset
+    def get_available_sources(self) -> List[RAGSource]:
+        return [RAGSource(**source) for source in self.archive.sources()]
 
+    def get_all_messages(self) -> List[dict]:
+        """Получить все сообщения из архива"""
+        messages = []
+        for batch in self.archive.iter_messages():
+            messages.extend(batch)
         return messages
 
-    def get_stats(self) -> dict:
+    async def import_legacy_messages(self) -> int:
+        """Перенести сообщения из коллекции telegram_messages в локальный архив"""
+        marker = os.path.join(self.archive.root, ".legacy_imported")
+        if os.path.exists(marker):
+            return 0
+        
+        collections = [c.name for c in (await self.qdrant.get_collections()).collections]
+        imported = 0
+        if COLLECTION_MESSAGES in collections:
+            offset = None
+            while True:
+                points, offset = await self.qdrant.scroll(
+                    collection_name=COLLECTION_MESSAGES,
+                    limit=1000,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+                
+                items = []
+                for point in points:
+                    message_json = point.payload.get("message_json")
+                    if message_json:
+                        items.append(MessageRecord.from_message(
+                            TelegramMessage(**json.loads(message_json))
+                        ))
+                imported += await asyncio.to_thread(self.archive.append, items)
+                
+                if offset is None:
+                    break
+        
+        if imported:
+            await asyncio.to_thread(self.authors.rebuild, self.archive)
+        with open(marker, "w") as f:
+            f.write(datetime.utcnow().isoformat())
+        return imported
+
+    async def get_stats(self) -> dict:
         try:
-            emb_info = self.qdrant.get_collection(COLLECTION_EMBEDDINGS)
-            msg_info = self.qdrant.get_collection(COLLECTION_MESSAGES)
-            contacts_info = self.qdrant.get_collection(COLLECTION_CONTACTS)
+            embeddings_count = 0
+            for collection in await self.embedding_collections():
+                embeddings_count += (await self.qdrant.get_collection(collection)).points_count or 0
+            contacts_info = await self.qdrant.get_collection(COLLECTION_CONTACTS)
             
             return {
-                "embeddings_count": emb_info.points_count,
-                "messages_count": msg_info.points_count,
+                "embeddings_count": embeddings_count,
+                "messages_count": await asyncio.to_thread(self.archive.count),
                 "contacts_count": contacts_info.points_count,
-                "sources": len(self.get_available_sources())
+                "sources": len(await asyncio.to_thread(self.get_available_sources))
             }
         except Exception as e:
             return {"error": str(e)}
 
-    def delete_source(self, chat_id: int, topic_id: Optional[int] = None) -> dict:
-        """Удалить источник (чат/топик) из базы"""
-        try:
-            deleted_embeddings = 0
-            deleted_messages = 0
-            
-            # Формируем фильтр
-            filter_conditions = [
-                FieldCondition(
-                    key="chat_id",
-                    match=MatchValue(value=chat_id)
+    async def _count_embeddings(self, count_filter: Filter, chat_ids: Optional[List[int]] = None) -> int:
+        counts = await asyncio.gather(*(
+            self.qdrant.count(collection_name=collection, count_filter=count_filter, exact=True)
+            for collection in await self.embedding_collections(chat_ids)
+        ))
+        return sum(c.count for c in counts)
+
+    async def delete_source_embeddings(
+        self,
+        collection: str,
+        chat_id: int,
+        topic_id: Optional[int] = None,
+        advance: Optional[Callable[[int], None]] = None
+    ) -> int:
+        """Удалить векторы источника из коллекции (или её партиций); возвращает их число"""
+        filter_conditions = [FieldCondition(key="chat_id", match=MatchValue(value=chat_id))]
+        if topic_id is not None:
+            filter_conditions.append(FieldCondition(key="topic_id", match=MatchValue(value=topic_id)))
+        delete_filter = Filter(must=filter_conditions)
+
+        if not self.partitions.enabled:
+            collections = [collection]
+        else:
+            collections = list((await self.partitions.partitions(collection, [chat_id])).values())
+            if topic_id is None:
+                # Весь источник - это его партиция
+                deleted = 0
+                for partition in collections:
+                    deleted += (await self.qdrant.count(collection_name=partition, exact=True)).count
+                    await self.partitions.drop(partition)
+                if advance:
+                    advance(deleted)
+                return deleted
+
+        # Удаляем порциями, чтобы отдавать прогресс
+        deleted = 0
+        for target in collections:
+            while True:
+                points, _ = await self.qdrant.scroll(
+                    collection_name=target,
+                    scroll_filter=delete_filter,
+                    limit=DELETE_BATCH_SIZE,
+                    with_payload=False,
+                    with_vectors=False
                 )
-            ]
-            
-            if topic_id is not None:
-                filter_conditions.append(
-                    FieldCondition(
-                        key="topic_id",
-                        match=MatchValue(value=topic_id)
-                    )
+                if not points:
+                    break
+                await self.qdrant.delete(
+                    collection_name=target,
+                    points_selector=PointIdsList(points=[p.id for p in points])
                 )
-            
-            delete_filter = Filter(must=filter_conditions)
-            
+                deleted += len(points)
+                if advance:
+                    advance(len(points))
+        return deleted
+
+    def _log_deleted_source(self, chat_id: int, topic_id: Optional[int]):
+        # Одна короткая строка в режиме дозаписи - записи процессов не перемешиваются
+        entry = {"chat_id": chat_id, "topic_id": topic_id, "seq": time.time_ns() // 1000}
+        with open(os.path.join(self.settings.data_dir, DELETED_SOURCES_FILE), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def deleted_sources(self, offset: int = 0) -> Tuple[List[dict], int]:
+        """Удаления источников после offset байт журнала и новый offset"""
+        path = os.path.join(self.settings.data_dir, DELETED_SOURCES_FILE)
+        if not os.path.exists(path):
+            return [], 0
+        with open(path) as f:
+            f.seek(offset)
+            data = f.read()
+        # Недописанная последняя строка читается в следующий раз
+        complete = data[:data.rfind("\n") + 1]
+        return [json.loads(line) for line in complete.splitlines()], offset + len(complete.encode())
+
+    async def delete_source(
+        self,
+        chat_id: int,
+        topic_id: Optional[int] = None,
+        job: Optional[JobInfo] = None
+    ) -> dict:
+        """Удалить источник (чат/топик) из базы; прогресс пишется в job"""
+        job = job or JobInfo(id="", kind="delete_source", created_at=datetime.utcnow())
+        
+        def advance(count: int):
+            job.done += count
+        
+        filter_conditions = [FieldCondition(key="chat_id", match=MatchValue(value=chat_id))]
+        if topic_id is not None:
+            filter_conditions.append(FieldCondition(key="topic_id", match=MatchValue(value=topic_id)))
+        
+        # Переиндексация переключает alias только после завершения удаления
+        # и повторяет его в новой коллекции по журналу
+        async with self.index_lock.shared():
             # Считаем сколько удалим
-            scroll_result = self.qdrant.scroll(
-                collection_name=COLLECTION_EMBEDDINGS,
-                scroll_filter=delete_filter,
-                limit=10000,
-                with_payload=False,
-                with_vectors=False
-            )
-            deleted_embeddings = len(scroll_result[0])
+            job.stage = "counting"
+            total_embeddings = await self._count_embeddings(Filter(must=filter_conditions), [chat_id])
+            total_messages = await asyncio.to_thread(self.archive.count, chat_id, topic_id)
+            author_ids = await asyncio.to_thread(self.archive.author_ids, chat_id, topic_id)
+            job.total = total_embeddings + total_messages
             
-            # Удаляем из embeddings
-            self.qdrant.delete(
-                collection_name=COLLECTION_EMBEDDINGS,
-                points_selector=delete_filter
+            job.stage = "embeddings"
+            deleted_embeddings = await self.delete_source_embeddings(
+                COLLECTION_EMBEDDINGS, chat_id, topic_id, advance
             )
             
-            # Удаляем из messages
-            self.qdrant.delete(
-                collection_name=COLLECTION_MESSAGES,
-                points_selector=delete_filter
+            # Удаляем из архива
+            job.stage = "messages"
+            deleted_messages = await asyncio.to_thread(
+                self.archive.delete, chat_id, topic_id, on_progress=advance
             )
-            
-            return {
-                "success": True,
-                "deleted_embeddings": deleted_embeddings,
-                "deleted_messages": deleted_embeddings,
-                "chat_id": chat_id,
-                "topic_id": topic_id
-            }
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+            await asyncio.to_thread(self._log_deleted_source, chat_id, topic_id)
+        
+        # Признаки авторов удалённого источника пересчитываются из архива
+        await asyncio.to_thread(self.authors.rebuild, self.archive, list(author_ids))
+        
+        # Контакты, у которых не осталось сообщений
+        job.stage = "contacts"
+        orphans = author_ids - await asyncio.to_thread(self.archive.authors_with_messages, author_ids)
+        deleted_contacts = await self.delete_contacts(list(orphans))
+        
+        job.stage = None
+        return {
+            "success": True,
+            "deleted_embeddings": deleted_embeddings,
+            "deleted_messages": deleted_messages,
+            "deleted_contacts": deleted_contacts,
+            "chat_id": chat_id,
+            "topic_id": topic_id
+        }
+
+    async def delete_contacts(self, user_ids: List[int]) -> int:
+        """Удалить контакты и их эмбеддинги bio.
+
+        По фильтру в Qdrant, а не по _known_contacts: множество есть не в
+        каждом процессе и могло устареть.
+        """
+        deleted = 0
+        for i in range(0, len(user_ids), DELETE_BATCH_SIZE):
+            chunk = user_ids[i:i+DELETE_BATCH_SIZE]
+            contacts_filter = Filter(must=[FieldCondition(key="user_id", match=MatchAny(any=chunk))])
+            deleted += (await self.qdrant.count(
+                collection_name=COLLECTION_CONTACTS,
+                count_filter=contacts_filter,
+                exact=True
+            )).count
+            for collection in (COLLECTION_CONTACTS, COLLECTION_CONTACTS_EMBEDDINGS):
+                await self.qdrant.delete(
+                    collection_name=collection,
+                    points_selector=FilterSelector(filter=contacts_filter)
+                )
+        self._known_contacts.difference_update(user_ids)
+        return deleted
 
 
-rag_service = RAGService()
+@lru_cache()
+def get_rag_service() -> RAGService:
+    return RAGService()
@@ -0,0 +1,59 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+from app.models import TelegramMessage
+
+
+def message_point_id(chat_id: int, message_id: int, topic_id: Optional[int] = None) -> str:
+    if topic_id:
+        return f"{chat_id}_{topic_id}_{message_id}"
+    return f"{chat_id}_{message_id}"
+
+
+@dataclass(slots=True)
+class MessageRecord:
+    """Сообщение на пути ингеста: плоские поля без валидации pydantic.
+
+    TelegramMessage собирается только на границе API (выдача поиска).
+    """
+    id: int
+    chat_id: int
+    chat_title: str
+    author_id: int
+    text: str
+    date: datetime
+    chat_username: Optional[str] = None
+    topic_id: Optional[int] = None
+    topic_title: Optional[str] = None
+    author_username: Optional[str] = None
+    author_first_name: Optional[str] = None
+    author_last_name: Optional[str] = None
+    reply_to_msg_id: Optional[int] = None
+    views: Optional[int] = None
+    forwards: Optional[int] = None
+    # None - неизвестно (сообщения, скачанные до появления флага в архиве)
+    author_is_bot: Optional[bool] = None
+    point_id: str = field(init=False)
+
+    def __post_init__(self):
+        self.point_id = message_point_id(self.chat_id, self.id, self.topic_id)
+
+    @classmethod
+    def from_message(cls, message: TelegramMessage) -> "MessageRecord":
+        return cls(
+            id=message.id,
+            chat_id=message.chat_id,
+            chat_title=message.chat_title,
+            author_id=message.author.id,
+            text=message.text,
+            date=message.date,
+            chat_username=message.chat_username,
+            topic_id=message.topic_id,
+            topic_title=message.topic_title,
+            author_username=message.author.username,
+            author_first_name=message.author.first_name,
+            author_last_name=message.author.last_name,
+            reply_to_msg_id=message.reply_to_msg_id,
+            views=message.views,
+            forwards=message.forwards
+        )
@@ -0,0 +1,323 @@
+import os
+import json
+import asyncio
+from contextlib import AsyncExitStack
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from app.models import JobInfo, ContactInfo, ReindexRequest
+from app.records import MessageRecord
+from app.rag_service import (
+    get_rag_service, RAGService,
+    COLLECTION_EMBEDDINGS, COLLECTION_CONTACTS, COLLECTION_CONTACTS_EMBEDDINGS,
+    versioned_collection
+)
+from app.partitions import partition_name
+from app.locks import FileLock, LockBusy
+
+
+CHECKPOINT_FILE = "reindex_checkpoint.json"
+# Одна переиндексация на data_dir: воркер и app.cli работают по одному чекпоинту
+REINDEX_LOCK_FILE = "reindex.lock"
+
+
+class Reindexer:
+    """Переиндексация архива в новую версию коллекций с переключением alias.
+
+    Поиск продолжает работать по старым коллекциям, пока новые не готовы.
+    Прогресс сохраняется в чекпоинт, прерванный запуск продолжается с него.
+    """
+
+    def __init__(self, rag: RAGService):
+        self.rag = rag
+        self.settings = rag.settings
+        self.checkpoint_path = os.path.join(self.settings.data_dir, CHECKPOINT_FILE)
+        self.lock = FileLock(os.path.join(self.settings.data_dir, REINDEX_LOCK_FILE))
+        self._running = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def _load_checkpoint(self) -> Optional[dict]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def _save_checkpoint(self, checkpoint: dict):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    async def _next_version(self) -> int:
+        """Следующая версия, общая для всех векторных коллекций"""
+        names = [c.name for c in (await self.rag.qdrant.get_collections()).collections]
+        versions = []
+        for alias in (COLLECTION_EMBEDDINGS, COLLECTION_CONTACTS_EMBEDDINGS):
+            prefix = f"{alias}_v"
+            for name in names:
+                suffix = name[len(prefix):]
+                if name.startswith(prefix) and suffix.isdigit():
+                    versions.append(int(suffix))
+        # Коллекции без версии считаются v1
+        return max(versions, default=1) + 1
+
+    async def _start(self, request: ReindexRequest) -> dict:
+        """Новый чекпоинт с созданными целевыми коллекциями"""
+        model = request.embedding_model or self.settings.embedding_model
+        dim = request.embedding_dim
+        if not dim:
+            probe = await self.rag.get_embeddings_batch(["probe"], model=model)
+            dim = len(probe[0])
+
+        version = await self._next_version()
+        checkpoint = {
+            "params": request.model_dump(),
+            "model": model,
+            "dim": dim,
+            "collections": {
+                COLLECTION_EMBEDDINGS: versioned_collection(COLLECTION_EMBEDDINGS, version),
+                COLLECTION_CONTACTS_EMBEDDINGS: versioned_collection(COLLECTION_CONTACTS_EMBEDDINGS, version)
+            },
+            "positions": {},
+            "indexed": 0,
+            "contacts_done": False,
+            # Удаления источников с этого места журнала повторяются в новой коллекции
+            "deletes_offset": (await asyncio.to_thread(self.rag.deleted_sources))[1]
+        }
+
+        for collection in checkpoint["collections"].values():
+            await self.rag.create_vector_collection(
+                collection, dim, request.hnsw_m, request.hnsw_ef_construct
+            )
+        await self.rag.ensure_embeddings_indexes(
+            checkpoint["collections"][COLLECTION_EMBEDDINGS]
+        )
+        self._save_checkpoint(checkpoint)
+        return checkpoint
+
+    async def _drop(self, checkpoint: dict):
+        """Удалить коллекции брошенного чекпоинта с другими параметрами"""
+        active = [await self.rag.get_alias_target(a) for a in checkpoint["collections"]]
+        for collection in checkpoint["collections"].values():
+            if collection not in active:
+                await self.rag.qdrant.delete_collection(collection)
+        partitions = await self.rag.partitions.partitions(
+            checkpoint["collections"][COLLECTION_EMBEDDINGS], refresh=True
+        )
+        for collection in partitions.values():
+            await self.rag.partitions.drop(collection)
+        os.remove(self.checkpoint_path)
+
+    async def _iter_archive(self, positions: dict) -> AsyncIterator[Tuple[int, int, List[MessageRecord]]]:
+        """Батчи архива после сохранённых позиций: (chat_id, seq, messages)"""
+        for chat_id in await asyncio.to_thread(self.rag.archive.chat_ids):
+            after = positions.get(str(chat_id), 0)
+            batches = self.rag.archive.iter_records(chat_id, after, self.settings.reindex_batch_size)
+            while True:
+                # Чтение SQLite - в потоке, цикл событий API и воркера не ждёт
+                item = await asyncio.to_thread(next, batches, None)
+                if item is None:
+                    break
+                seq, batch = item
+                yield chat_id, seq, batch
+
+    async def _index_batch(self, checkpoint: dict, batch: List[MessageRecord]):
+        batch, _ = self.rag.ingest_filters.select(batch)
+        points, failed = await self.rag.embed_messages(
+            batch,
+            model=checkpoint["model"],
+            dimensions=checkpoint["params"]["embedding_dim"]
+        )
+        if failed:
+            # Чекпоинт не сдвигается, повторный запуск продолжит с этого батча
+            raise RuntimeError(f"Failed to embed {len(failed)} messages")
+        # Ждём применения: после прохода alias переключается на эту коллекцию
+        await self.rag.upsert_embeddings(
+            checkpoint["collections"][COLLECTION_EMBEDDINGS], points, wait=True
+        )
+
+    async def _index_window(self, checkpoint: dict, window: List[Tuple[int, int, List[MessageRecord]]], job: JobInfo):
+        # Окно из нескольких батчей эмбеддится параллельно
+        await asyncio.gather(*(
+            self._index_batch(checkpoint, batch) for _, _, batch in window
+        ))
+
+        for chat_id, seq, batch in window:
+            checkpoint["positions"][str(chat_id)] = seq
+            checkpoint["indexed"] += len(batch)
+        job.done = checkpoint["indexed"]
+        self._save_checkpoint(checkpoint)
+
+    async def _reindex_messages(self, checkpoint: dict, job: JobInfo):
+        window = []
+        async for item in self._iter_archive(checkpoint["positions"]):
+            window.append(item)
+            if len(window) >= self.settings.reindex_concurrency:
+                await self._index_window(checkpoint, window, job)
+                window = []
+        if window:
+            await self._index_window(checkpoint, window, job)
+
+    async def _replay_deletes(self, checkpoint: dict):
+        """Удалить из новой коллекции источники, удалённые за время прохода"""
+        deletes, checkpoint["deletes_offset"] = await asyncio.to_thread(
+            self.rag.deleted_sources, checkpoint["deletes_offset"]
+        )
+        for entry in deletes:
+            await self.rag.delete_source_embeddings(
+                checkpoint["collections"][COLLECTION_EMBEDDINGS], entry["chat_id"], entry["topic_id"]
+            )
+            # Скачанное заново после удаления пишется последним проходом ещё раз
+            key = str(entry["chat_id"])
+            if key in checkpoint["positions"]:
+                checkpoint["positions"][key] = min(checkpoint["positions"][key], entry["seq"])
+        self._save_checkpoint(checkpoint)
+
+    async def _load_contacts(self) -> List[ContactInfo]:
+        contacts = []
+        offset = None
+        while True:
+            points, offset = await self.rag.qdrant.scroll(
+                collection_name=COLLECTION_CONTACTS,
+                limit=1000,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+            for point in points:
+                contact = ContactInfo(**json.loads(point.payload["contact_json"]))
+                if contact.bio:
+                    contacts.append(contact)
+            if offset is None:
+                return contacts
+
+    async def _indexed_bios(self, collection: str) -> Dict[int, str]:
+        """bio контактов, уже записанных в коллекцию: id точки -> bio"""
+        bios = {}
+        offset = None
+        while True:
+            points, offset = await self.rag.qdrant.scroll(
+                collection_name=collection,
+                limit=1000,
+                offset=offset,
+                with_payload=["bio"],
+                with_vectors=False
+            )
+            bios.update((point.id, point.payload.get("bio")) for point in points)
+            if offset is None:
+                return bios
+
+    async def _reindex_contacts(self, checkpoint: dict, changed_only: bool = False):
+        contacts = await self._load_contacts()
+        if changed_only:
+            # Добавленные и обновлённые после прохода по контактам
+            bios = await self._indexed_bios(checkpoint["collections"][COLLECTION_CONTACTS_EMBEDDINGS])
+            contacts = [c for c in contacts if bios.get(c.id % (2**63)) != c.bio]
+        batch_size = self.settings.reindex_batch_size
+        for i in range(0, len(contacts), batch_size):
+            batch = contacts[i:i+batch_size]
+            embeddings = await self.rag.get_embeddings_batch(
+                [self.rag.contact_index_text(c) for c in batch],
+                model=checkpoint["model"],
+                dimensions=checkpoint["params"]["embedding_dim"]
+            )
+            await self.rag.qdrant.upsert(
+                collection_name=checkpoint["collections"][COLLECTION_CONTACTS_EMBEDDINGS],
+                points=[
+                    self.rag.contact_embedding_point(contact, embedding)
+                    for contact, embedding in zip(batch, embeddings)
+                ]
+            )
+        checkpoint["contacts_done"] = True
+        self._save_checkpoint(checkpoint)
+
+    async def run(self, request: ReindexRequest, job: JobInfo) -> dict:
+        """Переиндексировать; LockBusy, если она уже идёт в этом или другом процессе"""
+        async with AsyncExitStack() as stack:
+            try:
+                await stack.enter_async_context(self.lock.exclusive(wait=False))
+            except LockBusy:
+                raise LockBusy("Reindex is already running") from None
+            self._running = True
+            try:
+                return await self._run(request, job)
+            finally:
+                self._running = False
+
+    async def _run(self, request: ReindexRequest, job: JobInfo) -> dict:
+        job.stage = "preparing"
+        checkpoint = self._load_checkpoint()
+        if checkpoint and checkpoint["params"] != request.model_dump():
+            await self._drop(checkpoint)
+            checkpoint = None
+        if checkpoint is None:
+            checkpoint = await self._start(request)
+        elif "deletes_offset" not in checkpoint:
+            # Чекпоинт до журнала удалений: прежние удаления уже не восстановить
+            checkpoint["deletes_offset"] = (await asyncio.to_thread(self.rag.deleted_sources))[1]
+
+        job.total = await asyncio.to_thread(self.rag.archive.count)
+        job.done = checkpoint["indexed"]
+
+        job.stage = "messages"
+        await self._reindex_messages(checkpoint, job)
+        # Догоняем сообщения, проиндексированные в старую коллекцию за время прохода
+        job.stage = "catch_up"
+        await self._reindex_messages(checkpoint, job)
+
+        if not checkpoint["contacts_done"]:
+            job.stage = "contacts"
+            await self._reindex_contacts(checkpoint)
+
+        job.stage = "switching"
+        # Ингест ждёт: за последним проходом и до смены модели в старую
+        # коллекцию ничего не пишется, а после - пишется уже новой моделью
+        async with self.rag.index_lock.exclusive():
+            await self._replay_deletes(checkpoint)
+            await self._reindex_messages(checkpoint, job)
+            await self._reindex_contacts(checkpoint, changed_only=True)
+
+            targets = dict(checkpoint["collections"])
+            stale = {}
+            if self.rag.partitions.enabled:
+                # Партиции источников переключаются тем же атомарным запросом
+                partitions = await self.rag.partitions.partitions(
+                    checkpoint["collections"][COLLECTION_EMBEDDINGS], refresh=True
+                )
+                for chat_id, collection in partitions.items():
+                    targets[partition_name(COLLECTION_EMBEDDINGS, chat_id)] = collection
+                stale = await self.rag.partitions.partitions(COLLECTION_EMBEDDINGS)
+                stale = {c: name for c, name in stale.items() if c not in partitions}
+            previous = await self.rag.switch_aliases(targets)
+            # Последний проход прочитал весь архив, отметки относились к старой коллекции
+            await asyncio.to_thread(self.rag.archive.clear_unindexed)
+            self.rag.save_embedding_state(
+                checkpoint["model"],
+                checkpoint["dim"],
+                checkpoint["params"]["embedding_dim"]
+            )
+        for alias, collection in previous.items():
+            if collection and collection != targets[alias]:
+                await self.rag.qdrant.delete_collection(collection)
+        # Источники, которых нет в новой версии (удалены за время прохода)
+        for alias in stale.values():
+            await self.rag.partitions.drop(alias)
+        os.remove(self.checkpoint_path)
+        # Векторы сохранённых поисков - в пространство новой модели
+        await self.rag.refresh_saved_searches()
+
+        job.stage = None
+        return {
+            "success": True,
+            "indexed": checkpoint["indexed"],
+            "model": checkpoint["model"],
+            "dim": checkpoint["dim"],
+            "collections": checkpoint["collections"]
+        }
+
+
+@lru_cache()
+def get_reindexer() -> Reindexer:
+    return Reindexer(get_rag_service())
@@ -0,0 +1,154 @@
+import time
+import random
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import httpx
+from app.metrics import OPENAI_RETRIES, OPENAI_CIRCUIT_OPEN
+
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+
+
+class CircuitOpen(Exception):
+    """Эндпоинт временно отключён после серии ошибок"""
+
+
+class CircuitBreaker:
+    """Размыкается после failure_threshold ошибок подряд.
+
+    Через reset_seconds пропускает один пробный запрос: успех замыкает цепь,
+    ошибка снова размыкает.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._gauge = OPENAI_CIRCUIT_OPEN.labels(name)
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if time.monotonic() - self._opened_at < self.reset_seconds or self._trial:
+            return False
+        self._trial = True
+        return True
+
+    def cancel_trial(self):
+        """Пробный запрос не дошёл до ответа (отменён): следующий вызов пробует снова"""
+        self._trial = False
+
+    def success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._gauge.set(0)
+
+    def failure(self):
+        self._failures += 1
+        if self._trial or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._trial = False
+            self._gauge.set(1)
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Пауза, которую просит сервер (retry-after-ms у OpenAI или Retry-After)"""
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class ResilientEndpoint:
+    """POST-запросы к одному эндпоинту API с ограничением параллельности,
+    повторами с экспоненциальной паузой и предохранителем.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+        breaker: CircuitBreaker
+    ):
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: случайная пауза до экспоненциального предела
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def post(self, http: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpen(f"OpenAI {self.name} circuit is open")
+            # Цепь разомкнута, но запрос пропущен - значит, это пробный
+            trial = self.breaker.is_open
+
+            try:
+                async with self._semaphore:
+                    response = await http.post(url, **kwargs)
+            except httpx.TransportError as e:
+                error, delay, reason = e, None, "network"
+            except BaseException:
+                # Отмена (клиент ушёл, таймаут) не говорит ни об успехе, ни об ошибке
+                if trial:
+                    self.breaker.cancel_trial()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    # Ошибки входа (400 и т.п.) не говорят о сбое API
+                    self.breaker.success()
+                    response.raise_for_status()
+                    return response
+                error = httpx.HTTPStatusError(
+                    f"OpenAI {self.name} returned {response.status_code}",
+                    request=response.request,
+                    response=response
+                )
+                delay, reason = retry_after(response), str(response.status_code)
+
+            self.breaker.failure()
+            if attempt >= self.max_retries:
+                raise error
+            if delay is None:
+                delay = self._backoff(attempt)
+            elif delay > self.backoff_max:
+                # Ждать дольше, чем готовы, смысла нет
+                raise error
+            else:
+                delay += random.uniform(0, self.backoff_base)
+
+            OPENAI_RETRIES.labels(self.name, reason).inc()
+            attempt += 1
+            await asyncio.sleep(delay)
@@ -1,51 +1,79 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
-from app.telegram_client import telegram_service
+from fastapi import APIRouter, Query, Response
+from typing import List, Optional
+from app import telegram_calls
 from app.models import (
     ChatInfo, ForumTopic, AuthStatus,
-    AuthCodeRequest, Auth2FARequest
+    AuthCodeRequest, Auth2FARequest,
+    AccountCreate, AccountInfo
 )
 
 router = APIRouter(prefix="/api/chats", tags=["chats"])
 
 
+@router.get("/accounts", response_model=List[AccountInfo])
+async def get_accounts():
+    """Аккаунты пула с состоянием"""
+    return await telegram_calls.call("accounts")
+
+
+@router.post("/accounts", response_model=AccountInfo)
+async def add_account(request: AccountCreate):
+    """Добавить аккаунт в пул (авторизация - через /auth с ?account=)"""
+    return await telegram_calls.call("add_account", name=request.name, phone=request.phone)
+
+
+@router.delete("/accounts/{name}")
+async def remove_account(name: str):
+    """Убрать аккаунт из пула (основной удалить нельзя)"""
+    return await telegram_calls.call("remove_account", name=name)
+
+
 @router.get("/auth/status", response_model=dict)
-async def get_auth_status():
+async def get_auth_status(account: Optional[str] = Query(default=None)):
     """Получить статус авторизации Telegram"""
-    return await telegram_service.get_auth_status()
+    return await telegram_calls.call("auth_status", account=account)
 
 
 @router.post("/auth/send-code")
-async def send_auth_code():
+async def send_auth_code(account: Optional[str] = Query(default=None)):
     """Отправить код авторизации на телефон"""
-    return await telegram_service.send_code()
+    return await telegram_calls.call("send_code", account=account)
 
 
 @router.post("/auth/verify-code")
-async def verify_auth_code(request: AuthCodeRequest):
+async def verify_auth_code(
+    request: AuthCodeRequest,
+    account: Optional[str] = Query(default=None)
+):
     """Подтвердить код авторизации"""
-    return await telegram_service.sign_in_with_code(request.code)
+    return await telegram_calls.call("verify_code", code=request.code, account=account)
 
 
 @router.post("/auth/verify-2fa")
-async def verify_2fa(request: Auth2FARequest):
+async def verify_2fa(
+    request: Auth2FARequest,
+    account: Optional[str] = Query(default=None)
+):
     """Подтвердить двухфакторную аутентификацию"""
-    return await telegram_service.sign_in_with_2fa(request.password)
+    return await telegram_calls.call("verify_2fa", password=request.password, account=account)
 
 
 @router.get("/", response_model=List[ChatInfo])
-async def get_chats():
-    """Получить список всех диалогов"""
-    if not await telegram_service.is_authorized():
-        raise HTTPException(status_code=401, detail="Not authorized in Telegram")
-    
-    return await telegram_service.get_dialogs()
+async def get_chats(
+    response: Response,
+    offset: int = Query(default=0, ge=0),
+    limit: Optional[int] = Query(default=None, ge=1, description="Без лимита - все диалоги"),
+    q: Optional[str] = Query(default=None, description="Поиск по названию и username")
+):
+    """Получить список диалогов (из кэша, с пагинацией и поиском)"""
+    page = await telegram_calls.call("dialogs", offset=offset, limit=limit, query=q)
+    # Пока список не загружен целиком, total - нижняя граница
+    response.headers["X-Total-Count"] = str(page["total"])
+    response.headers["X-Dialogs-Complete"] = "true" if page["complete"] else "false"
+    return page["chats"]
 
 
 @router.get("/{chat_id}/topics", response_model=List[ForumTopic])
 async def get_chat_topics(chat_id: int):
     """Получить топики форума (если чат - форум)"""
-    if not await telegram_service.is_authorized():
-        raise HTTPException(status_code=401, detail="Not authorized in Telegram")
-    
-    return await telegram_service.get_forum_topics(chat_id)
+    return await telegram_calls.call("topics", chat_id=chat_id)
@@ -1,9 +1,18 @@
-from fastapi import APIRouter, Query
+import re
+import asyncio
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query, Response
 from fastapi.responses import JSONResponse
 from typing import List, Optional
 from pydantic import BaseModel
-from app.rag_service import rag_service
-from app.models import RAGQuery, RAGResponse, RAGSource, RAGResult, ContactInfo
+from app.rag_service import get_rag_service
+from app.jobs import get_job_manager
+from app.models import (
+    RAGQuery, RAGResponse, RAGSource, RAGResult, ContactInfo,
+    JobInfo, ReindexRequest, AuthorRank,
+    SavedSearch, SavedSearchCreate, SavedSearchMatch, IngestFilterConfig
+)
+from app.author_stats import SORT_FIELDS
 
 router = APIRouter(prefix="/api/rag", tags=["rag"])
 
@@ -22,13 +31,13 @@ class ContactSearchResult(BaseModel):
 @router.get("/sources", response_model=List[RAGSource])
 async def get_sources():
     """Получить список доступных источников (скачанных чатов)"""
-    return rag_service.get_available_sources()
+    return await asyncio.to_thread(get_rag_service().get_available_sources)
 
 
 @router.get("/sources/export")
 async def export_sources():
     """Экспорт источников в JSON"""
-    sources = rag_service.get_available_sources()
+    sources = await asyncio.to_thread(get_rag_service().get_available_sources)
     return JSONResponse(
         content=[s.model_dump() for s in sources],
         headers={
@@ -40,7 +49,7 @@ async def export_sources():
 @router.get("/messages/export")
 async def export_messages():
     """Экспорт всех сообщений в JSON"""
-    messages = rag_service.get_all_messages()
+    messages = await asyncio.to_thread(get_rag_service().get_all_messages)
     return JSONResponse(
         content=messages,
         headers={
@@ -53,15 +62,23 @@ async def export_messages():
 async def search_messages(
     query: RAGQuery,
     min_text_length: int = Query(default=50, description="Минимальная длина текста сообщения"),
-    expand_query: bool = Query(default=True, description="Расширять запрос через LLM")
+    expand_query: bool = Query(default=True, description="Расширять запрос через LLM"),
+    with_context: bool = Query(default=False, description="Добавить ветку ответов и соседние сообщения"),
+    context_size: int = Query(default=2, ge=0, le=20, description="Соседних сообщений с каждой стороны")
 ):
     """Поиск сообщений по запросу с фильтрацией по источникам"""
-    results = await rag_service.search(
+    results = await get_rag_service().search(
         query=query.query,
         chat_ids=query.sources,
         top_k=query.top_k,
         min_text_length=min_text_length,
-        expand_query=expand_query
+        expand_query=expand_query,
+        with_context=with_context,
+        context_size=context_size,
+        date_from=query.date_from,
+        date_to=query.date_to,
+        author_ids=query.authors,
+        min_views=query.min_views
     )
     
     return RAGResponse(
@@ -71,16 +88,72 @@ async def search_messages(
     )
 
 
+@router.get("/saved-searches", response_model=List[SavedSearch])
+async def list_saved_searches():
+    """Сохранённые поиски с числом непрочитанных совпадений"""
+    return await asyncio.to_thread(get_rag_service().saved_searches.list)
+
+
+@router.post("/saved-searches", response_model=SavedSearch)
+async def create_saved_search(request: SavedSearchCreate):
+    """Сохранить поиск: новые сообщения будут сопоставляться с ним при индексации"""
+    return await get_rag_service().create_saved_search(request)
+
+
+@router.delete("/saved-searches/{search_id}")
+async def delete_saved_search(search_id: int):
+    """Удалить сохранённый поиск вместе с входящими"""
+    if not await asyncio.to_thread(get_rag_service().saved_searches.delete, search_id):
+        raise HTTPException(status_code=404, detail="Saved search not found")
+    return {"success": True, "id": search_id}
+
+
+@router.get("/saved-searches/{search_id}/inbox", response_model=List[SavedSearchMatch])
+async def get_saved_search_inbox(
+    search_id: int,
+    unread_only: bool = Query(default=False),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=50, ge=1, le=500)
+):
+    """Входящие совпадения сохранённого поиска, новые сверху"""
+    if not await asyncio.to_thread(get_rag_service().saved_searches.get, search_id):
+        raise HTTPException(status_code=404, detail="Saved search not found")
+    return await get_rag_service().saved_search_inbox(search_id, unread_only, offset, limit)
+
+
+@router.post("/saved-searches/{search_id}/inbox/read")
+async def mark_saved_search_read(search_id: int):
+    """Отметить все совпадения поиска прочитанными"""
+    marked = await asyncio.to_thread(get_rag_service().saved_searches.mark_read, search_id)
+    return {"success": True, "marked": marked}
+
+
+@router.get("/ingest-filters", response_model=IngestFilterConfig)
+async def get_ingest_filters():
+    """Правила отбора сообщений для эмбеддинга"""
+    return await asyncio.to_thread(get_rag_service().ingest_filters.config)
+
+
+@router.put("/ingest-filters", response_model=IngestFilterConfig)
+async def update_ingest_filters(config: IngestFilterConfig):
+    """Заменить правила; действуют на новые батчи индексации и переиндексацию"""
+    try:
+        await asyncio.to_thread(get_rag_service().ingest_filters.save, config)
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid pattern: {e}")
+    return config
+
+
 @router.get("/contacts", response_model=List[ContactInfo])
 async def get_contacts():
     """Получить все контакты"""
-    return rag_service.get_all_contacts()
+    return await get_rag_service().get_all_contacts()
 
 
 @router.get("/contacts/export")
 async def export_contacts():
     """Экспорт контактов в JSON"""
-    contacts = rag_service.get_all_contacts()
+    contacts = await get_rag_service().get_all_contacts()
     return JSONResponse(
         content=[c.model_dump() for c in contacts],
         headers={
@@ -95,19 +168,22 @@ async def search_contacts(
     expand_query: bool = Query(default=True, description="Расширять запрос через LLM")
 ):
     """Поиск контактов по bio"""
-    results = await rag_service.search_contacts(
+    results = await get_rag_service().search_contacts(
         query=query.query,
         top_k=query.top_k,
         expand_query=expand_query
     )
     
     # Добавляем количество сообщений
+    counts = await asyncio.gather(*(
+        get_rag_service().get_contact_messages_count(r["contact"].id) for r in results
+    ))
     enriched_results = []
-    for r in results:
+    for r, messages_count in zip(results, counts):
         enriched_results.append({
             "contact": r["contact"].model_dump(),
             "score": r["score"],
-            "messages_count": rag_service.get_contact_messages_count(r["contact"].id)
+            "messages_count": messages_count
         })
     
     return {
@@ -117,27 +193,84 @@ async def search_contacts(
     }
 
 
+@router.get("/contacts/ranking", response_model=List[AuthorRank])
+async def rank_contacts(
+    response: Response,
+    sort: str = Query(default="score", description=f"Одно из: {', '.join(SORT_FIELDS)}"),
+    descending: bool = Query(default=True),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=50, ge=1, le=1000),
+    min_messages: int = Query(default=0, ge=0),
+    min_chats: int = Query(default=0, ge=0),
+    has_bio: Optional[bool] = Query(default=None),
+    has_channel: Optional[bool] = Query(default=None),
+    active_since: Optional[datetime] = Query(default=None, description="Последнее сообщение не раньше")
+):
+    """Рейтинг авторов как лидов с фильтрами и пагинацией"""
+    if sort not in SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort field: {sort}")
+    rag_service = get_rag_service()
+    authors, total = await asyncio.to_thread(
+        rag_service.authors.rank,
+        sort, descending, offset, limit,
+        min_messages, min_chats, has_bio, has_channel, active_since
+    )
+    response.headers["X-Total-Count"] = str(total)
+    return authors
+
+
 @router.get("/contacts/{user_id}")
 async def get_contact(user_id: int):
     """Получить контакт по ID с количеством сообщений"""
-    contact = rag_service.get_contact(user_id)
+    contact = await get_rag_service().get_contact(user_id)
     if not contact:
         return {"error": "Contact not found"}
     
     return {
         "contact": contact.model_dump(),
-        "messages_count": rag_service.get_contact_messages_count(user_id)
+        "messages_count": await get_rag_service().get_contact_messages_count(user_id)
     }
 
 
 @router.get("/stats")
 async def get_rag_stats():
     """Получить статистику RAG"""
-    return rag_service.get_stats()
+    return await get_rag_service().get_stats()
 
 
 @router.delete("/sources/{chat_id}")
 async def delete_source(chat_id: int, topic_id: Optional[int] = Query(default=None)):
-    """Удалить источник из базы"""
-    result = rag_service.delete_source(chat_id, topic_id)
-    return result
+    """Удалить источник из базы (в фоне, прогресс - в /jobs/{job_id})"""
+    job = get_job_manager().submit(
+        "delete_source",
+        {"chat_id": chat_id, "topic_id": topic_id}
+    )
+    return {
+        "success": True,
+        "job_id": job.id,
+        "chat_id": chat_id,
+        "topic_id": topic_id
+    }
+
+
+@router.post("/reindex", response_model=JobInfo)
+async def reindex(request: ReindexRequest):
+    """Переиндексировать архив в новую версию коллекций (поиск работает по старой)"""
+    if get_job_manager().has_active("reindex"):
+        raise HTTPException(status_code=409, detail="Reindex is already running")
+    return get_job_manager().submit("reindex", request.model_dump())
+
+
+@router.get("/jobs", response_model=List[JobInfo])
+async def list_jobs(kind: Optional[str] = Query(default=None)):
+    """Список фоновых задач"""
+    return get_job_manager().list(kind)
+
+
+@router.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str):
+    """Статус и прогресс фоновой задачи"""
+    job = get_job_manager().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,25 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Query
+from typing import List
+from app.jobs import get_job_manager
+from app.models import JobInfo, SnapshotInfo
+from app.snapshots import get_snapshot_manager
+
+router = APIRouter(prefix="/api/snapshots", tags=["snapshots"])
+
+
+@router.get("", response_model=List[SnapshotInfo])
+async def list_snapshots():
+    """Снимки индекса, старые сверху"""
+    return await asyncio.to_thread(get_snapshot_manager().list)
+
+
+@router.post("", response_model=JobInfo)
+async def create_snapshot(full: bool = Query(default=False, description="Полный снимок вместо инкрементального")):
+    """Снять снимок коллекций и локальных хранилищ (в фоне, прогресс - в /api/rag/jobs/{job_id}).
+
+    Восстановление - только из CLI при остановленном сервисе: python -m app.snapshots restore <name>
+    """
+    if get_job_manager().has_active("snapshot"):
+        raise HTTPException(status_code=409, detail="Snapshot is already running")
+    return get_job_manager().submit("snapshot", {"full": full})
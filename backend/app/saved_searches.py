@@ -0,0 +1,234 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from qdrant_client.http.models import PointStruct
+from app.models import SavedSearch, SavedSearchCreate
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    query TEXT NOT NULL,
+    expanded_query TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    min_score REAL NOT NULL,
+    min_text_length INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inbox (
+    search_id INTEGER NOT NULL,
+    point_id TEXT NOT NULL,
+    score REAL NOT NULL,
+    matched_at TEXT NOT NULL,
+    is_read INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (search_id, point_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_inbox_unread ON inbox (search_id, is_read, matched_at);
+"""
+
+SEARCH_COLUMNS = (
+    "id, name, query, expanded_query, sources, min_score, min_text_length, model, created_at"
+)
+
+# Повторное совпадение (другой кусок, повторная загрузка) оставляет лучший score
+UPSERT_MATCH = (
+    "INSERT INTO inbox (search_id, point_id, score, matched_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(search_id, point_id) DO UPDATE SET score = MAX(score, excluded.score)"
+)
+
+
+def normalize(vector) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array, axis=-1, keepdims=True)
+    return array / np.where(norm == 0, 1, norm)
+
+
+class SavedSearchStore:
+    """Сохранённые поиски и их входящие совпадения в локальном SQLite.
+
+    Запрос расширяется и эмбеддится один раз при сохранении; новые точки
+    после каждого батча индексации сравниваются со всеми поисками одним
+    матричным произведением.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # Матрица векторов поисков; перечитывается, если базу менял другой процесс
+        self._matrix: Optional[Tuple[str, np.ndarray, List[dict]]] = None
+        self._data_version: Optional[int] = None
+
+    def _row_to_search(self, row: tuple, unread: int = 0) -> SavedSearch:
+        search_id, name, query, expanded_query, sources, min_score, min_text_length, model, created_at = row
+        return SavedSearch(
+            id=search_id,
+            name=name,
+            query=query,
+            expanded_query=expanded_query,
+            sources=json.loads(sources),
+            min_score=min_score,
+            min_text_length=min_text_length,
+            model=model,
+            created_at=datetime.fromisoformat(created_at),
+            unread=unread
+        )
+
+    def create(self, request: SavedSearchCreate, expanded_query: str, model: str, vector: List[float]) -> SavedSearch:
+        created_at = datetime.utcnow()
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "INSERT INTO searches (name, query, expanded_query, sources, min_score, "
+                    "min_text_length, model, vector, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (request.name, request.query, expanded_query, json.dumps(request.sources),
+                     request.min_score, request.min_text_length, model,
+                     normalize(vector).tobytes(), created_at.isoformat())
+                )
+            self._matrix = None
+        return self.get(cursor.lastrowid)
+
+    def get(self, search_id: int) -> Optional[SavedSearch]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {SEARCH_COLUMNS} FROM searches WHERE id = ?", (search_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            unread = self._conn.execute(
+                "SELECT COUNT(*) FROM inbox WHERE search_id = ? AND is_read = 0", (search_id,)
+            ).fetchone()[0]
+        return self._row_to_search(row, unread)
+
+    def list(self) -> List[SavedSearch]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {SEARCH_COLUMNS} FROM searches ORDER BY id").fetchall()
+            unread = dict(self._conn.execute(
+                "SELECT search_id, COUNT(*) FROM inbox WHERE is_read = 0 GROUP BY search_id"
+            ).fetchall())
+        return [self._row_to_search(row, unread.get(row[0], 0)) for row in rows]
+
+    def delete(self, search_id: int) -> bool:
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute("DELETE FROM searches WHERE id = ?", (search_id,))
+                self._conn.execute("DELETE FROM inbox WHERE search_id = ?", (search_id,))
+            self._matrix = None
+        return cursor.rowcount > 0
+
+    def stale(self, model: str) -> List[SavedSearch]:
+        """Поиски, сохранённые с другой моделью эмбеддингов"""
+        return [s for s in self.list() if s.model != model]
+
+    def update_vector(self, search_id: int, model: str, vector: List[float]):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE searches SET model = ?, vector = ? WHERE id = ?",
+                    (model, normalize(vector).tobytes(), search_id)
+                )
+            self._matrix = None
+
+    def inbox(
+        self,
+        search_id: int,
+        unread_only: bool = False,
+        offset: int = 0,
+        limit: int = 50
+    ) -> List[Tuple[str, float, datetime, bool]]:
+        """Совпадения поиска, новые сверху: (point_id, score, matched_at, is_read)"""
+        where = "WHERE search_id = ?" + (" AND is_read = 0" if unread_only else "")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT point_id, score, matched_at, is_read FROM inbox {where} "
+                "ORDER BY matched_at DESC, score DESC LIMIT ? OFFSET ?",
+                (search_id, limit, offset)
+            ).fetchall()
+        return [
+            (point_id, score, datetime.fromisoformat(matched_at), bool(is_read))
+            for point_id, score, matched_at, is_read in rows
+        ]
+
+    def mark_read(self, search_id: int) -> int:
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "UPDATE inbox SET is_read = 1 WHERE search_id = ? AND is_read = 0", (search_id,)
+                )
+        return cursor.rowcount
+
+    def _searches(self, model: str) -> Tuple[np.ndarray, List[dict]]:
+        """Матрица векторов поисков текущей модели (под блокировкой)"""
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._matrix is None or self._matrix[0] != model or data_version != self._data_version:
+            rows = self._conn.execute(
+                "SELECT id, sources, min_score, min_text_length, vector FROM searches WHERE model = ?",
+                (model,)
+            ).fetchall()
+            searches = [
+                {
+                    "id": search_id,
+                    "sources": set(json.loads(sources)),
+                    "min_score": min_score,
+                    "min_text_length": min_text_length
+                }
+                for search_id, sources, min_score, min_text_length, _ in rows
+            ]
+            vectors = [np.frombuffer(row[4], dtype=np.float32) for row in rows]
+            matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+            self._matrix = (model, matrix, searches)
+            self._data_version = data_version
+        return self._matrix[1], self._matrix[2]
+
+    def add_matches(self, search_id: int, matches: List[Tuple[str, float]]):
+        """Положить во входящие найденное обычным поиском (при сохранении)"""
+        matched_at = datetime.utcnow().isoformat()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(UPSERT_MATCH, [
+                    (search_id, point_id, score, matched_at) for point_id, score in matches
+                ])
+
+    def match(self, points: List[PointStruct], model: str) -> int:
+        """Сопоставить новые точки со всеми поисками; число совпадений"""
+        if not points:
+            return 0
+        with self._lock:
+            matrix, searches = self._searches(model)
+            if not searches:
+                return 0
+            vectors = normalize([p.vector for p in points])
+            if vectors.shape[1] != matrix.shape[1]:
+                return 0
+
+            # Косинусная близость всех точек со всеми поисками разом
+            scores = vectors @ matrix.T
+            min_scores = np.array([s["min_score"] for s in searches], dtype=np.float32)
+            matched_at = datetime.utcnow().isoformat()
+            matches: Dict[Tuple[int, str], float] = {}
+            for point_index, search_index in zip(*np.nonzero(scores >= min_scores)):
+                payload = points[point_index].payload
+                search = searches[search_index]
+                if search["sources"] and payload["chat_id"] not in search["sources"]:
+                    continue
+                if payload["text_length"] < search["min_text_length"]:
+                    continue
+                key = (search["id"], payload["point_id"])
+                score = float(scores[point_index, search_index])
+                matches[key] = max(score, matches.get(key, score))
+
+            with self._conn:
+                self._conn.executemany(UPSERT_MATCH, [
+                    (search_id, point_id, score, matched_at)
+                    for (search_id, point_id), score in matches.items()
+                ])
+            return len(matches)
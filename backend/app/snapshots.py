@@ -0,0 +1,493 @@
+"""Резервные копии индекса: коллекции Qdrant и локальные хранилища в одном архиве.
+
+Снимок - tar.gz в snapshot_dir. Инкрементальный снимок хранит только
+изменившиеся точки и файлы относительно предыдущего и ссылается на него.
+
+    python -m app.snapshots create [--full]
+    python -m app.snapshots list
+    python -m app.snapshots restore <name>   # при остановленных API и воркере
+"""
+import os
+import io
+import json
+import shutil
+import asyncio
+import hashlib
+import sqlite3
+import tarfile
+import argparse
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from qdrant_client.http.models import (
+    VectorParams, Distance, HnswConfigDiff, PointStruct, PointIdsList, PayloadSchemaType,
+    CreateAliasOperation, CreateAlias
+)
+from app.config import get_settings
+from app.models import JobInfo, SnapshotInfo
+from app.rag_service import create_qdrant_client, get_rag_service, EMBEDDINGS_STATE_FILE
+from app.reindex import CHECKPOINT_FILE
+from app.jobs import JOBS_FILE
+from app.live import SUBSCRIPTIONS_FILE
+from app.telegram_pool import ACCOUNTS_FILE
+from app.cli import STATE_FILE as CLI_STATE_FILE
+
+
+# Коллекции сервиса (включая устаревшую telegram_messages, если она осталась)
+COLLECTION_PREFIX = "telegram_"
+
+# Файлы data_dir и session_dir; сессии Telegram не копируются - это ключи доступа
+DATA_FILES = (JOBS_FILE, "authors.sqlite", "saved_searches.sqlite", EMBEDDINGS_STATE_FILE,
+              CHECKPOINT_FILE, SUBSCRIPTIONS_FILE, CLI_STATE_FILE)
+SESSION_FILES = (ACCOUNTS_FILE,)
+ARCHIVE_DIR = "archive"
+
+SCROLL_BATCH_SIZE = 1000
+RESTORE_BATCH_SIZE = 256
+
+
+def _point_hash(payload: dict, vector: Optional[List[float]] = None) -> str:
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    digest = hashlib.blake2b(data, digest_size=8)
+    if vector is not None:
+        digest.update(np.asarray(vector, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def _needs_vector_hash(payload: dict) -> bool:
+    # Точка сообщения без text_hash (проиндексирована до его появления):
+    # payload не отражает текст, правку той же длины видно только по вектору
+    return "point_id" in payload and "text_hash" not in payload
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _copy_sqlite(source: str, target: str):
+    """Согласованная копия базы в WAL-режиме (с незакреплёнными страницами WAL)"""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+class SnapshotManager:
+    def __init__(self, settings, qdrant):
+        self.settings = settings
+        self.qdrant = qdrant
+        self.root = settings.snapshot_dir or os.path.join(settings.data_dir, "snapshots")
+
+    # --- файлы ---
+
+    def _local_files(self) -> Dict[str, str]:
+        """Копируемые файлы: имя в снимке -> путь"""
+        files = {}
+        for name in DATA_FILES:
+            files[f"data/{name}"] = os.path.join(self.settings.data_dir, name)
+        for name in SESSION_FILES:
+            files[f"session/{name}"] = os.path.join(self.settings.session_dir, name)
+        archive_dir = os.path.join(self.settings.data_dir, ARCHIVE_DIR)
+        if os.path.isdir(archive_dir):
+            for name in os.listdir(archive_dir):
+                if not name.endswith(("-wal", "-shm")):
+                    files[f"data/{ARCHIVE_DIR}/{name}"] = os.path.join(archive_dir, name)
+        return {key: path for key, path in files.items() if os.path.isfile(path)}
+
+    def _stage_files(self, staging: str) -> Dict[str, str]:
+        """Скопировать файлы в staging; хэши содержимого по имени в снимке"""
+        hashes = {}
+        for key, path in self._local_files().items():
+            target = os.path.join(staging, "files", key)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if path.endswith(".sqlite"):
+                _copy_sqlite(path, target)
+            else:
+                shutil.copyfile(path, target)
+            hashes[key] = _file_hash(target)
+        return hashes
+
+    def _local_path(self, key: str) -> str:
+        area, name = key.split("/", 1)
+        base = self.settings.session_dir if area == "session" else self.settings.data_dir
+        return os.path.join(base, name)
+
+    # --- список снимков ---
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, f"{name}.tar.gz")
+
+    @staticmethod
+    def _read_members(path: str, names: Tuple[str, ...], with_indexes: bool = False) -> Dict[str, bytes]:
+        """Прочитать служебные файлы из начала архива, не распаковывая данные"""
+        found = {}
+        with tarfile.open(path, "r:gz") as tar:
+            for member in tar:
+                if member.name in names or (with_indexes and member.name.startswith("index/")):
+                    found[member.name] = tar.extractfile(member).read()
+                elif member.name.startswith(("points", "files/")):
+                    break
+                if not with_indexes and len(found) == len(names):
+                    break
+        return found
+
+    def _manifest(self, name: str) -> dict:
+        return json.loads(self._read_members(self._path(name), ("manifest.json",))["manifest.json"])
+
+    def list(self) -> List[SnapshotInfo]:
+        if not os.path.isdir(self.root):
+            return []
+        snapshots = []
+        for filename in sorted(os.listdir(self.root)):
+            if not filename.endswith(".tar.gz"):
+                continue
+            manifest = self._manifest(filename[:-len(".tar.gz")])
+            snapshots.append(SnapshotInfo(
+                name=manifest["name"],
+                created_at=datetime.fromisoformat(manifest["created_at"]),
+                parent=manifest["parent"],
+                size=os.path.getsize(os.path.join(self.root, filename)),
+                points=manifest["points"],
+                files=manifest["files"]
+            ))
+        return snapshots
+
+    def _chain(self, name: str) -> List[str]:
+        """Полный снимок и инкрементальные поверх него, до name включительно"""
+        chain = [name]
+        while True:
+            parent = self._manifest(chain[0])["parent"]
+            if parent is None:
+                return chain
+            if parent in chain:
+                raise ValueError(f"Snapshot chain of {name} is cyclic")
+            chain.insert(0, parent)
+
+    # --- создание ---
+
+    async def _collections(self) -> Tuple[List[str], Dict[str, str]]:
+        names = [
+            c.name for c in (await self.qdrant.get_collections()).collections
+            if c.name.startswith(COLLECTION_PREFIX)
+        ]
+        aliases = {
+            a.alias_name: a.collection_name
+            for a in (await self.qdrant.get_aliases()).aliases
+            if a.collection_name in names
+        }
+        return sorted(names), aliases
+
+    async def _collection_config(self, name: str) -> dict:
+        info = await self.qdrant.get_collection(name)
+        vectors = info.config.params.vectors
+        return {
+            "size": vectors.size,
+            "distance": vectors.distance.value if hasattr(vectors.distance, "value") else vectors.distance,
+            "hnsw_m": info.config.hnsw_config.m,
+            "hnsw_ef_construct": info.config.hnsw_config.ef_construct,
+            "indexes": {
+                field: str(schema.data_type.value if hasattr(schema.data_type, "value") else schema.data_type)
+                for field, schema in (info.payload_schema or {}).items()
+            }
+        }
+
+    async def _stage_collection(self, name: str, previous: Dict[str, str], staging: str) -> Tuple[dict, int]:
+        """Изменившиеся с прошлого снимка точки коллекции; (index, записано точек)"""
+        index: Dict[str, str] = {}
+        changed = []
+        offset = None
+        while True:
+            points, offset = await self.qdrant.scroll(
+                collection_name=name,
+                limit=SCROLL_BATCH_SIZE,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+            legacy = [point.id for point in points if _needs_vector_hash(point.payload or {})]
+            vectors = {}
+            if legacy:
+                vectors = {
+                    record.id: record.vector
+                    for record in await self.qdrant.retrieve(
+                        collection_name=name,
+                        ids=legacy,
+                        with_payload=False,
+                        with_vectors=True
+                    )
+                }
+            for point in points:
+                key = str(point.id)
+                index[key] = _point_hash(point.payload or {}, vectors.get(point.id))
+                if previous.get(key) != index[key]:
+                    changed.append(point.id)
+            if offset is None:
+                break
+
+        # ID в индексе - строки (ключи JSON); числовые возвращаем к int
+        deleted = [int(key) if key.isdigit() else key for key in previous if key not in index]
+        directory = os.path.join(staging, "points", name)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "deleted.json"), "w") as f:
+            json.dump(deleted, f)
+
+        written = 0
+        for part, i in enumerate(range(0, len(changed), SCROLL_BATCH_SIZE)):
+            # Векторы читаются только для изменившихся точек, частями
+            records = await self.qdrant.retrieve(
+                collection_name=name,
+                ids=changed[i:i+SCROLL_BATCH_SIZE],
+                with_payload=True,
+                with_vectors=True
+            )
+            with open(os.path.join(directory, f"{part:06d}.jsonl"), "w") as f:
+                for record in records:
+                    f.write(json.dumps({"id": record.id, "payload": record.payload}, ensure_ascii=False) + "\n")
+            np.save(
+                os.path.join(directory, f"{part:06d}.npy"),
+                np.asarray([record.vector for record in records], dtype=np.float32)
+            )
+            written += len(records)
+        return index, written
+
+    async def create(self, full: bool = False, job: Optional[JobInfo] = None) -> dict:
+        """Снимок всех коллекций и файлов; инкрементальный, если есть предыдущий"""
+        job = job or JobInfo(id="", kind="snapshot", created_at=datetime.utcnow())
+        os.makedirs(self.root, exist_ok=True)
+        existing = [s.name for s in self.list()]
+        parent = None if full or not existing else existing[-1]
+        created_at = datetime.utcnow()
+        name = created_at.strftime("snapshot-%Y%m%d-%H%M%S-%f")
+
+        previous_indexes: Dict[str, Dict[str, str]] = {}
+        previous_files: Dict[str, str] = {}
+        if parent:
+            members = await asyncio.to_thread(
+                self._read_members, self._path(parent), ("files.json",), True
+            )
+            previous_files = json.loads(members.pop("files.json"))
+            for member, data in members.items():
+                if member.startswith("index/"):
+                    previous_indexes[member[len("index/"):-len("/index.json")]] = json.loads(data)
+
+        staging = os.path.join(self.root, f".{name}")
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            collections, aliases = await self._collections()
+            job.total = len(collections) + 1
+            configs, indexes = {}, {}
+            points = 0
+            # Сначала Qdrant, потом архив: в архиве есть всё, на что ссылаются векторы
+            job.stage = "collections"
+            for collection in collections:
+                configs[collection] = await self._collection_config(collection)
+                indexes[collection], written = await self._stage_collection(
+                    collection, previous_indexes.get(collection, {}), staging
+                )
+                points += written
+                job.done += 1
+
+            job.stage = "files"
+            hashes = await asyncio.to_thread(self._stage_files, staging)
+            changed_files = [key for key, digest in hashes.items() if previous_files.get(key) != digest]
+            job.done += 1
+
+            manifest = {
+                "name": name,
+                "created_at": created_at.isoformat(),
+                "parent": parent,
+                "collections": configs,
+                "aliases": aliases,
+                "points": points,
+                "files": len(changed_files)
+            }
+            job.stage = "compressing"
+            await asyncio.to_thread(
+                self._write_archive, name, staging, manifest, hashes, indexes, changed_files
+            )
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        job.stage = None
+        return {"success": True, **{k: manifest[k] for k in ("name", "parent", "points", "files")}}
+
+    def _write_archive(
+        self,
+        name: str,
+        staging: str,
+        manifest: dict,
+        hashes: Dict[str, str],
+        indexes: Dict[str, dict],
+        changed_files: List[str]
+    ):
+        def add_json(tar: tarfile.TarFile, member: str, data):
+            raw = json.dumps(data).encode("utf-8")
+            info = tarfile.TarInfo(member)
+            info.size = len(raw)
+            info.mtime = int(datetime.utcnow().timestamp())
+            tar.addfile(info, io.BytesIO(raw))
+
+        tmp_path = self._path(name) + ".tmp"
+        with tarfile.open(tmp_path, "w:gz") as tar:
+            # Служебные файлы первыми: list и следующий инкремент читают только их
+            add_json(tar, "manifest.json", manifest)
+            add_json(tar, "files.json", hashes)
+            for collection, index in indexes.items():
+                add_json(tar, f"index/{collection}/index.json", index)
+            tar.add(os.path.join(staging, "points"), "points")
+            for key in changed_files:
+                tar.add(os.path.join(staging, "files", key), f"files/{key}")
+        os.replace(tmp_path, self._path(name))
+
+    # --- восстановление ---
+
+    async def _recreate_collections(self, manifest: dict):
+        existing, _ = await self._collections()
+        for collection in existing:
+            await self.qdrant.delete_collection(collection)
+        for collection, config in manifest["collections"].items():
+            await self.qdrant.create_collection(
+                collection_name=collection,
+                vectors_config=VectorParams(size=config["size"], distance=Distance(config["distance"])),
+                hnsw_config=HnswConfigDiff(m=config["hnsw_m"], ef_construct=config["hnsw_ef_construct"])
+            )
+            for field, data_type in config["indexes"].items():
+                await self.qdrant.create_payload_index(
+                    collection_name=collection,
+                    field_name=field,
+                    field_schema=PayloadSchemaType(data_type)
+                )
+
+    async def _apply_points(self, path: str, collections: dict) -> int:
+        """Точки и удаления одного снимка цепочки, потоком по частям"""
+        tar = await asyncio.to_thread(tarfile.open, path, "r:gz")
+        members = iter(tar)
+        applied = 0
+        records: List[dict] = []
+        try:
+            while True:
+                # Распаковка gzip блокирующая, точки отправляем из цикла событий
+                member = await asyncio.to_thread(next, members, None)
+                if member is None or member.name.startswith("files/"):
+                    break
+                parts = member.name.split("/")
+                if parts[0] != "points" or len(parts) != 3 or parts[1] not in collections:
+                    continue
+                collection, filename = parts[1], parts[2]
+                data = await asyncio.to_thread(lambda: tar.extractfile(member).read())
+                if filename == "deleted.json":
+                    deleted = json.loads(data)
+                    if deleted:
+                        await self.qdrant.delete(
+                            collection_name=collection,
+                            points_selector=PointIdsList(points=deleted)
+                        )
+                elif filename.endswith(".jsonl"):
+                    records = [json.loads(line) for line in data.decode("utf-8").splitlines()]
+                elif filename.endswith(".npy"):
+                    vectors = np.load(io.BytesIO(data))
+                    points = [
+                        PointStruct(id=record["id"], vector=vector.tolist(), payload=record["payload"])
+                        for record, vector in zip(records, vectors)
+                    ]
+                    await asyncio.gather(*(
+                        self.qdrant.upsert(
+                            collection_name=collection,
+                            points=points[i:i+RESTORE_BATCH_SIZE],
+                            wait=False
+                        )
+                        for i in range(0, len(points), RESTORE_BATCH_SIZE)
+                    ))
+                    applied += len(points)
+        finally:
+            tar.close()
+        return applied
+
+    def _restore_files(self, chain: List[str], hashes: Dict[str, str]) -> int:
+        """Файлы из последнего снимка цепочки, где они менялись"""
+        for key, path in self._local_files().items():
+            if key not in hashes:
+                os.remove(path)
+        restored = set()
+        for name in reversed(chain):
+            with tarfile.open(self._path(name), "r:gz") as tar:
+                for member in tar:
+                    if not member.name.startswith("files/"):
+                        continue
+                    key = member.name[len("files/"):]
+                    if key in restored or key not in hashes:
+                        continue
+                    path = self._local_path(key)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    for suffix in ("-wal", "-shm"):
+                        if os.path.exists(path + suffix):
+                            os.remove(path + suffix)
+                    with open(path, "wb") as f:
+                        shutil.copyfileobj(tar.extractfile(member), f)
+                    restored.add(key)
+        return len(restored)
+
+    async def restore(self, name: str, job: Optional[JobInfo] = None) -> dict:
+        """Восстановить коллекции и файлы на момент снимка (процессы сервиса должны быть остановлены)"""
+        job = job or JobInfo(id="", kind="restore", created_at=datetime.utcnow())
+        chain = self._chain(name)
+        manifest = self._manifest(name)
+        job.total = len(chain) + 1
+
+        job.stage = "collections"
+        await self._recreate_collections(manifest)
+        points = 0
+        for snapshot in chain:
+            points += await self._apply_points(self._path(snapshot), manifest["collections"])
+            job.done += 1
+        await self.qdrant.update_collection_aliases(change_aliases_operations=[
+            CreateAliasOperation(create_alias=CreateAlias(collection_name=collection, alias_name=alias))
+            for alias, collection in manifest["aliases"].items()
+        ])
+
+        job.stage = "files"
+        hashes = json.loads(self._read_members(self._path(name), ("files.json",))["files.json"])
+        files = await asyncio.to_thread(self._restore_files, chain, hashes)
+        job.done += 1
+
+        job.stage = None
+        return {"success": True, "name": name, "chain": chain, "points": points, "files": files}
+
+
+@lru_cache()
+def get_snapshot_manager() -> SnapshotManager:
+    return SnapshotManager(get_settings(), get_rag_service().qdrant)
+
+
+async def _main(args: argparse.Namespace):
+    settings = get_settings()
+    manager = SnapshotManager(settings, create_qdrant_client(settings))
+    try:
+        if args.command == "create":
+            print(json.dumps(await manager.create(full=args.full)))
+        elif args.command == "restore":
+            print(json.dumps(await manager.restore(args.name)))
+        else:
+            for snapshot in manager.list():
+                print(f"{snapshot.name}\t{snapshot.parent or '-'}\t{snapshot.size}\t{snapshot.points}\t{snapshot.files}")
+    finally:
+        await manager.qdrant.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Снимки индекса")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Создать снимок (инкрементальный, если есть предыдущий)")
+    create.add_argument("--full", action="store_true", help="Полный снимок")
+    restore = commands.add_parser("restore", help="Восстановить снимок")
+    restore.add_argument("name")
+    commands.add_parser("list", help="Список снимков")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,134 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException
+from app.config import get_settings
+from app.jobs import get_job_manager
+from app.telegram_client import TelegramService
+from app.telegram_pool import get_telegram_pool
+from app.live import get_live_ingestor
+
+
+# Сколько API-процесс ждёт ответа воркера на вызов Telegram
+CALL_TIMEOUT = 60.0
+
+
+def _account(name: Optional[str]) -> TelegramService:
+    service = get_telegram_pool().get(name)
+    if service is None:
+        raise HTTPException(status_code=404, detail=f"Account {name} not found")
+    return service
+
+
+async def _ensure_authorized():
+    if not await _account(None).is_authorized():
+        raise HTTPException(status_code=401, detail="Not authorized in Telegram")
+
+
+async def is_authorized() -> bool:
+    return await _account(None).is_authorized()
+
+
+async def auth_status(account: Optional[str] = None) -> dict:
+    return await _account(account).get_auth_status()
+
+
+async def send_code(account: Optional[str] = None) -> dict:
+    return await _account(account).send_code()
+
+
+async def verify_code(code: str, account: Optional[str] = None) -> dict:
+    return await _account(account).sign_in_with_code(code)
+
+
+async def verify_2fa(password: str, account: Optional[str] = None) -> dict:
+    return await _account(account).sign_in_with_2fa(password)
+
+
+async def accounts() -> list:
+    return [a.model_dump(mode="json") for a in await get_telegram_pool().refresh()]
+
+
+async def add_account(name: str, phone: str) -> dict:
+    try:
+        account = await get_telegram_pool().add_account(name, phone)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return account.model_dump(mode="json")
+
+
+async def remove_account(name: str) -> dict:
+    if not await get_telegram_pool().remove_account(name):
+        raise HTTPException(status_code=404, detail=f"Account {name} not found")
+    return {"success": True, "name": name}
+
+
+async def dialogs(offset: int, limit: Optional[int], query: Optional[str]) -> dict:
+    await _ensure_authorized()
+    chats, total, complete = await _account(None).get_dialogs(offset, limit, query)
+    return {
+        "chats": [c.model_dump(mode="json") for c in chats],
+        "total": total,
+        "complete": complete
+    }
+
+
+async def topics(chat_id: int) -> list:
+    await _ensure_authorized()
+    return [t.model_dump(mode="json") for t in await _account(None).get_forum_topics(chat_id)]
+
+
+async def live_subscriptions() -> list:
+    return [s.model_dump(mode="json") for s in get_live_ingestor().subscriptions()]
+
+
+async def live_subscribe(chat_id: int, topic_id: Optional[int] = None) -> dict:
+    return get_live_ingestor().subscribe(chat_id, topic_id).model_dump(mode="json")
+
+
+async def live_unsubscribe(chat_id: int, topic_id: Optional[int] = None) -> dict:
+    if not get_live_ingestor().unsubscribe(chat_id, topic_id):
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    return {"success": True, "chat_id": chat_id, "topic_id": topic_id}
+
+
+CALLS: Dict[str, Callable[..., Awaitable[Any]]] = {
+    "is_authorized": is_authorized,
+    "auth_status": auth_status,
+    "send_code": send_code,
+    "verify_code": verify_code,
+    "verify_2fa": verify_2fa,
+    "accounts": accounts,
+    "add_account": add_account,
+    "remove_account": remove_account,
+    "dialogs": dialogs,
+    "topics": topics,
+    "live_subscriptions": live_subscriptions,
+    "live_subscribe": live_subscribe,
+    "live_unsubscribe": live_unsubscribe,
+}
+
+
+async def run(method: str, kwargs: dict) -> dict:
+    """Выполнить вызов в процессе с сессией Telegram (задача воркера)"""
+    try:
+        return {"value": await CALLS[method](**kwargs)}
+    except HTTPException as e:
+        return {"status_code": e.status_code, "detail": e.detail}
+
+
+async def call(method: str, **kwargs) -> Any:
+    """Вызов Telegram: на месте или через очередь воркера в роли api"""
+    if get_settings().role != "api":
+        return await CALLS[method](**kwargs)
+
+    jobs = get_job_manager()
+    job = jobs.submit("telegram", {"method": method, "kwargs": kwargs})
+    done = await jobs.wait(job.id, CALL_TIMEOUT)
+    jobs.delete(job.id)
+
+    if done is None:
+        raise HTTPException(status_code=504, detail="Telegram worker did not respond")
+    if done.status == "failed":
+        raise HTTPException(status_code=502, detail=done.error)
+    if "status_code" in done.result:
+        raise HTTPException(status_code=done.result["status_code"], detail=done.result["detail"])
+    return done.result["value"]
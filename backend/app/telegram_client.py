@@ -1,33 +1,57 @@
 import os
 import json
 import asyncio
-from typing import List, Optional, AsyncGenerator, Set
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, AsyncGenerator, Set, Tuple
 from datetime import datetime
-from telethon import TelegramClient
+from functools import lru_cache
+from telethon import TelegramClient, events, utils
 from telethon.tl.types import (
     Channel, Chat, User, 
     MessageService, Message,
     PeerChannel, PeerChat, PeerUser,
     ChannelForbidden, ChatForbidden,
     ForumTopic as TLForumTopic,
-    UserFull
+    UserFull, UpdateNewChannelMessage,
+    MessageActionTopicCreate, MessageActionTopicEdit
 )
 from telethon.tl.functions.channels import GetForumTopicsRequest
 from telethon.tl.functions.users import GetFullUserRequest
-from telethon.errors import SessionPasswordNeededError, FloodWaitError, UserPrivacyRestrictedError
+from telethon.errors import (
+    SessionPasswordNeededError, FloodWaitError, UserPrivacyRestrictedError,
+    TakeoutInitDelayError, TakeoutInvalidError, TakeoutRequiredError
+)
 from app.config import get_settings
+from app.dialog_cache import DialogCache
+from app.topic_cache import TopicCache
+from app.metrics import TELEGRAM_REQUEST_SECONDS, TELEGRAM_MESSAGES, record_cache
 from app.models import (
     ChatInfo, ChatType, ForumTopic, 
-    TelegramMessage, MessageAuthor, DownloadSettings,
-    ContactInfo
+    DownloadSettings, DownloadMode, ContactInfo
 )
+from app.records import MessageRecord
+
+
+# Сообщений в одной странице истории (один запрос GetHistory)
+HISTORY_PAGE_SIZE = 100
+
+
+class HistorySource(NamedTuple):
+    """Подписи чата и топика для скачиваемых сообщений"""
+    title: str
+    username: Optional[str]
+    topic_title: Optional[str]
 
 
 class TelegramService:
-    def __init__(self):
+    def __init__(self, name: str = "default", phone: Optional[str] = None):
         self.settings = get_settings()
+        self.name = name
+        self.phone = phone or self.settings.telegram_phone
         os.makedirs(self.settings.session_dir, exist_ok=True)
-        session_path = os.path.join(self.settings.session_dir, "telegram_session")
+        # Основной аккаунт сохраняет прежнее имя файла сессии
+        session_name = "telegram_session" if name == "default" else f"telegram_session_{name}"
+        session_path = os.path.join(self.settings.session_dir, session_name)
         
         self.client = TelegramClient(
             session_path,
@@ -37,10 +61,23 @@ class TelegramService:
         self._connected = False
         self._auth_state = "disconnected"
         self._phone_code_hash = None
+        self._me_id: Optional[int] = None
+        
+        # Кэш диалогов, между перезагрузками обновляется событиями
+        self.dialogs = DialogCache(self.settings.dialogs_cache_ttl)
+        self.client.add_event_handler(self._on_new_message, events.NewMessage())
+        self.client.add_event_handler(self._on_chat_action, events.ChatAction())
+        
+        # Каталог топиков форумов, правится по служебным сообщениям о топиках
+        self.topics = TopicCache(self.settings.topics_cache_ttl)
+        self.client.add_event_handler(self._on_channel_update, events.Raw(UpdateNewChannelMessage))
         
         # Очередь контактов для обогащения
         self._contacts_queue: Set[int] = set()
         self._enriching = False
+        
+        # Ожидание бюджета запросов аккаунта перед страницей истории (задаёт пул)
+        self.throttle: Optional[Callable[[], Awaitable[None]]] = None
 
     async def connect(self):
         if not self._connected:
@@ -64,24 +101,26 @@ class TelegramService:
             me = await self.client.get_me()
             return {
                 "is_authorized": True,
-                "phone": self.settings.telegram_phone,
+                "account": self.name,
+                "phone": self.phone,
                 "user_id": me.id,
                 "username": me.username,
                 "auth_state": "authorized"
             }
         return {
             "is_authorized": False,
-            "phone": self.settings.telegram_phone,
+            "account": self.name,
+            "phone": self.phone,
             "auth_state": self._auth_state
         }
 
     async def send_code(self) -> dict:
         await self.connect()
         try:
-            result = await self.client.send_code_request(self.settings.telegram_phone)
+            result = await self.client.send_code_request(self.phone)
             self._phone_code_hash = result.phone_code_hash
             self._auth_state = "code_sent"
-            return {"status": "code_sent", "phone": self.settings.telegram_phone}
+            return {"status": "code_sent", "phone": self.phone}
         except Exception as e:
             return {"status": "error", "error": str(e)}
 
@@ -89,7 +128,7 @@ class TelegramService:
         await self.connect()
         try:
             await self.client.sign_in(
-                self.settings.telegram_phone, 
+                self.phone, 
                 code, 
                 phone_code_hash=self._phone_code_hash
             )
@@ -133,77 +172,187 @@ class TelegramService:
             return ChatType.USER
         return ChatType.GROUP
 
-    async def get_dialogs(self) -> List[ChatInfo]:
-        await self.connect()
-        dialogs = await self.client.get_dialogs()
-        
-        chats = []
-        for dialog in dialogs:
-            entity = dialog.entity
-            
-            if isinstance(entity, (ChannelForbidden, ChatForbidden)):
-                continue
-                
-            chat_type = self._get_chat_type(entity)
-            
-            title = getattr(entity, 'title', None)
-            if not title and isinstance(entity, User):
-                title = f"{entity.first_name or ''} {entity.last_name or ''}".strip()
-                if not title:
-                    title = entity.username or f"User {entity.id}"
-            
-            is_forum = False
-            if isinstance(entity, Channel):
-                is_forum = getattr(entity, 'forum', False)
+    def _entity_to_chat_info(self, entity, unread_count: int = 0) -> Optional[ChatInfo]:
+        if isinstance(entity, (ChannelForbidden, ChatForbidden)):
+            return None
             
-            chat_info = ChatInfo(
-                id=entity.id,
-                title=title or "Unknown",
-                type=chat_type,
-                username=getattr(entity, 'username', None),
-                members_count=getattr(entity, 'participants_count', None),
-                is_forum=is_forum,
-                unread_count=dialog.unread_count
-            )
-            chats.append(chat_info)
+        chat_type = self._get_chat_type(entity)
+        
+        title = getattr(entity, 'title', None)
+        if not title and isinstance(entity, User):
+            title = f"{entity.first_name or ''} {entity.last_name or ''}".strip()
+            if not title:
+                title = entity.username or f"User {entity.id}"
+        
+        is_forum = False
+        if isinstance(entity, Channel):
+            is_forum = getattr(entity, 'forum', False)
         
-        return chats
+        return ChatInfo(
+            id=entity.id,
+            title=title or "Unknown",
+            type=chat_type,
+            username=getattr(entity, 'username', None),
+            members_count=getattr(entity, 'participants_count', None),
+            is_forum=is_forum,
+            unread_count=unread_count
+        )
 
-    async def get_forum_topics(self, chat_id: int) -> List[ForumTopic]:
+    async def _load_dialogs(self):
+        """Все диалоги аккаунта потоком, по мере получения страниц"""
+        async for dialog in self.client.iter_dialogs():
+            chat_info = self._entity_to_chat_info(dialog.entity, dialog.unread_count)
+            if chat_info:
+                last_date = dialog.date.timestamp() if dialog.date else 0.0
+                yield chat_info, last_date
+
+    async def get_dialogs(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        query: Optional[str] = None
+    ) -> Tuple[List[ChatInfo], int, bool]:
+        """Страница диалогов из кэша: (чаты, всего найдено, загружен ли список целиком).
+
+        На холодном кэше ждём только нужную страницу, остальное догружается в фоне.
+        """
         await self.connect()
-        entity = await self.client.get_entity(chat_id)
-        
-        if not isinstance(entity, Channel) or not getattr(entity, 'forum', False):
-            return []
+        min_count = offset + limit if limit is not None and not query else None
+        record_cache("dialogs", self.dialogs.is_fresh)
+        await self.dialogs.ensure(self._load_dialogs, min_count)
+        chats, total = self.dialogs.page(offset, limit, query)
+        return chats, total, self.dialogs.is_complete
+
+    async def _get_me_id(self) -> int:
+        if self._me_id is None:
+            me = await self.client.get_me(input_peer=True)
+            self._me_id = me.user_id
+        return self._me_id
+
+    async def _on_new_message(self, event):
+        """Поднять чат наверх и увеличить непрочитанные"""
+        chat_id, _ = utils.resolve_id(event.chat_id)
+        last_date = event.message.date.timestamp()
+        incoming = not event.message.out
         
-        topics = []
+        if await self.dialogs.touch(chat_id, last_date, incoming):
+            return
+        if not self.dialogs.is_complete:
+            return
+        # Новый для кэша чат
         try:
-            result = await self.client(GetForumTopicsRequest(
-                channel=entity,
-                offset_date=None,
-                offset_id=0,
-                offset_topic=0,
-                limit=100
-            ))
+            chat_info = self._entity_to_chat_info(await event.get_chat(), int(incoming))
+            if chat_info:
+                await self.dialogs.upsert(chat_info, last_date)
+        except Exception as e:
+            print(f"Error adding dialog {chat_id}: {e}")
+
+    async def _on_chat_action(self, event):
+        """Переименования, вступление и выход из чатов"""
+        chat_id, _ = utils.resolve_id(event.chat_id)
+        
+        if event.new_title and chat_id in self.dialogs:
+            self.dialogs.get(chat_id).title = event.new_title
+            await self.dialogs.upsert(self.dialogs.get(chat_id))
+            return
+        
+        if not (event.user_left or event.user_kicked or event.user_joined or event.user_added):
+            return
+        if await self._get_me_id() not in event.user_ids:
+            return
+        
+        if event.user_left or event.user_kicked:
+            await self.dialogs.remove(chat_id)
+        else:
+            chat_info = self._entity_to_chat_info(await event.get_chat())
+            if chat_info:
+                await self.dialogs.upsert(chat_info, event.action_message.date.timestamp()
+                                          if event.action_message else None)
+
+    async def _fetch_forum_topics(self, entity) -> Dict[int, ForumTopic]:
+        """Все топики форума, страницами по 100"""
+        topics: Dict[int, ForumTopic] = {}
+        offset_date, offset_id, offset_topic = None, 0, 0
+        
+        while True:
+            with TELEGRAM_REQUEST_SECONDS.labels("get_forum_topics").time():
+                result = await self.client(GetForumTopicsRequest(
+                    channel=entity,
+                    offset_date=offset_date,
+                    offset_id=offset_id,
+                    offset_topic=offset_topic,
+                    limit=100
+                ))
+            if not result.topics:
+                break
             
             for topic in result.topics:
                 if isinstance(topic, TLForumTopic):
-                    topics.append(ForumTopic(
+                    topics[topic.id] = ForumTopic(
                         id=topic.id,
                         title=topic.title,
                         icon_color=topic.icon_color,
                         icon_emoji_id=str(topic.icon_emoji_id) if topic.icon_emoji_id else None
-                    ))
+                    )
+            
+            if len(topics) >= result.count or len(result.topics) < 100:
+                break
+            
+            # Следующая страница начинается после последнего топика
+            last = result.topics[-1]
+            messages = {m.id: m for m in result.messages}
+            top_message = messages.get(getattr(last, 'top_message', 0))
+            offset_date = top_message.date if top_message else None
+            offset_id = getattr(last, 'top_message', 0)
+            offset_topic = last.id
+        
+        return topics
+
+    async def _get_topics_map(self, chat_id: int, entity=None) -> Dict[int, ForumTopic]:
+        if entity is None:
+            entity = await self.client.get_entity(chat_id)
+        
+        if not isinstance(entity, Channel) or not getattr(entity, 'forum', False):
+            return {}
+        
+        return await self.topics.get(chat_id, lambda: self._fetch_forum_topics(entity))
+
+    async def get_forum_topics(self, chat_id: int) -> List[ForumTopic]:
+        await self.connect()
+        try:
+            return list((await self._get_topics_map(chat_id)).values())
         except Exception as e:
             print(f"Error getting forum topics: {e}")
+            return []
+
+    async def _on_channel_update(self, update):
+        """Создание и переименование топиков без перезагрузки каталога"""
+        message = update.message
+        if not isinstance(message, MessageService):
+            return
+        action = message.action
+        chat_id = message.peer_id.channel_id
         
-        return topics
+        if isinstance(action, MessageActionTopicCreate):
+            self.topics.put(chat_id, ForumTopic(
+                id=message.id,
+                title=action.title,
+                icon_color=action.icon_color,
+                icon_emoji_id=str(action.icon_emoji_id) if action.icon_emoji_id else None
+            ))
+        elif isinstance(action, MessageActionTopicEdit) and action.title:
+            topic_id = None
+            if message.reply_to:
+                topic_id = message.reply_to.reply_to_top_id or message.reply_to.reply_to_msg_id
+            if topic_id is None or not self.topics.rename(chat_id, topic_id, action.title):
+                self.topics.invalidate(chat_id)
 
     async def get_user_full_info(self, user_id: int) -> Optional[ContactInfo]:
         """Получить полную информацию о пользователе"""
         await self.connect()
         try:
-            full: UserFull = await self.client(GetFullUserRequest(user_id))
+            with TELEGRAM_REQUEST_SECONDS.labels("get_full_user").time():
+                full: UserFull = await self.client(GetFullUserRequest(user_id))
             user = full.users[0] if full.users else None
             
             if not user:
@@ -255,8 +404,14 @@ class TelegramService:
 
     async def get_messages(
         self, 
-        settings: DownloadSettings
-    ) -> AsyncGenerator[TelegramMessage, None]:
+        settings: DownloadSettings,
+        on_fallback: Optional[Callable[[str], None]] = None
+    ) -> AsyncGenerator[MessageRecord, None]:
+        """Сообщения чата; в режиме backfill - вся история через takeout.
+
+        Если takeout не дали (или он оборвался), история дочитывается
+        обычными запросами, а причина передаётся в on_fallback.
+        """
         await self.connect()
         entity = await self.client.get_entity(settings.chat_id)
         chat_title = getattr(entity, 'title', str(settings.chat_id))
@@ -264,11 +419,11 @@ class TelegramService:
         
         topic_title = None
         if settings.topic_id:
-            topics = await self.get_forum_topics(settings.chat_id)
-            for t in topics:
-                if t.id == settings.topic_id:
-                    topic_title = t.title
-                    break
+            try:
+                topic = (await self._get_topics_map(settings.chat_id, entity)).get(settings.topic_id)
+                topic_title = topic.title if topic else None
+            except Exception as e:
+                print(f"Error getting forum topics: {e}")
         
         kwargs = {
             'entity': entity,
@@ -289,34 +444,107 @@ class TelegramService:
         if settings.topic_id:
             kwargs['reply_to'] = settings.topic_id
         
-        async for message in self.client.iter_messages(**kwargs):
+        chat = HistorySource(chat_title, chat_username, topic_title)
+        
+        if settings.mode != DownloadMode.BACKFILL:
+            async for message in self._iter_history(self.client, kwargs, settings, chat):
+                yield message
+            return
+        
+        # Вся история: лимит и страница не нужны, паузы между запросами - тоже
+        kwargs.pop('add_offset', None)
+        kwargs['limit'] = None
+        last_id = None
+        reason = None
+        try:
+            async with AsyncExitStack() as stack:
+                try:
+                    takeout = await stack.enter_async_context(self.client.takeout(
+                        users=True, chats=True, megagroups=True, channels=True
+                    ))
+                except ValueError as e:
+                    # На сессии уже открыт другой takeout; прочие ValueError при
+                    # чтении истории - обычные ошибки, а не отказ в takeout
+                    reason = str(e)
+                else:
+                    async for message in self._iter_history(
+                        takeout, dict(kwargs, wait_time=0), settings, chat
+                    ):
+                        last_id = message.id
+                        yield message
+            if reason is None:
+                return
+        except (TakeoutInitDelayError, TakeoutInvalidError, TakeoutRequiredError) as e:
+            reason = str(e)
+        
+        print(f"Takeout unavailable, falling back to regular history: {reason}")
+        if on_fallback:
+            on_fallback(reason)
+        if last_id is not None:
+            # История идёт от новых к старым - продолжаем с места обрыва
+            kwargs['offset_id'] = last_id
+        async for message in self._iter_history(self.client, kwargs, settings, chat):
+            yield message
+
+    async def _iter_history(
+        self,
+        client: TelegramClient,
+        kwargs: dict,
+        settings: DownloadSettings,
+        chat: HistorySource
+    ) -> AsyncGenerator[MessageRecord, None]:
+        history = client.iter_messages(**kwargs)
+        read = 0
+        while True:
+            if self.throttle and read % HISTORY_PAGE_SIZE == 0:
+                # Следующее сообщение начинает новую страницу - это запрос к Telegram
+                await self.throttle()
+            # Время ожидания каждого сообщения: на границах страниц это запрос к Telegram
+            with TELEGRAM_REQUEST_SECONDS.labels("iter_messages").time():
+                try:
+                    message = await history.__anext__()
+                except StopAsyncIteration:
+                    break
+            read += 1
+            TELEGRAM_MESSAGES.inc()
+            
             if isinstance(message, MessageService):
                 continue
             if not message.text:
                 continue
-                
-            sender = await message.get_sender()
-            author = MessageAuthor(
-                id=sender.id if sender else 0,
-                username=getattr(sender, 'username', None),
-                first_name=getattr(sender, 'first_name', None),
-                last_name=getattr(sender, 'last_name', None)
-            )
             
-            yield TelegramMessage(
-                id=message.id,
-                chat_id=settings.chat_id,
-                chat_title=chat_title,
-                chat_username=chat_username,
-                topic_id=settings.topic_id,
-                topic_title=topic_title,
-                author=author,
-                text=message.text,
-                date=message.date,
-                reply_to_msg_id=message.reply_to.reply_to_msg_id if message.reply_to else None,
-                views=message.views,
-                forwards=message.forwards
-            )
+            yield await self.to_record(message, settings.chat_id, settings.topic_id, chat)
+
+    async def to_record(
+        self,
+        message: Message,
+        chat_id: int,
+        topic_id: Optional[int],
+        chat: HistorySource
+    ) -> MessageRecord:
+        with TELEGRAM_REQUEST_SECONDS.labels("get_sender").time():
+            sender = await message.get_sender()
+        
+        return MessageRecord(
+            id=message.id,
+            chat_id=chat_id,
+            chat_title=chat.title,
+            author_id=sender.id if sender else 0,
+            text=message.text,
+            date=message.date,
+            chat_username=chat.username,
+            topic_id=topic_id,
+            topic_title=chat.topic_title,
+            author_username=getattr(sender, 'username', None),
+            author_first_name=getattr(sender, 'first_name', None),
+            author_last_name=getattr(sender, 'last_name', None),
+            reply_to_msg_id=message.reply_to.reply_to_msg_id if message.reply_to else None,
+            views=message.views,
+            forwards=message.forwards,
+            author_is_bot=getattr(sender, 'bot', None)
+        )
 
 
-telegram_service = TelegramService()
+@lru_cache()
+def get_telegram_service() -> TelegramService:
+    return TelegramService()
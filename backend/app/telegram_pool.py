@@ -0,0 +1,287 @@
+import os
+import re
+import json
+import time
+import fcntl
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from telethon.errors import FloodWaitError
+from app.config import get_settings
+from app.telegram_client import TelegramService, get_telegram_service
+from app.models import AccountInfo, ContactInfo
+from app.metrics import TELEGRAM_FLOOD_WAIT_SECONDS
+from app.locks import LockBusy
+
+
+ACCOUNTS_FILE = "accounts.json"
+# Сессии Telegram - у одного процесса: воркер или app.cli sync/backfill
+SESSION_LOCK_FILE = "session.lock"
+ACCOUNT_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# Сколько помнить, видит ли аккаунт чат
+VISIBILITY_TTL = 3600
+
+
+class RateBudget:
+    """Не чаще rate запросов в секунду на аккаунт"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    def ready_in(self) -> float:
+        return max(0.0, self._next - time.monotonic())
+
+    async def acquire(self):
+        # Слот резервируется сразу, до ожидания - параллельные вызовы
+        # видят уже занятый бюджет и уходят на другие аккаунты
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Account:
+    """Аккаунт пула: сессия, бюджет запросов и состояние"""
+
+    def __init__(self, service: TelegramService, rate: float):
+        self.service = service
+        self.budget = RateBudget(rate)
+        self.flood_until = 0.0
+        self.active_downloads = 0
+        self.requests = 0
+        self.errors = 0
+        self.authorized = False
+        # chat_id -> (видит ли, когда проверено)
+        self.visibility: Dict[int, tuple] = {}
+        # Страницы истории при скачивании тоже расходуют бюджет
+        service.throttle = self.throttle
+
+    async def throttle(self):
+        await self.budget.acquire()
+        self.requests += 1
+
+    @property
+    def name(self) -> str:
+        return self.service.name
+
+    @property
+    def healthy(self) -> bool:
+        return self.authorized and time.time() >= self.flood_until
+
+    def flood(self, seconds: int):
+        self.flood_until = time.time() + seconds
+        TELEGRAM_FLOOD_WAIT_SECONDS.labels(self.name).inc(seconds)
+
+    def info(self) -> AccountInfo:
+        return AccountInfo(
+            name=self.name,
+            phone=self.service.phone,
+            is_authorized=self.authorized,
+            healthy=self.healthy,
+            flood_until=datetime.utcfromtimestamp(self.flood_until)
+            if self.flood_until > time.time() else None,
+            active_downloads=self.active_downloads,
+            requests=self.requests,
+            errors=self.errors
+        )
+
+
+class NoAccountAvailable(Exception):
+    """Нет авторизованного аккаунта без flood wait, который видит чат"""
+
+
+class TelegramPool:
+    """Пул авторизованных аккаунтов Telegram.
+
+    Скачивание и обогащение распределяются между аккаунтами с учётом
+    бюджета запросов, flood wait и того, какие чаты видит аккаунт.
+    Основной аккаунт - телефон из настроек.
+    """
+
+    def __init__(self, default: TelegramService):
+        self.settings = get_settings()
+        self.accounts_path = os.path.join(self.settings.session_dir, ACCOUNTS_FILE)
+        self._accounts: Dict[str, Account] = {}
+        self._session_lock = None
+        # Вызываются для каждого аккаунта, в том числе добавленного позже
+        self._account_listeners: List[Callable[[TelegramService], None]] = []
+        self._add(default)
+        for name, phone in self._load_accounts().items():
+            self._add(TelegramService(name, phone))
+
+    def _load_accounts(self) -> Dict[str, str]:
+        if not os.path.exists(self.accounts_path):
+            return {}
+        with open(self.accounts_path) as f:
+            return json.load(f)
+
+    def _save_accounts(self):
+        extra = {
+            name: account.service.phone
+            for name, account in self._accounts.items()
+            if name != "default"
+        }
+        tmp_path = self.accounts_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(extra, f)
+        os.replace(tmp_path, self.accounts_path)
+
+    def _add(self, service: TelegramService) -> Account:
+        account = Account(service, self.settings.telegram_account_rps)
+        self._accounts[service.name] = account
+        for listener in self._account_listeners:
+            listener(service)
+        return account
+
+    def on_account(self, listener: Callable[[TelegramService], None]):
+        """Подписаться на аккаунты пула (текущие и будущие)"""
+        self._account_listeners.append(listener)
+        for account in self._accounts.values():
+            listener(account.service)
+
+    def get(self, name: Optional[str] = None) -> Optional[TelegramService]:
+        account = self._accounts.get(name or "default")
+        return account.service if account else None
+
+    async def add_account(self, name: str, phone: str) -> AccountInfo:
+        """Добавить аккаунт; авторизация - через /auth с ?account=name"""
+        if not ACCOUNT_NAME_RE.match(name):
+            raise ValueError("Account name may contain only letters, digits, '_' and '-'")
+        if name in self._accounts:
+            raise ValueError(f"Account {name} already exists")
+        account = self._add(TelegramService(name, phone))
+        self._save_accounts()
+        return account.info()
+
+    async def remove_account(self, name: str) -> bool:
+        if name == "default" or name not in self._accounts:
+            return False
+        account = self._accounts.pop(name)
+        await account.service.disconnect()
+        self._save_accounts()
+        return True
+
+    def _lock_sessions(self):
+        """Два клиента на одной сессии ломают друг другу соединение и файл сессии"""
+        if self._session_lock is not None:
+            return
+        os.makedirs(self.settings.session_dir, exist_ok=True)
+        lock = open(os.path.join(self.settings.session_dir, SESSION_LOCK_FILE), "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            raise LockBusy("Telegram session is in use by another process (worker or app.cli)")
+        self._session_lock = lock
+
+    async def connect(self):
+        self._lock_sessions()
+        for account in self._accounts.values():
+            try:
+                await account.service.connect()
+                account.authorized = await account.service.is_authorized()
+            except Exception as e:
+                print(f"Error connecting account {account.name}: {e}")
+
+    async def disconnect(self):
+        for account in self._accounts.values():
+            await account.service.disconnect()
+        if self._session_lock is not None:
+            self._session_lock.close()
+            self._session_lock = None
+
+    async def refresh(self) -> List[AccountInfo]:
+        """Состояние аккаунтов (с перепроверкой авторизации)"""
+        for account in self._accounts.values():
+            try:
+                account.authorized = await account.service.is_authorized()
+            except Exception as e:
+                print(f"Error checking account {account.name}: {e}")
+                account.authorized = False
+        return [account.info() for account in self._accounts.values()]
+
+    async def _can_see(self, account: Account, chat_id: int) -> bool:
+        cached = account.visibility.get(chat_id)
+        if cached and time.monotonic() - cached[1] < VISIBILITY_TTL:
+            return cached[0]
+
+        if chat_id in account.service.dialogs:
+            visible = True
+        else:
+            try:
+                await account.service.client.get_entity(chat_id)
+                visible = True
+            except ValueError:
+                visible = False
+        account.visibility[chat_id] = (visible, time.monotonic())
+        return visible
+
+    async def _candidates(self, chat_id: Optional[int] = None) -> List[Account]:
+        # Авторизация могла пройти после старта - перепроверяем неавторизованные
+        for account in self._accounts.values():
+            if not account.authorized:
+                account.authorized = await account.service.is_authorized()
+
+        candidates = []
+        for account in self._accounts.values():
+            if not account.healthy:
+                continue
+            if chat_id is not None and not await self._can_see(account, chat_id):
+                continue
+            candidates.append(account)
+        return candidates
+
+    @asynccontextmanager
+    async def lease(self, chat_id: int) -> AsyncIterator[TelegramService]:
+        """Аккаунт для скачивания чата: видит чат и наименее загружен"""
+        candidates = [
+            a for a in await self._candidates(chat_id)
+            if a.active_downloads < self.settings.telegram_account_downloads
+        ] or await self._candidates(chat_id)
+        if not candidates:
+            raise NoAccountAvailable(f"No healthy account can access chat {chat_id}")
+
+        account = min(candidates, key=lambda a: (a.active_downloads, a.budget.ready_in()))
+        account.active_downloads += 1
+        try:
+            yield account.service
+        except FloodWaitError as e:
+            account.flood(e.seconds)
+            account.errors += 1
+            raise
+        finally:
+            account.active_downloads -= 1
+
+    async def get_user_full_info(self, user_id: int) -> Optional[ContactInfo]:
+        """Профиль пользователя через аккаунт с ближайшим свободным бюджетом.
+
+        При flood wait аккаунт выводится из ротации и запрос повторяется
+        на следующем; если живых аккаунтов не осталось - FloodWaitError.
+        """
+        last_error: Optional[Exception] = None
+        while True:
+            candidates = await self._candidates()
+            if not candidates:
+                raise last_error or NoAccountAvailable("No healthy Telegram account")
+
+            account = min(candidates, key=lambda a: a.budget.ready_in())
+            await account.throttle()
+            try:
+                return await account.service.get_user_full_info(user_id)
+            except FloodWaitError as e:
+                account.flood(e.seconds)
+                account.errors += 1
+                last_error = e
+
+    def healthy_count(self) -> int:
+        return sum(1 for account in self._accounts.values() if account.healthy)
+
+
+@lru_cache()
+def get_telegram_pool() -> TelegramPool:
+    return TelegramPool(get_telegram_service())
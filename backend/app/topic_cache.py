@@ -0,0 +1,53 @@
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict
+from app.models import ForumTopic
+from app.metrics import record_cache
+
+
+class TopicCache:
+    """Каталог топиков форумов по чатам с TTL и точечными обновлениями"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._topics: Dict[int, Dict[int, ForumTopic]] = {}
+        self._loaded_at: Dict[int, float] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def _is_fresh(self, chat_id: int) -> bool:
+        loaded_at = self._loaded_at.get(chat_id)
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl
+
+    async def get(
+        self,
+        chat_id: int,
+        loader: Callable[[], Awaitable[Dict[int, ForumTopic]]]
+    ) -> Dict[int, ForumTopic]:
+        """Топики чата (id -> топик); параллельные запросы делят одну загрузку"""
+        fresh = self._is_fresh(chat_id)
+        record_cache("topics", fresh)
+        if fresh:
+            return self._topics[chat_id]
+
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            if not self._is_fresh(chat_id):
+                self._topics[chat_id] = await loader()
+                self._loaded_at[chat_id] = time.monotonic()
+        return self._topics[chat_id]
+
+    def put(self, chat_id: int, topic: ForumTopic):
+        """Добавить/обновить топик по событию, если каталог чата уже загружен"""
+        topics = self._topics.get(chat_id)
+        if topics is not None:
+            topics[topic.id] = topic
+
+    def rename(self, chat_id: int, topic_id: int, title: str) -> bool:
+        topic = self._topics.get(chat_id, {}).get(topic_id)
+        if topic is None:
+            return False
+        topic.title = title
+        return True
+
+    def invalidate(self, chat_id: int):
+        self._loaded_at.pop(chat_id, None)
@@ -0,0 +1,172 @@
+"""Процесс ингеста: владеет сессией Telegram и выполняет задачи из очереди.
+
+Запуск отдельно от API: python -m app.worker (ROLE=worker).
+В роли all тот же цикл работает внутри API-процесса.
+"""
+import time
+import asyncio
+import signal
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Set
+from prometheus_client import start_http_server
+from app.config import get_settings
+from app.jobs import get_job_manager
+from app.models import JobInfo, DownloadSettings, ReindexRequest
+from app.metrics import QUEUE_DEPTH
+from app.rag_service import get_rag_service
+from app.reindex import get_reindexer
+from app.snapshots import get_snapshot_manager
+from app.telegram_pool import get_telegram_pool
+from app.ingest import download_events
+from app.live import get_live_ingestor
+from app import telegram_calls
+
+
+# Как часто сохранять прогресс выполняемых задач
+PROGRESS_INTERVAL = 0.5
+
+# Пауза между опросами пустой очереди
+IDLE_INTERVAL = 0.05
+
+
+async def run_delete_source(job: JobInfo, payload: dict) -> dict:
+    return await get_rag_service().delete_source(payload["chat_id"], payload.get("topic_id"), job)
+
+
+async def run_reindex(job: JobInfo, payload: dict) -> dict:
+    return await get_reindexer().run(ReindexRequest(**payload), job)
+
+
+async def run_snapshot(job: JobInfo, payload: dict) -> dict:
+    return await get_snapshot_manager().create(payload.get("full", False), job)
+
+
+async def run_download(job: JobInfo, payload: dict) -> dict:
+    """Скачивание с событиями прогресса в очереди (их читает API-процесс)"""
+    jobs = get_job_manager()
+    last = {}
+    emitted_at = 0.0
+    async for event in download_events(DownloadSettings(**payload)):
+        last = event
+        if event["type"] == "progress":
+            job.done = event["downloaded"]
+            # Прогресс приходит на каждое сообщение - пишем не чаще PROGRESS_INTERVAL
+            if time.monotonic() - emitted_at < PROGRESS_INTERVAL:
+                continue
+            emitted_at = time.monotonic()
+        jobs.emit(job.id, event)
+    return last
+
+
+async def run_telegram_call(job: JobInfo, payload: dict) -> dict:
+    return await telegram_calls.run(payload["method"], payload.get("kwargs", {}))
+
+
+HANDLERS: Dict[str, Callable[[JobInfo, dict], Awaitable[dict]]] = {
+    "delete_source": run_delete_source,
+    "reindex": run_reindex,
+    "snapshot": run_snapshot,
+    "download": run_download,
+    "telegram": run_telegram_call,
+}
+
+
+class Worker:
+    """Цикл выполнения задач из очереди с ограничением параллельности.
+
+    Короткие вызовы Telegram в лимит не входят, чтобы долгие загрузки
+    не блокировали авторизацию и список чатов.
+    """
+
+    def __init__(self, concurrency: int):
+        self.jobs = get_job_manager()
+        self.concurrency = concurrency
+        self._running: Dict[str, JobInfo] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def _execute(self, job: JobInfo, payload: dict):
+        QUEUE_DEPTH.labels("jobs_running").inc()
+        try:
+            job.result = await HANDLERS[job.kind](job, payload)
+            job.status = "completed"
+        except Exception as e:
+            print(f"Job {job.kind} {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            # Отменённая задача остаётся running и вернётся в очередь при старте
+            if job.status in ("completed", "failed"):
+                job.finished_at = datetime.utcnow()
+            QUEUE_DEPTH.labels("jobs_running").dec()
+            self._running.pop(job.id, None)
+            self.jobs.finish(job)
+
+    async def _flush_progress(self):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            for job in list(self._running.values()):
+                self.jobs.update(job)
+
+    async def run(self):
+        requeued = self.jobs.requeue_running()
+        if requeued:
+            print(f"Requeued {requeued} interrupted jobs")
+
+        flusher = asyncio.create_task(self._flush_progress())
+        try:
+            while True:
+                busy = sum(1 for j in self._running.values() if j.kind != "telegram")
+                claimed = self.jobs.claim(None if busy < self.concurrency else "telegram")
+                if claimed is None:
+                    await asyncio.sleep(IDLE_INTERVAL)
+                    continue
+
+                job, payload = claimed
+                if job.kind not in HANDLERS:
+                    job.status = "failed"
+                    job.error = f"Unknown job kind: {job.kind}"
+                    job.finished_at = datetime.utcnow()
+                    self.jobs.finish(job)
+                    continue
+
+                self._running[job.id] = job
+                task = asyncio.create_task(self._execute(job, payload))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        finally:
+            flusher.cancel()
+            for task in list(self._tasks):
+                task.cancel()
+            # Прерванные задачи остаются running и вернутся в очередь при старте
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def main():
+    settings = get_settings()
+    start_http_server(settings.worker_metrics_port)
+
+    rag_service = get_rag_service()
+    telegram_pool = get_telegram_pool()
+    await rag_service.init()
+    await telegram_pool.connect()
+    live = get_live_ingestor()
+    live.attach_pool(telegram_pool)
+    # Разовый перенос сообщений из Qdrant в локальный архив
+    await rag_service.import_legacy_messages()
+
+    worker = asyncio.create_task(Worker(settings.worker_concurrency).run())
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await stop.wait()
+    worker.cancel()
+    await asyncio.gather(worker, return_exceptions=True)
+    await live.close()
+    await telegram_pool.disconnect()
+    await rag_service.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1 @@
+# Offline benchmarks for ingest and search
@@ -0,0 +1,171 @@
+"""Офлайн-бенчмарк ингеста и поиска.
+
+Запуск из backend/:
+
+    python -m bench --sizes 1000,5000,20000 --output bench_report.json
+
+Telegram заменяется синтетическим клиентом, OpenAI - локальным сервером
+с настраиваемой задержкой, Qdrant работает в локальном режиме.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import platform
+import contextlib
+import subprocess
+import tempfile
+from datetime import datetime
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,5000",
+                        help="Размеры корпуса (сообщений) для замеров поиска, через запятую")
+    parser.add_argument("--chat-size", type=int, default=1000, help="Сообщений в одном чате")
+    parser.add_argument("--queries", type=int, default=50, help="Поисковых запросов на замер")
+    parser.add_argument("--search-concurrency", type=int, default=1)
+    parser.add_argument("--enrich", type=int, default=200, help="Сколько авторов обогащать")
+    parser.add_argument("--authors", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--openai-latency", type=float, default=0.05,
+                        help="Задержка запроса эмбеддингов, с")
+    parser.add_argument("--openai-chat-latency", type=float, default=0.3,
+                        help="Задержка расширения запроса, с")
+    parser.add_argument("--telegram-latency", type=float, default=0.0,
+                        help="Задержка страницы истории Telegram, с")
+    parser.add_argument("--telegram-request-latency", type=float, default=0.0,
+                        help="Задержка прочих запросов к Telegram, с")
+    parser.add_argument("--qdrant", default=":memory:",
+                        help="Локальный Qdrant: ':memory:' или путь к каталогу")
+    parser.add_argument("--output", help="Файл для JSON-отчёта (по умолчанию stdout)")
+    return parser.parse_args()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def configure_environment(args, workdir: str, openai_url: str):
+    """Настройки приложения до импорта app.* (сервисы создаются при импорте)"""
+    os.environ.update({
+        "TELEGRAM_API_ID": "1",
+        "TELEGRAM_API_HASH": "bench",
+        "TELEGRAM_PHONE": "+10000000000",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": openai_url,
+        "QDRANT_LOCATION": args.qdrant,
+        "DATA_DIR": os.path.join(workdir, "data"),
+        "SESSION_DIR": os.path.join(workdir, "session"),
+    })
+
+
+async def run(args, fake_openai) -> dict:
+    from bench import scenarios
+    from bench.corpus import SyntheticCorpus
+    from bench.fake_telegram import FakeTelegramClient
+    from app.telegram_client import get_telegram_service
+    from app.rag_service import get_rag_service
+
+    telegram_service = get_telegram_service()
+    rag_service = get_rag_service()
+
+    await rag_service.init()
+    corpus = SyntheticCorpus(seed=args.seed, authors=args.authors)
+    telegram_service.client = FakeTelegramClient(
+        corpus,
+        history_latency=args.telegram_latency,
+        request_latency=args.telegram_request_latency
+    )
+
+    report = {"ingest": [], "search": [], "enrichment": None, "export": None}
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+    chat_ids = []
+    corpus_size = 0
+
+    for size in sizes:
+        # Догружаем корпус до нужного размера
+        new_chats = []
+        while corpus_size < size:
+            chat_size = min(args.chat_size, size - corpus_size)
+            chat = corpus.make_chat(1000 + len(chat_ids), chat_size)
+            chat_ids.append(chat.id)
+            new_chats.append(chat.id)
+            corpus_size += chat_size
+
+        ingest = await scenarios.ingest(telegram_service, rag_service, new_chats)
+        ingest["corpus_size"] = corpus_size
+        report["ingest"].append(ingest)
+        print(f"ingest -> {corpus_size}: {ingest['messages_per_second']:.0f} msg/s", file=sys.stderr)
+
+        for expand_query in (False, True):
+            result = await scenarios.search(
+                rag_service, corpus, chat_ids, args.queries,
+                args.search_concurrency, expand_query
+            )
+            result["corpus_size"] = corpus_size
+            report["search"].append(result)
+            print(
+                f"search @ {corpus_size} (expand={expand_query}): "
+                f"p50 {result['latency']['p50'] * 1000:.1f} ms, "
+                f"p99 {result['latency']['p99'] * 1000:.1f} ms",
+                file=sys.stderr
+            )
+
+    author_ids = [a.id for a in corpus.authors[:args.enrich]]
+    report["enrichment"] = await scenarios.enrich_contacts(telegram_service, rag_service, author_ids)
+    print(f"enrichment: {report['enrichment']['contacts_per_second']:.1f} contacts/s", file=sys.stderr)
+
+    report["export"] = await scenarios.export(rag_service)
+    print(f"export: {report['export']['messages_per_second']:.0f} msg/s", file=sys.stderr)
+
+    report["openai_requests"] = dict(fake_openai.requests)
+    await rag_service.close()
+    return report
+
+
+def main():
+    args = parse_args()
+
+    from bench.fake_openai import FakeOpenAI
+    fake_openai = FakeOpenAI(
+        latency=args.openai_latency,
+        chat_latency=args.openai_chat_latency
+    )
+    openai_url = fake_openai.start()
+
+    with tempfile.TemporaryDirectory(prefix="tg-leadgen-bench-") as workdir:
+        configure_environment(args, workdir, openai_url)
+        try:
+            # stdout остаётся под отчёт, отладочные print() сервисов - в stderr
+            with contextlib.redirect_stdout(sys.stderr):
+                results = asyncio.run(run(args, fake_openai))
+        finally:
+            fake_openai.stop()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "params": vars(args)
+        },
+        **results
+    }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
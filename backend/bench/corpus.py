@@ -0,0 +1,131 @@
+import random
+from itertools import accumulate
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+
+# Темы лидген-чатов: ключевые слова, из которых собираются сообщения
+TOPICS = {
+    "dev": ["ищу разработчика", "нужен бэкенд", "python", "django", "fastapi", "react",
+            "фронтенд", "верстка", "лендинг", "бот для telegram", "парсер", "api"],
+    "design": ["нужен дизайнер", "логотип", "фирменный стиль", "figma", "баннеры",
+               "презентация", "ui/ux", "макет сайта", "иллюстрации"],
+    "marketing": ["таргетолог", "реклама в инстаграм", "smm", "продвижение", "лиды",
+                  "контекстная реклама", "директ", "seo", "воронка продаж"],
+    "realty": ["сниму квартиру", "аренда", "студия", "посуточно", "ипотека",
+               "риелтор", "новостройка", "без комиссии"],
+    "jobs": ["вакансия", "удаленка", "оплата сдельная", "опыт от года", "резюме",
+             "собеседование", "полная занятость", "стажировка"],
+}
+FILLER = ["привет", "всем", "подскажите", "срочно", "кто может", "бюджет обсуждаем",
+          "пишите в лс", "есть примеры работ", "сроки горят", "договоримся",
+          "спасибо", "актуально", "в личку", "кидайте портфолио", "по цене сориентирую"]
+SHORT_REPLIES = ["+", "спасибо", "актуально?", "в лс", "да", "ок", "написал", "👍"]
+FIRST_NAMES = ["Иван", "Анна", "Павел", "Мария", "Олег", "Елена", "Денис", "Ольга", "Артём", "Юлия"]
+LAST_NAMES = ["Смирнов", "Иванова", "Кузнецов", "Попова", "Соколов", "Лебедева", "Козлов", "Новикова"]
+
+
+@dataclass
+class Author:
+    id: int
+    username: Optional[str]
+    first_name: str
+    last_name: Optional[str]
+    bio: Optional[str]
+    weight: float
+
+
+@dataclass
+class Message:
+    id: int
+    author: Author
+    text: str
+    date: datetime
+    reply_to_msg_id: Optional[int] = None
+    views: Optional[int] = None
+    forwards: Optional[int] = None
+
+
+@dataclass
+class Chat:
+    id: int
+    title: str
+    username: Optional[str]
+    topic: str
+    messages: List[Message] = field(default_factory=list)
+
+
+class SyntheticCorpus:
+    """Детерминированный набор чатов с авторами, ветками ответов и текстами"""
+
+    def __init__(self, seed: int = 42, authors: int = 2000):
+        self.random = random.Random(seed)
+        self.authors = [self._make_author(i) for i in range(authors)]
+        # Активность авторов по Ципфу: немногие пишут большую часть сообщений
+        self._cum_weights = list(accumulate(a.weight for a in self.authors))
+        self.chats: Dict[int, Chat] = {}
+
+    def _make_author(self, index: int) -> Author:
+        first = self.random.choice(FIRST_NAMES)
+        last = self.random.choice(LAST_NAMES) if self.random.random() < 0.7 else None
+        username = f"user{index}_{first.lower()}" if self.random.random() < 0.8 else None
+        bio = None
+        if self.random.random() < 0.4:
+            topic = self.random.choice(list(TOPICS))
+            bio = " ".join(self.random.sample(TOPICS[topic], 3))
+        return Author(
+            id=10_000_000 + index,
+            username=username,
+            first_name=first,
+            last_name=last,
+            bio=bio,
+            weight=1.0 / (index + 1)
+        )
+
+    def _make_text(self, topic: str) -> str:
+        if self.random.random() < 0.2:
+            return self.random.choice(SHORT_REPLIES)
+        words = self.random.sample(TOPICS[topic], self.random.randint(2, 5))
+        words += self.random.sample(FILLER, self.random.randint(2, 6))
+        self.random.shuffle(words)
+        text = " ".join(words).capitalize()
+        # Иногда длинные посты-объявления
+        if self.random.random() < 0.05:
+            text = ". ".join([text] * self.random.randint(5, 30))
+        return text
+
+    def make_chat(self, chat_id: int, size: int) -> Chat:
+        topic = self.random.choice(list(TOPICS))
+        chat = Chat(
+            id=chat_id,
+            title=f"{topic.capitalize()} chat {chat_id}",
+            username=f"{topic}_chat_{chat_id}" if self.random.random() < 0.5 else None,
+            topic=topic
+        )
+        date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for message_id in range(1, size + 1):
+            date += timedelta(seconds=self.random.randint(10, 3600))
+            reply_to = None
+            if chat.messages and self.random.random() < 0.3:
+                # Отвечают в основном на недавние сообщения
+                reply_to = chat.messages[-self.random.randint(1, min(20, len(chat.messages)))].id
+            author = self.random.choices(self.authors, cum_weights=self._cum_weights)[0]
+            chat.messages.append(Message(
+                id=message_id,
+                author=author,
+                text=self._make_text(topic),
+                date=date,
+                reply_to_msg_id=reply_to,
+                views=self.random.randint(10, 5000) if self.random.random() < 0.5 else None,
+                forwards=self.random.randint(0, 50) if self.random.random() < 0.2 else None
+            ))
+        self.chats[chat_id] = chat
+        return chat
+
+    def queries(self, count: int) -> List[str]:
+        result = []
+        for _ in range(count):
+            topic = self.random.choice(list(TOPICS))
+            result.append(" ".join(self.random.sample(TOPICS[topic], 2)))
+        return result
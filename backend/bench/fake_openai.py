@@ -0,0 +1,101 @@
+import socket
+import asyncio
+import hashlib
+import threading
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+
+
+class FakeOpenAI:
+    """Локальная замена OpenAI: эмбеддинги и chat completions с задержкой.
+
+    Эмбеддинг - нормированная сумма псевдослучайных векторов слов, поэтому
+    тексты с общими словами близки и поиск по ним осмысленный.
+    """
+
+    def __init__(
+        self,
+        dim: int = 1536,
+        latency: float = 0.05,
+        per_text_latency: float = 0.0005,
+        chat_latency: float = 0.3
+    ):
+        self.dim = dim
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.chat_latency = chat_latency
+        self.requests = {"embeddings": 0, "chat": 0}
+        self._word_vectors = {}
+        self._server = None
+        self._thread = None
+        self.port = None
+        self.app = self._build_app()
+
+    def _word_vector(self, word: str, dim: int) -> np.ndarray:
+        key = (word, dim)
+        vector = self._word_vectors.get(key)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=4).digest(), "big")
+            vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+            self._word_vectors[key] = vector
+        return vector
+
+    def embed(self, text: str, dim: int) -> list:
+        vector = np.zeros(dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector += self._word_vector(word, dim)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/v1/embeddings")
+        async def embeddings(request: Request):
+            body = await request.json()
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            dim = body.get("dimensions") or self.dim
+            self.requests["embeddings"] += 1
+            await asyncio.sleep(self.latency + self.per_text_latency * len(texts))
+            return {
+                "data": [
+                    {"index": i, "embedding": self.embed(text, dim)}
+                    for i, text in enumerate(texts)
+                ],
+                # Грубая оценка токенов, реальный API считает точно
+                "usage": {"total_tokens": sum(len(t) // 3 + 1 for t in texts)}
+            }
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            body = await request.json()
+            self.requests["chat"] += 1
+            await asyncio.sleep(self.chat_latency)
+            query = body["messages"][-1]["content"]
+            return {
+                "choices": [{"message": {"content": f"{query} заказ услуги исполнитель"}}]
+            }
+
+        return app
+
+    def start(self) -> str:
+        """Запустить сервер в отдельном потоке; возвращает base_url"""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            threading.Event().wait(0.01)
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def stop(self):
+        if self._server:
+            self._server.should_exit = True
+            self._thread.join()
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Optional
+from telethon.tl.functions.users import GetFullUserRequest
+from bench.corpus import SyntheticCorpus, Message
+
+
+class FakeMessage:
+    """Минимальная замена telethon Message для TelegramService.get_messages"""
+
+    def __init__(self, message: Message, client: "FakeTelegramClient"):
+        self.id = message.id
+        self.text = message.text
+        self.date = message.date
+        self.views = message.views
+        self.forwards = message.forwards
+        self.reply_to = (
+            SimpleNamespace(reply_to_msg_id=message.reply_to_msg_id)
+            if message.reply_to_msg_id else None
+        )
+        self._author = message.author
+        self._client = client
+
+    async def get_sender(self):
+        return await self._client._user(self._author.id)
+
+
+class FakeTelegramClient:
+    """Подменяет TelegramClient: синтетические чаты и задержки сети.
+
+    history_latency - задержка на каждую страницу истории (100 сообщений),
+    request_latency - на прочие запросы (отправитель вне кэша, GetFullUser).
+    """
+
+    PAGE_SIZE = 100
+
+    def __init__(
+        self,
+        corpus: SyntheticCorpus,
+        history_latency: float = 0.0,
+        request_latency: float = 0.0
+    ):
+        self.corpus = corpus
+        self.history_latency = history_latency
+        self.request_latency = request_latency
+        self._authors = {a.id: a for a in corpus.authors}
+        self._seen_users = set()
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    async def get_entity(self, chat_id: int):
+        chat = self.corpus.chats[chat_id]
+        return SimpleNamespace(id=chat.id, title=chat.title, username=chat.username)
+
+    async def _user(self, user_id: int):
+        # Как в Telethon: первый раз отправитель не в кэше сущностей
+        if user_id not in self._seen_users:
+            self._seen_users.add(user_id)
+            if self.request_latency:
+                await asyncio.sleep(self.request_latency)
+        author = self._authors[user_id]
+        return SimpleNamespace(
+            id=author.id,
+            username=author.username,
+            first_name=author.first_name,
+            last_name=author.last_name,
+            phone=None,
+            photo=None
+        )
+
+    async def iter_messages(
+        self,
+        entity,
+        limit: Optional[int] = None,
+        offset_id: int = 0,
+        add_offset: int = 0,
+        min_id: int = 0,
+        max_id: int = 0,
+        reply_to: Optional[int] = None,
+        **kwargs
+    ):
+        # Как Telegram: от новых к старым, страницами
+        messages = self.corpus.chats[entity.id].messages[::-1]
+        messages = [
+            m for m in messages
+            if (not offset_id or m.id < offset_id)
+            and m.id > min_id
+            and (not max_id or m.id < max_id)
+        ][add_offset:]
+        if limit is not None:
+            messages = messages[:limit]
+
+        for i, message in enumerate(messages):
+            if i % self.PAGE_SIZE == 0 and self.history_latency:
+                await asyncio.sleep(self.history_latency)
+            yield FakeMessage(message, self)
+
+    async def __call__(self, request):
+        if not isinstance(request, GetFullUserRequest):
+            raise NotImplementedError(type(request).__name__)
+        if self.request_latency:
+            await asyncio.sleep(self.request_latency)
+
+        author = self._authors[request.id]
+        user = await self._user(author.id)
+        return SimpleNamespace(
+            users=[user],
+            chats=[],
+            full_user=SimpleNamespace(
+                about=author.bio,
+                birthday=None,
+                personal_channel_id=None,
+                common_chats_count=1
+            )
+        )
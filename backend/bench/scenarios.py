@@ -0,0 +1,124 @@
+import time
+import asyncio
+from typing import Dict, List
+from bench.corpus import SyntheticCorpus
+
+
+# Размер батча индексации как в /api/messages/download
+DOWNLOAD_BATCH_SIZE = 50
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1]
+    }
+
+
+async def ingest(telegram_service, rag_service, chat_ids: List[int]) -> Dict:
+    """Скачивание и индексация тем же путём, что и /api/messages/download"""
+    from app.models import DownloadSettings
+
+    downloaded = 0
+    indexed = 0
+    started = time.perf_counter()
+    for chat_id in chat_ids:
+        chat = telegram_service.client.corpus.chats[chat_id]
+        settings = DownloadSettings(chat_id=chat_id, limit=len(chat.messages))
+        batch = []
+        async for message in telegram_service.get_messages(settings):
+            batch.append(message)
+            downloaded += 1
+            if len(batch) >= DOWNLOAD_BATCH_SIZE:
+                indexed += await rag_service.index_messages_batch(batch)
+                batch = []
+        if batch:
+            indexed += await rag_service.index_messages_batch(batch)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "chats": len(chat_ids),
+        "downloaded": downloaded,
+        "indexed": indexed,
+        "seconds": elapsed,
+        "messages_per_second": downloaded / elapsed if elapsed else 0.0
+    }
+
+
+async def search(
+    rag_service,
+    corpus: SyntheticCorpus,
+    chat_ids: List[int],
+    queries: int,
+    concurrency: int,
+    expand_query: bool
+) -> Dict:
+    """Латентность поиска по всем загруженным чатам"""
+    samples: List[float] = []
+    found: List[int] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(query: str):
+        async with semaphore:
+            started = time.perf_counter()
+            results = await rag_service.search(
+                query=query,
+                chat_ids=chat_ids,
+                top_k=10,
+                expand_query=expand_query
+            )
+            samples.append(time.perf_counter() - started)
+            found.append(len(results))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(q) for q in corpus.queries(queries)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "expand_query": expand_query,
+        "concurrency": concurrency,
+        "latency": percentiles(samples),
+        "queries_per_second": len(samples) / elapsed if elapsed else 0.0,
+        "mean_results": sum(found) / len(found) if found else 0.0
+    }
+
+
+async def enrich_contacts(telegram_service, rag_service, author_ids: List[int]) -> Dict:
+    """Обогащение контактов как в enrich_contacts_background, без паузы 1 с"""
+    new_ids = rag_service.get_new_contact_ids(author_ids)
+    added = 0
+    started = time.perf_counter()
+    for user_id in new_ids:
+        contact = await telegram_service.get_user_full_info(user_id)
+        if contact and await rag_service.add_contact(contact):
+            added += 1
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requested": len(new_ids),
+        "added": added,
+        "seconds": elapsed,
+        "contacts_per_second": added / elapsed if elapsed else 0.0
+    }
+
+
+async def export(rag_service) -> Dict:
+    started = time.perf_counter()
+    messages = await asyncio.to_thread(rag_service.get_all_messages)
+    elapsed = time.perf_counter() - started
+    return {
+        "messages": len(messages),
+        "seconds": elapsed,
+        "messages_per_second": len(messages) / elapsed if elapsed else 0.0
+    }
@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+from app.admission import AdmissionLimit, Rejected
+
+
+def test_zero_queue_is_unbounded():
+    async def scenario():
+        limit = AdmissionLimit("test_unbounded", concurrency=1, queue=0, timeout=1.0)
+        await limit.acquire()
+        waiters = [asyncio.create_task(limit.acquire()) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert not any(w.done() for w in waiters)
+
+        for waiter in waiters:
+            limit.release()
+            await waiter
+        limit.release()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects():
+    async def scenario():
+        limit = AdmissionLimit("test_bounded", concurrency=1, queue=1, timeout=1.0)
+        await limit.acquire()
+        waiter = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as e:
+            await limit.acquire()
+        assert e.value.reason == "queue_full"
+
+        limit.release()
+        await waiter
+        limit.release()
+
+    asyncio.run(scenario())
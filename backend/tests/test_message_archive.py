@@ -0,0 +1,100 @@
+import sqlite3
+from datetime import datetime, timezone
+from typing import Optional
+from app.message_archive import MessageArchive
+from app.records import MessageRecord
+
+
+def make_record(message_id: int, text: str, topic_id: Optional[int] = None) -> MessageRecord:
+    return MessageRecord(
+        id=message_id,
+        chat_id=100,
+        topic_id=topic_id,
+        chat_title="chat",
+        author_id=1,
+        text=text,
+        date=datetime(2024, 1, 1, tzinfo=timezone.utc)
+    )
+
+
+def test_deleted_partition_is_reopened_by_other_connection(tmp_path):
+    # Два экземпляра на одном каталоге - как API и воркер в разных процессах
+    writer = MessageArchive(str(tmp_path))
+    reader = MessageArchive(str(tmp_path))
+    old = [make_record(i, f"old {i}") for i in range(1, 4)]
+    writer.append(old)
+    assert set(reader.get_many([r.point_id for r in old])) == {r.point_id for r in old}
+
+    writer.delete(100)
+    assert reader.get_many([r.point_id for r in old]) == {}
+    assert reader.count(100) == 0
+
+    new = [make_record(i, f"new {i}") for i in range(2, 6)]
+    writer.append(new)
+    found = reader.get_many([r.point_id for r in new])
+    assert {point_id: m["text"] for point_id, m in found.items()} == {r.point_id: r.text for r in new}
+    assert reader.count(100) == len(new)
+
+
+def test_topic_delete_keeps_partition(tmp_path):
+    archive = MessageArchive(str(tmp_path))
+    records = [make_record(1, "in topic", topic_id=7)] + [make_record(i, f"text {i}") for i in range(2, 4)]
+    archive.append(records)
+
+    assert archive.delete(100, topic_id=7) == 1
+    assert archive.count(100) == 2
+    assert archive.chat_ids() == [100]
+
+
+def test_author_is_bot_is_archived(tmp_path):
+    archive = MessageArchive(str(tmp_path))
+    bot = make_record(1, "from bot")
+    bot.author_is_bot = True
+    human = make_record(2, "from human")
+    human.author_is_bot = False
+    archive.append([bot, human, make_record(3, "unknown")])
+    # Повторная загрузка без флага его не стирает
+    archive.append([make_record(1, "from bot")])
+
+    (_, records), = archive.iter_records(100)
+    assert [r.author_is_bot for r in records] == [True, False, None]
+
+
+def test_old_partition_gets_author_is_bot_column(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "100.sqlite"))
+    conn.executescript(
+        "CREATE TABLE messages (point_id TEXT PRIMARY KEY, message_id INTEGER NOT NULL, "
+        "chat_id INTEGER NOT NULL, chat_title TEXT, chat_username TEXT, topic_id INTEGER, "
+        "topic_title TEXT, author_id INTEGER NOT NULL, author_username TEXT, "
+        "author_first_name TEXT, author_last_name TEXT, text TEXT NOT NULL, date TEXT NOT NULL, "
+        "reply_to_msg_id INTEGER, views INTEGER, forwards INTEGER);"
+        "INSERT INTO messages VALUES ('100_1', 1, 100, 'chat', NULL, NULL, NULL, 1, 'abbot', "
+        "NULL, NULL, 'old', '2024-01-01T00:00:00+00:00', NULL, NULL, NULL);"
+    )
+    conn.close()
+
+    (_, records), = MessageArchive(str(tmp_path)).iter_records(100)
+    assert records[0].author_username == "abbot"
+    assert records[0].author_is_bot is None
+
+
+def test_unindexed_marks_survive_until_cleared(tmp_path):
+    archive = MessageArchive(str(tmp_path))
+    records = [make_record(i, f"text {i}", topic_id=5 if i % 2 else None) for i in range(1, 6)]
+    archive.append(records)
+    archive.mark_unindexed([r.point_id for r in records])
+
+    # Отметки видны и другому экземпляру (другому процессу)
+    other = MessageArchive(str(tmp_path))
+    assert {r.point_id for r in other.unindexed(100)} == {r.point_id for r in records}
+    assert len(other.unindexed(2)) == 2
+
+    # Отметки удалённого топика пропадают вместе с сообщениями
+    archive.delete(100, topic_id=5)
+    left = [r.point_id for r in records if r.topic_id is None]
+    assert sorted(r.point_id for r in archive.unindexed(100)) == sorted(left)
+
+    archive.clear_unindexed(left[:1])
+    assert [r.point_id for r in archive.unindexed(100)] == left[1:]
+    archive.clear_unindexed()
+    assert archive.unindexed(100) == []
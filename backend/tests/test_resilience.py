@@ -0,0 +1,36 @@
+import asyncio
+import httpx
+import pytest
+from app.resilience import CircuitBreaker, CircuitOpen, ResilientEndpoint
+
+
+def test_cancelled_trial_does_not_keep_circuit_open():
+    async def scenario():
+        started = asyncio.Event()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/slow":
+                started.set()
+                await asyncio.sleep(10)
+            return httpx.Response(503 if request.url.path == "/fail" else 200)
+
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=0.05)
+        endpoint = ResilientEndpoint("test", 1, 0, 0.01, 0.01, breaker)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://api") as http:
+            with pytest.raises(httpx.HTTPStatusError):
+                await endpoint.post(http, "/fail")
+            with pytest.raises(CircuitOpen):
+                await endpoint.post(http, "/ok")
+
+            await asyncio.sleep(0.06)
+            trial = asyncio.create_task(endpoint.post(http, "/slow"))
+            await started.wait()
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+
+            response = await endpoint.post(http, "/ok")
+            assert response.status_code == 200
+            assert not breaker.is_open
+
+    asyncio.run(scenario())
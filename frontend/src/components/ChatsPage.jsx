@@ -71,10 +71,17 @@ function ChatsPage() {
 
     try {
       setLoading(true)
+      // Сначала первая страница, чтобы сразу показать список
+      const firstRes = await fetch(`${API_URL}/api/chats/?limit=50`)
+      if (!firstRes.ok) throw new Error('Ошибка загрузки чатов')
+      const firstPage = await firstRes.json()
+      setChats(firstPage)
+      setLoading(false)
+
       const res = await fetch(`${API_URL}/api/chats/`)
       if (!res.ok) throw new Error('Ошибка загрузки чатов')
       const data = await res.json()
-      
+
       // Сохраняем в кэш
       chatsCache = data
       chatsCacheTime = Date.now()
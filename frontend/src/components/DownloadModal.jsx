@@ -11,6 +11,7 @@ function DownloadModal({ chat, topic, onClose }) {
   const [showAdvanced, setShowAdvanced] = useState(false)
   const [minId, setMinId] = useState(0)
   const [maxId, setMaxId] = useState(0)
+  const [backfill, setBackfill] = useState(false)
   
   const [downloading, setDownloading] = useState(false)
   const [progress, setProgress] = useState([])
@@ -41,7 +42,8 @@ function DownloadModal({ chat, topic, onClose }) {
           limit,
           page,
           min_id: minId,
-          max_id: maxId
+          max_id: maxId,
+          mode: backfill ? 'backfill' : 'normal'
         })
       })
 
@@ -71,6 +73,11 @@ function DownloadModal({ chat, topic, onClose }) {
                 type: 'index',
                 text: `✅ Проиндексировано: ${data.count} сообщений`
               }])
+            } else if (data.type === 'backfill_fallback') {
+              setProgress(prev => [...prev, {
+                type: 'download',
+                text: `⚠️ Takeout недоступен, качаем обычным способом: ${data.reason}`
+              }])
             } else if (data.type === 'complete') {
               setStatus('complete')
               setProgress(prev => [...prev, {
@@ -134,7 +141,7 @@ function DownloadModal({ chat, topic, onClose }) {
               onChange={(e) => setLimit(parseInt(e.target.value) || 100)}
               min={1}
               max={10000}
-              disabled={downloading}
+              disabled={downloading || backfill}
               className="w-full px-4 py-2 bg-telegram-bg rounded-xl focus:outline-none focus:ring-2 focus:ring-telegram-blue disabled:opacity-50"
             />
           </div>
@@ -149,7 +156,7 @@ function DownloadModal({ chat, topic, onClose }) {
               value={page}
               onChange={(e) => setPage(parseInt(e.target.value) || 1)}
               min={1}
-              disabled={downloading}
+              disabled={downloading || backfill}
               className="w-full px-4 py-2 bg-telegram-bg rounded-xl focus:outline-none focus:ring-2 focus:ring-telegram-blue disabled:opacity-50"
             />
           </div>
@@ -167,6 +174,15 @@ function DownloadModal({ chat, topic, onClose }) {
           {/* Advanced settings */}
           {showAdvanced && (
             <div className="space-y-4 p-4 bg-telegram-bg rounded-xl">
+              <label className="flex items-center gap-2 text-sm">
+                <input
+                  type="checkbox"
+                  checked={backfill}
+                  onChange={(e) => setBackfill(e.target.checked)}
+                  disabled={downloading}
+                />
+                Вся история через takeout (для первой загрузки больших чатов)
+              </label>
               <div>
                 <label className="block text-sm text-telegram-textSecondary mb-2">
                   Минимальный ID сообщения
@@ -89,13 +89,25 @@ function RAGPage() {
       
       const res = await fetch(url, { method: 'DELETE' })
       const data = await res.json()
-      
-      if (data.success) {
-        loadSources()
-        loadStats()
-      } else {
+
+      if (!data.success) {
         alert('Ошибка удаления: ' + data.error)
+        return
+      }
+
+      // Удаление идёт в фоне - ждём завершения задачи
+      let job = null
+      do {
+        await new Promise(resolve => setTimeout(resolve, 1000))
+        const jobRes = await fetch(`${API_URL}/api/rag/jobs/${data.job_id}`)
+        job = await jobRes.json()
+      } while (job.status === 'pending' || job.status === 'running')
+
+      if (job.status === 'failed') {
+        alert('Ошибка удаления: ' + job.error)
       }
+      loadSources()
+      loadStats()
     } catch (err) {
       alert('Ошибка: ' + err.message)
     } finally {
@@ -116,7 +128,7 @@ function RAGPage() {
     setLoading(true)
 
     try {
-      const res = await fetch(`${API_URL}/api/rag/search?min_text_length=50&expand_query=true`, {
+      const res = await fetch(`${API_URL}/api/rag/search?min_text_length=50&expand_query=true&with_context=true&context_size=2`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -411,6 +423,7 @@ function RAGPage() {
 function MessageResult({ result, copyToClipboard, onContactClick }) {
   const [copied, setCopied] = useState(false)
   const [expanded, setExpanded] = useState(false)
+  const [showContext, setShowContext] = useState(false)
 
   const handleCopy = async () => {
     const data = {
@@ -444,13 +457,14 @@ function MessageResult({ result, copyToClipboard, onContactClick }) {
     return gradients[Math.abs(id) % gradients.length]
   }
 
-  const getAuthorName = () => {
-    const { author } = result.message
+  const formatAuthor = (author) => {
     if (author.username) return `@${author.username}`
     if (author.first_name) return `${author.first_name} ${author.last_name || ''}`.trim()
     return `User ${author.id}`
   }
 
+  const getAuthorName = () => formatAuthor(result.message.author)
+
   const getTelegramLink = () => {
     const { chat_id, chat_username, id } = result.message
     if (chat_username) {
@@ -505,6 +519,17 @@ function MessageResult({ result, copyToClipboard, onContactClick }) {
         </div>
       </div>
 
+      {/* Reply thread */}
+      {result.parents?.length > 0 && (
+        <div className="mb-2 pl-2 border-l-2 border-gray-600 text-xs text-telegram-textSecondary space-y-1">
+          {result.parents.map(parent => (
+            <p key={parent.id} className="line-clamp-2">
+              <span className="text-telegram-accent">{formatAuthor(parent.author)}:</span> {parent.text}
+            </p>
+          ))}
+        </div>
+      )}
+
       {/* Message text */}
       <div className="mb-2">
         <p className={`whitespace-pre-wrap ${!expanded && result.message.text.length > 300 ? 'line-clamp-4' : ''}`}>
@@ -520,6 +545,27 @@ function MessageResult({ result, copyToClipboard, onContactClick }) {
         )}
       </div>
 
+      {/* Neighbouring messages */}
+      {result.context?.length > 0 && (
+        <div className="mb-2 text-xs">
+          <button
+            onClick={() => setShowContext(!showContext)}
+            className="text-telegram-accent hover:underline"
+          >
+            {showContext ? 'Скрыть контекст' : `Контекст (${result.context.length})`}
+          </button>
+          {showContext && (
+            <div className="mt-1 space-y-1 text-telegram-textSecondary">
+              {result.context.map(message => (
+                <p key={message.id} className="line-clamp-2">
+                  <span className="text-telegram-accent">{formatAuthor(message.author)}:</span> {message.text}
+                </p>
+              ))}
+            </div>
+          )}
+        </div>
+      )}
+
       {/* Footer with links and actions */}
       <div className="flex items-center justify-between pt-2 border-t border-gray-700 text-xs flex-wrap gap-2">
         <div className="flex items-center gap-3 text-telegram-textSecondary">